@@ -1,11 +1,17 @@
 from flask import Flask
 from routes import bp
+from db_connection import initialize_connection_pool
 import os
 
 def create_app():
     app = Flask(__name__)
     app.config['SECRET_KEY'] = os.getenv('SECRET_KEY')
     app.register_blueprint(bp)
+    # each gunicorn worker opens its minimum connections before taking traffic
+    try:
+        initialize_connection_pool(warm=True)
+    except Exception as e:
+        print(f"Error warming connection pool: {e}")
     return app
 
 if __name__ == "__main__":
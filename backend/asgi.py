@@ -0,0 +1,59 @@
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.middleware.sessions import SessionMiddleware
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+from routes import session_store, fuzzy_cache, team_resolver, answer_cache, answer_cache_key
+from async_pipeline import run_query_async, get_async_pool, close_async_pool
+from sql_templates import season_tables_ready
+from user_session import UserSession
+from contextlib import asynccontextmanager
+import asyncio
+import uuid
+import os
+
+# Async execution mode: serves /api/query from a single event loop
+#   uvicorn asgi:app --host 0.0.0.0 --port $PORT
+
+async def query(request):
+    body = await request.json()
+    session_id = request.session.get('session_id')
+    # sqlite/redis stores do blocking I/O, so they run in a thread
+    user_session = await asyncio.to_thread(session_store.get, session_id) if session_id else None
+    if user_session is None:
+        session_id = str(uuid.uuid4())
+        request.session['session_id'] = session_id
+        user_session = UserSession()
+    result = await run_query_async(body['query'], user_session, fuzzy_cache, team_resolver, answer_cache, answer_cache_key)
+    await asyncio.to_thread(session_store.put, session_id, user_session)
+    return JSONResponse(result)
+
+async def health(request):
+    return JSONResponse({"status": "OK"})
+
+@asynccontextmanager
+async def lifespan(app):
+    # warm the pool before the first request instead of during it
+    try:
+        await get_async_pool()
+    except Exception as e:
+        print(f"Error warming connection pool: {e}")
+    # the teams table and the season-table check use the sync pool; keep them off the event loop
+    await asyncio.to_thread(team_resolver.ensure_loaded)
+    await asyncio.to_thread(season_tables_ready)
+    yield
+    await close_async_pool()
+
+# session cookies are signed with this; a default key would let anyone forge them
+SECRET_KEY = os.getenv('SECRET_KEY')
+if not SECRET_KEY:
+    raise RuntimeError("SECRET_KEY must be set in env")
+
+app = Starlette(
+    routes=[Route('/api/query', query, methods=['POST']),
+            Route('/api/health', health, methods=['GET'])],
+    middleware=[Middleware(CORSMiddleware, allow_origins=["*"], allow_methods=["*"], allow_headers=["*"]),
+                Middleware(SessionMiddleware, secret_key=SECRET_KEY)],
+    lifespan=lifespan
+)
@@ -0,0 +1,225 @@
+import asyncio
+import os
+from openai import AsyncOpenAI
+from psycopg_pool import AsyncConnectionPool
+from psycopg.conninfo import make_conninfo
+from db_connection import connection_params, result_cache, row_size
+from db_connection import POOL_MAX_AGE, POOL_IDLE_TIMEOUT
+from db_connection import FETCH_MAX_ROWS, FETCH_MAX_BYTES, FETCH_BATCH_SIZE, STATEMENT_TIMEOUT_MS
+from db_connection import GUARD_MAX_COST, GUARD_MAX_ROWS
+from fuzzy_cache import NAME_PATTERN
+from sql_tools import canonicalize_sql, bound_query, parse_plan, judge_plan
+from sql_templates import get_template_sql
+from openai_response import (build_breakdown_messages, build_sql_messages, parse_sql_response,
+                             build_response_messages, build_error_messages, format_table_data,
+                             build_fused_messages, parse_fused_response, apply_name_corrections,
+                             get_query_type, record_usage, FUSED_SQL_MODE, FUSED_RESPONSE_FORMAT)
+
+# Async counterparts of the request pipeline: one event loop keeps hundreds of
+# chats in flight while they wait on OpenAI, instead of one thread per request.
+
+_async_openai_client = None
+_async_pool = None
+_async_pool_lock = asyncio.Lock()
+
+def get_async_openai_client():
+    global _async_openai_client
+    if _async_openai_client is None:
+        _async_openai_client = AsyncOpenAI(api_key=os.getenv('OPENAI_API_KEY'))
+    return _async_openai_client
+
+async def call_openai_async(model, messages, max_tokens = 1000, temperature = 0.1, top_p = 0.95, retries=3, backoff=2, **kwargs):
+    client = get_async_openai_client()
+    last_error = None
+
+    for attempt in range(retries):
+        try:
+            return await client.chat.completions.create(
+                model=model,
+                messages=messages,
+                max_tokens=max_tokens,
+                temperature=temperature,
+                top_p=top_p,
+                **kwargs
+            )
+        except Exception as e:
+            last_error = e
+            if attempt < retries - 1:
+                await asyncio.sleep(backoff ** attempt)
+
+    raise last_error
+
+async def get_async_pool(min_conn=2, max_conn=int(os.getenv('ASYNC_POOL_MAX', 20))):
+    global _async_pool
+    async with _async_pool_lock:
+        if _async_pool is None:
+            # prepare_threshold=None: the Supabase pooler runs in transaction mode
+            # and can't keep server-side prepared statements. check pings a
+            # connection before handing it out; lifetime/idle limits match the sync pool
+            _async_pool = AsyncConnectionPool(make_conninfo(**connection_params()),
+                                              min_size=min_conn, max_size=max_conn,
+                                              kwargs={"prepare_threshold": None},
+                                              check=AsyncConnectionPool.check_connection,
+                                              max_lifetime=POOL_MAX_AGE, max_idle=POOL_IDLE_TIMEOUT,
+                                              open=False)
+            # wait=True returns once min_size connections are open
+            await _async_pool.open(wait=True)
+    return _async_pool
+
+async def close_async_pool():
+    global _async_pool
+    if _async_pool is not None:
+        await _async_pool.close()
+        _async_pool = None
+
+async def break_down_query_async(query, user_session):
+    response = await call_openai_async(
+        model="gpt-4o-mini",
+        messages=build_breakdown_messages(query, user_session),
+        max_tokens=400,
+        temperature=0.2,
+        top_p=0.95
+    )
+    record_usage("breakdown", response.usage)
+    querybreakdown = response.choices[0].message.content.strip()
+    print("Query Breakdown:", querybreakdown)
+    return querybreakdown
+
+async def get_sql_query_async(query, querybreakdown, teams=()):
+    response = await call_openai_async(
+        model="gpt-4.1-mini",
+        messages = build_sql_messages(query, querybreakdown, teams),
+        max_tokens=1000,
+        temperature=0.0,
+        top_p=0.7
+    )
+    record_usage(f"sql:{get_query_type(querybreakdown) or 'untyped'}", response.usage)
+    return parse_sql_response(response)
+
+async def get_breakdown_and_sql_async(query, user_session):
+    response = await call_openai_async(
+        model="gpt-4.1-mini",
+        messages=build_fused_messages(query, user_session),
+        max_tokens=1400,
+        temperature=0.0,
+        top_p=0.7,
+        response_format=FUSED_RESPONSE_FORMAT
+    )
+    record_usage("fused", response.usage)
+    return parse_fused_response(response)
+
+async def get_data_text_async(query, use_cache=True, max_rows=FETCH_MAX_ROWS, max_bytes=FETCH_MAX_BYTES,
+                              timeout_ms=STATEMENT_TIMEOUT_MS):
+###   Async get_data_text with the same caps and timeout; shares the result cache with the sync path
+    if use_cache:
+        cache_key = canonicalize_sql(query)
+        cached = result_cache.get(cache_key)
+        if cached is not None:
+            columns, rows, truncated = cached
+            return columns, rows, truncated, None
+
+    try:
+        pool = await get_async_pool()
+        async with pool.connection() as conn:
+            async with conn.transaction(force_rollback=True):
+                await conn.execute(f"SET LOCAL statement_timeout = {int(timeout_ms)}")
+                # same EXPLAIN guard as the sync path, LIMIT one row past the fetch cap
+                query = bound_query(query, max_rows + 1)
+                explain = await conn.execute("EXPLAIN (FORMAT JSON) " + query)
+                cost, plan_rows = parse_plan((await explain.fetchone())[0])
+                query, rejection = judge_plan(query, cost, plan_rows, GUARD_MAX_COST, GUARD_MAX_ROWS)
+                if rejection:
+                    return [], [], False, rejection
+                async with conn.cursor(name="bounded_fetch") as cursor:
+                    await cursor.execute(query)
+                    rows = []
+                    total_bytes = 0
+                    truncated = False
+                    while not truncated:
+                        batch = await cursor.fetchmany(FETCH_BATCH_SIZE)
+                        if not batch:
+                            break
+                        for row in batch:
+                            total_bytes += row_size(row)
+                            if len(rows) >= max_rows or total_bytes > max_bytes:
+                                truncated = True
+                                break
+                            rows.append(row)
+                    columns = [desc.name for desc in cursor.description]
+        if use_cache:
+            result_cache.set(cache_key, (columns, rows, truncated))
+        return columns, rows, truncated, None
+    except Exception as e:
+        return [], [], False, str(e)
+
+async def get_response_async(query, columns, rows):
+    formatted_table = format_table_data(columns, rows)
+    response = await call_openai_async(
+        model="gpt-4o",
+        messages=build_response_messages(query, columns, rows),
+        max_tokens=1200
+    )
+    record_usage("response", response.usage)
+    llm_response = response.choices[0].message.content.strip()
+    return formatted_table, llm_response
+
+async def get_error_response_async(query, error):
+    response = await call_openai_async(
+        model="gpt-4o",
+        messages=build_error_messages(query, error),
+        max_tokens=300
+    )
+    record_usage("error", response.usage)
+    return response.choices[0].message.content.strip()
+
+async def run_query_async(query, user_session, fuzzy_cache, team_resolver, answer_cache, answer_cache_key):
+###   Same stages and responses as routes.run_query (fused or two-call, template
+###   fast path, answer cache), returning the final payload instead of streaming it
+    sql_query = None
+    fused = False
+    if FUSED_SQL_MODE:
+        # one completion for breakdown and SQL; the two-call path is the fallback
+        try:
+            raw_breakdown, sql_query = await get_breakdown_and_sql_async(query, user_session)
+            fused = True
+        except Exception as e:
+            print(f"Fused breakdown/SQL failed, falling back: {e}")
+    if not fused:
+        raw_breakdown = await break_down_query_async(query, user_session)
+    breakdown = fuzzy_cache.correct_names(raw_breakdown)
+
+    cache_key = answer_cache_key(query, breakdown)
+    cached = answer_cache.get(cache_key)
+    if cached is not None:
+        user_session.add_interaction(query = query, breakdown = breakdown, sql_query = cached['sql_query'], data_table = cached['table'], response = cached['response'])
+        return {"success": True, "response": cached['response'], "table": cached['table']}
+
+    if fused:
+        # written before teams were resolved; it looks them up by full_name itself
+        sql_query = apply_name_corrections(sql_query, raw_breakdown, breakdown)
+    else:
+        teams = team_resolver.resolve(f"{query}\n{breakdown}", NAME_PATTERN.findall(breakdown))
+        # same template fast path as routes.run_query, counted in the same hit-rate stats
+        sql_query = get_template_sql(query, breakdown, fuzzy_cache.player_name_set, teams)
+        if sql_query is None:
+            sql_query = await get_sql_query_async(query, breakdown, teams)
+    if sql_query is None:
+        error = "I couldn't understand your question. Could you please rephrase it or provide more specific details about the NBA statistics you're looking for?"
+        user_session.add_interaction(query = query, breakdown = breakdown, sql_query = sql_query, error = error)
+        return {"success": False, "response": error}
+
+    columns, rows, truncated, error = await get_data_text_async(sql_query)
+    if error:
+        error_response = await get_error_response_async(query, error)
+        user_session.add_interaction(query = query, breakdown = breakdown, sql_query = sql_query, error = error_response)
+        return {"success": False, "response": error_response}
+
+    if len(rows) == 0:
+        error_response = "No results found for your query. Try asking about different NBA players, teams, or time periods, or check your spelling of player names or teams."
+        user_session.add_interaction(query = query, breakdown = breakdown, sql_query = sql_query, data_table = "", error = error_response)
+        return {"success": True, "response": error_response, "table": ""}
+
+    formatted_table, llm_response = await get_response_async(query, columns, rows)
+    user_session.add_interaction(query = query, breakdown = breakdown, sql_query = sql_query, data_table = formatted_table, response = llm_response)
+    answer_cache.set(cache_key, {'sql_query': sql_query, 'table': formatted_table, 'response': llm_response})
+    return {"success": True, "response": llm_response, "table": formatted_table, "truncated": truncated}
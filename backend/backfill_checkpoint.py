@@ -0,0 +1,65 @@
+import json
+import os
+import shutil
+import pandas as pd
+
+# Durable progress for a box-score backfill. Every chunk of games is written
+# to a staging file before it is upserted, and manifest.json records which
+# chunks are staged and which are loaded, so an interrupted run restarted with
+# --resume reloads staged chunks without refetching and skips loaded games.
+
+CHUNK_SIZE = int(os.getenv('NBA_BACKFILL_CHUNK', 50))
+
+class BackfillCheckpoint:
+    def __init__(self, directory, resume = False):
+        self.directory = directory
+        if not resume and os.path.isdir(directory):
+            shutil.rmtree(directory)
+        os.makedirs(directory, exist_ok = True)
+        self.manifest_path = os.path.join(directory, "manifest.json")
+        self.manifest = {"next_chunk": 0, "loaded_games": [], "staged_chunks": {}}
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path) as f:
+                self.manifest = json.load(f)
+        self.loaded_games = set(self.manifest["loaded_games"])
+
+    def save(self):
+        tmp = self.manifest_path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.manifest, f)
+        os.replace(tmp, self.manifest_path)
+
+    def chunk_paths(self, chunk_id):
+        return (os.path.join(self.directory, f"chunk_{chunk_id}_player.pkl.gz"),
+                os.path.join(self.directory, f"chunk_{chunk_id}_team.pkl.gz"))
+
+    def stage(self, game_ids, df_player, df_team):
+        chunk_id = str(self.manifest["next_chunk"])
+        self.manifest["next_chunk"] += 1
+        player_path, team_path = self.chunk_paths(chunk_id)
+        df_player.to_pickle(player_path)
+        df_team.to_pickle(team_path)
+        self.manifest["staged_chunks"][chunk_id] = list(game_ids)
+        self.save()
+        return chunk_id
+
+    def staged(self):
+###   (chunk_id, game_ids) for chunks fetched by an earlier run but never loaded
+        return list(self.manifest["staged_chunks"].items())
+
+    def read(self, chunk_id):
+        player_path, team_path = self.chunk_paths(chunk_id)
+        return pd.read_pickle(player_path), pd.read_pickle(team_path)
+
+    def mark_loaded(self, chunk_id):
+        game_ids = self.manifest["staged_chunks"].pop(chunk_id)
+        self.manifest["loaded_games"] += game_ids
+        self.loaded_games.update(game_ids)
+        self.save()
+        # the rows are in the database now
+        for path in self.chunk_paths(chunk_id):
+            os.remove(path)
+
+    def pending(self, game_ids):
+        staged = {game_id for _, ids in self.staged() for game_id in ids}
+        return [game_id for game_id in game_ids if game_id not in self.loaded_games and game_id not in staged]
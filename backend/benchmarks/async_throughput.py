@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+###   Throughput of the sync (thread per request) pipeline vs the async pipeline
+###   under simulated OpenAI and database latency. No network or database needed.
+###   Run from backend/: python -m benchmarks.async_throughput --requests 200
+import argparse
+import asyncio
+import contextlib
+import io
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+import fuzzy_cache
+# keep the benchmark offline: no background player-name refresh
+fuzzy_cache.FuzzyCache.start_background_refresh = lambda self: None
+
+import routes
+import openai_response
+import async_pipeline
+from user_session import UserSession
+
+LLM_LATENCY = {"gpt-4o-mini": 0.8, "gpt-4.1-mini": 1.2, "gpt-4o": 1.5}
+DB_LATENCY = 0.1
+
+def fake_completion(model, messages):
+    content = "SELECT 1" if model == "gpt-4.1-mini" else f"$$Multi-Game Player Performance$$ {messages[-1]['content'][-40:]}"
+    return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))], usage=None)
+
+def fake_call_openai(model, messages, **kwargs):
+    time.sleep(LLM_LATENCY[model])
+    return fake_completion(model, messages)
+
+async def fake_call_openai_async(model, messages, **kwargs):
+    await asyncio.sleep(LLM_LATENCY[model])
+    return fake_completion(model, messages)
+
+def fake_get_data_text(query, conn=None, use_cache=True):
+    time.sleep(DB_LATENCY)
+    return ["PPG"], [(27.5,)], False, None
+
+async def fake_get_data_text_async(query, use_cache=True):
+    await asyncio.sleep(DB_LATENCY)
+    return ["PPG"], [(27.5,)], False, None
+
+def patch():
+    openai_response.call_openai_with_retry = fake_call_openai
+    routes.get_connection = lambda: None
+    routes.release_connection = lambda conn: None
+    routes.get_data_text = fake_get_data_text
+    async_pipeline.call_openai_async = fake_call_openai_async
+    async_pipeline.get_data_text_async = fake_get_data_text_async
+    # every request is distinct so the answer cache never short-circuits
+    routes.answer_cache.set = lambda *args, **kwargs: None
+
+def run_sync(query):
+    for event, data in routes.run_query(query, UserSession()):
+        if event == "done":
+            return data
+
+def bench_sync(n, threads):
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        list(executor.map(run_sync, [f"question {i}" for i in range(n)]))
+    return time.perf_counter() - start
+
+async def bench_async(n):
+    start = time.perf_counter()
+    await asyncio.gather(*[
+        async_pipeline.run_query_async(f"question {i}", UserSession(), routes.fuzzy_cache, routes.team_resolver,
+                                       routes.answer_cache, routes.answer_cache_key)
+        for i in range(n)])
+    return time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--threads", type=int, default=10, help="sync worker threads")
+    args = parser.parse_args()
+    patch()
+
+    # the pipeline prints every prompt; keep the report readable
+    with contextlib.redirect_stdout(io.StringIO()):
+        sync_elapsed = bench_sync(args.requests, args.threads)
+        async_elapsed = asyncio.run(bench_async(args.requests))
+    print(f"{args.requests} requests, simulated latency per request ~{sum(LLM_LATENCY.values()) + DB_LATENCY:.1f}s")
+    print(f"sync  ({args.threads} threads): {sync_elapsed:7.2f}s  {args.requests / sync_elapsed:7.1f} req/s")
+    print(f"async (1 event loop): {async_elapsed:7.2f}s  {args.requests / async_elapsed:7.1f} req/s")
+
+if __name__ == "__main__":
+    main()
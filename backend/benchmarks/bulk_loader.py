@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+###   Upsert throughput into a scratch copy of game_stats_player on a local
+###   Postgres: to_dict(orient='records') rows sent as a multi-row
+###   INSERT ... ON CONFLICT (the shape of the REST upsert) vs COPY into a temp
+###   table + one merge (bulk_loader.copy_upsert). Each size is loaded twice,
+###   the second pass updating every row. Reports rows/sec and peak Python memory.
+###   Run from backend/: BENCH_DATABASE_URL=postgresql://... python -m benchmarks.bulk_loader
+import os
+import time
+import tracemalloc
+import numpy as np
+import pandas as pd
+import psycopg2
+from psycopg2.extras import execute_values
+from bulk_loader import copy_upsert
+
+SIZES = [10000, 100000]
+TABLE = "bench_game_stats_player"
+STAT_COLUMNS = ['min', 'fgm', 'fga', 'fg3m', 'fg3a', 'ftm', 'fta', 'oreb', 'reb', 'ast', 'stl', 'blk', 'to', 'pts', 'plus_minus']
+FLOAT_COLUMNS = ['off_rating', 'def_rating', 'oreb_pct', 'reb_pct', 'efg_pct', 'usg_pct', 'pie']
+
+def make_frame(rows, seed):
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({'game_id': 22400000 + np.arange(rows) // 26, 'team_id': 1610612737 + rng.integers(0, 30, rows),
+                       'player_id': np.arange(rows) % 26 + 200000, 'player_name': [f'Player {i % 600}' for i in range(rows)]})
+    for column in STAT_COLUMNS:
+        df[column] = rng.integers(0, 40, rows)
+    for column in FLOAT_COLUMNS:
+        df[column] = rng.random(rows).round(3)
+    df['entered_game'] = 1
+    return df
+
+def create_table(conn):
+    with conn.cursor() as cursor:
+        cursor.execute(f"DROP TABLE IF EXISTS {TABLE}")
+        columns = ", ".join([f'"{c}" INT' for c in STAT_COLUMNS] + [f"{c} DOUBLE PRECISION" for c in FLOAT_COLUMNS])
+        cursor.execute(f"CREATE TABLE {TABLE} (game_id INT, team_id INT, player_id INT, player_name TEXT, {columns}, "
+                       f"entered_game INT, PRIMARY KEY (game_id, player_id))")
+    conn.commit()
+
+def records_upsert(conn, df):
+    records = df.to_dict(orient='records')
+    columns = list(df.columns)
+    # "to" is a reserved word
+    column_list = ", ".join(f'"{c}"' for c in columns)
+    updates = ", ".join(f'"{c}" = EXCLUDED."{c}"' for c in columns if c not in ('game_id', 'player_id'))
+    with conn.cursor() as cursor:
+        execute_values(cursor, f"INSERT INTO {TABLE} ({column_list}) VALUES %s "
+                               f"ON CONFLICT (game_id, player_id) DO UPDATE SET {updates}",
+                       [tuple(record[c] for c in columns) for record in records], page_size=1000)
+    conn.commit()
+
+def measure(load, conn, df):
+    tracemalloc.start()
+    start = time.perf_counter()
+    load(conn, df)
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return len(df) / elapsed, peak / 2**20
+
+def run():
+    dsn = os.getenv("BENCH_DATABASE_URL")
+    if not dsn:
+        print("Set BENCH_DATABASE_URL to a scratch Postgres database")
+        return
+    conn = psycopg2.connect(dsn)
+    loaders = [("to_dict + INSERT", records_upsert), ("COPY + merge", lambda conn, df: copy_upsert(conn, [(TABLE, df)]))]
+    print(f"{'loader':>18} {'rows':>8} {'pass':>7} {'rows/s':>10} {'peak MiB':>9}")
+    for rows in SIZES:
+        for name, load in loaders:
+            create_table(conn)
+            for label, seed in (("insert", 1), ("update", 2)):
+                rate, peak = measure(load, conn, make_frame(rows, seed))
+                print(f"{name:>18} {rows:>8} {label:>7} {rate:>10.0f} {peak:>9.1f}")
+    with conn.cursor() as cursor:
+        cursor.execute(f"DROP TABLE IF EXISTS {TABLE}")
+    conn.commit()
+    conn.close()
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+###   Breakdown prompt size as a conversation grows: the last four messages
+###   pasted verbatim (old) vs the token-budgeted turn summaries (current),
+###   plus the cost of assembling the context per request.
+###   Run from backend/: python -m benchmarks.context_tokens
+import contextlib
+import io
+import random
+import time
+import openai_response as o
+from user_session import UserSession
+from benchmarks.prompt_tokens import count_tokens
+
+TURNS = [1, 5, 10, 20, 50, 100]
+
+def make_turn(i, rng):
+    player = rng.choice(["LeBron James", "Stephen Curry", "Nikola Jokić", "Jayson Tatum", "Luka Dončić"])
+    breakdown = (f"- Query type: $$Multi-Game Player Performance$$\n"
+                 f"- Key entities: ***{player}***, Boston Celtics, 2024-25 season\n"
+                 f"- Filters/conditions: season_id = 22024, season_type = 'Regular Season', opponent = Boston Celtics\n"
+                 f"- Output variables: games played, PPG, RPG, APG")
+    # assistant answers run several paragraphs
+    response = "\n\n".join([f"{player} averaged {rng.randint(15, 35)} points, {rng.randint(3, 12)} rebounds and "
+                            f"{rng.randint(2, 10)} assists against Boston in the 2024-25 regular season. "
+                            "His efficiency was well above his season norms, and the matchup favored his drives."] * rng.randint(2, 5))
+    return dict(query=f"How did {player} do against the Celtics this season? (turn {i})", breakdown=breakdown,
+                data_table="| PPG |\n|-----|\n| 27.1 |", response=response)
+
+def legacy_history(turns):
+    messages = []
+    for turn in turns:
+        messages += [f"User: {turn['query']}", f"Assistant: {turn['response']}"]
+    return "\n".join(messages[-4:])
+
+def run():
+    rng = random.Random(9)
+    print(f"{'turns':>6} {'last-4 tokens':>14} {'budgeted tokens':>16} {'context us':>11}")
+    for n in TURNS:
+        turns = [make_turn(i, rng) for i in range(n)]
+        user_session = UserSession()
+        for turn in turns:
+            user_session.add_interaction(**turn)
+        legacy = o.QUERY_BREAKDOWN_TEMPLATE.format(chat_history=legacy_history(turns), query="And his rebounds?")
+        # build_breakdown_messages logs the whole prompt
+        with contextlib.redirect_stdout(io.StringIO()):
+            current = o.build_breakdown_messages("And his rebounds?", user_session)[1]["content"]
+        # first call builds the context, the rest hit the per-session cache
+        start = time.perf_counter()
+        for _ in range(1000):
+            user_session.context()
+        context_us = 1e6 * (time.perf_counter() - start) / 1000
+        print(f"{n:>6} {count_tokens(legacy):>14} {count_tokens(current):>16} {context_us:>11.2f}")
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+###   Backfill throughput against a local stub of stats.nba.com that allows
+###   UPSTREAM_RATE req/s (429 above it) and takes LATENCY per response:
+###   the old serial loop with a fixed sleep after each call vs FetchScheduler,
+###   configured at the upstream limit and deliberately above it (to exercise
+###   the 429 backoff). Sleeps are scaled down 10x from the ETL's 2s.
+###   Run from backend/: python -m benchmarks.fetch_scheduler
+import contextlib
+import io
+import json
+import threading
+import time
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from fetch_scheduler import FetchScheduler, TokenBucket
+
+JOBS = 200
+UPSTREAM_RATE = 20
+UPSTREAM_BURST = 5
+LATENCY = 0.05
+LEGACY_SLEEP = 0.2
+
+class StubHandler(BaseHTTPRequestHandler):
+    limiter = None
+    lock = threading.Lock()
+    rejected = 0
+
+    def do_GET(self):
+        time.sleep(LATENCY)
+        with self.lock:
+            bucket = self.limiter
+            bucket._refill(time.monotonic())
+            allowed = bucket.tokens >= 1
+            if allowed:
+                bucket.tokens -= 1
+            else:
+                StubHandler.rejected += 1
+        body = json.dumps({"resultSets": [{"rowSet": [[1, 2, 3]]}]}).encode() if allowed else b""
+        self.send_response(200 if allowed else 429)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+def fetch(url):
+    with urllib.request.urlopen(url, timeout=5) as response:
+        return json.loads(response.read())
+
+def legacy(url):
+    failed = 0
+    for _ in range(JOBS):
+        try:
+            fetch(url)
+        except Exception:
+            failed += 1
+        time.sleep(LEGACY_SLEEP)
+    return failed
+
+def scheduled(url, rate):
+    scheduler = FetchScheduler(rate=rate, burst=UPSTREAM_BURST, workers=4, retries=8, base_backoff=0.05, max_backoff=1.0)
+    def job(i):
+        try:
+            return scheduler.call(fetch, f"{url}?game={i}")
+        except Exception:
+            return None
+    return sum(result is None for result in scheduler.map(job, range(JOBS)))
+
+def run():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}/stats"
+    cases = [("serial + fixed sleep", lambda: legacy(url)),
+             (f"scheduler @ {UPSTREAM_RATE} req/s", lambda: scheduled(url, UPSTREAM_RATE)),
+             (f"scheduler @ {UPSTREAM_RATE * 3} req/s", lambda: scheduled(url, UPSTREAM_RATE * 3))]
+    print(f"{JOBS} requests, upstream limit {UPSTREAM_RATE} req/s, {LATENCY * 1000:.0f} ms latency")
+    print(f"{'case':>24} {'seconds':>8} {'req/s':>7} {'429s':>6} {'failed':>7}")
+    for name, case in cases:
+        StubHandler.limiter = TokenBucket(UPSTREAM_RATE, burst=UPSTREAM_BURST)
+        StubHandler.rejected = 0
+        # print() from backoff retries would swamp the table
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            failed = case()
+        elapsed = time.perf_counter() - start
+        print(f"{name:>24} {elapsed:>8.2f} {JOBS / elapsed:>7.1f} {StubHandler.rejected:>6} {failed:>7}")
+    server.shutdown()
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+###   The ETL's games/box-score formatting on a synthetic five-season game log
+###   (30 teams, 82 games each plus playoffs): the old groupby-to-lists and
+###   per-row lambda versions vs the vectorized ones in game_formatting.py.
+###   Outputs are checked to be identical before timing.
+###   Run from backend/: python -m benchmarks.game_formatting
+import datetime
+import random
+import time
+import numpy as np
+import pandas as pd
+from pandas.testing import assert_frame_equal, assert_series_equal
+import game_formatting
+
+SEASONS = 5
+TEAMS = ['ATL', 'BOS', 'BKN', 'CHA', 'CHI', 'CLE', 'DAL', 'DEN', 'DET', 'GSW', 'HOU', 'IND', 'LAC', 'LAL', 'MEM',
+         'MIA', 'MIL', 'MIN', 'NOP', 'NYK', 'OKC', 'ORL', 'PHI', 'PHX', 'POR', 'SAC', 'SAS', 'TOR', 'UTA', 'WAS']
+REPEAT = 5
+
+def legacy_format_games_table(df):
+    matchup_split = df['MATCHUP'].str.split()
+    df['primary_team'] = matchup_split.str[0]
+    df['home_team'] = np.where(matchup_split.str[1] == 'vs.', matchup_split.str[0], matchup_split.str[2])
+    df['away_team'] = np.where(matchup_split.str[1] == 'vs.', matchup_split.str[2], matchup_split.str[0])
+    grouped = df.groupby(['Game_ID', 'GAME_DATE', 'home_team', 'away_team', 'SEASON_ID', 'SEASON_TYPE'], as_index = False).agg({'primary_team': lambda x: list(x),
+                                                                                                    'PTS': lambda x: list(x)})
+    grouped[['primary_team_0', 'primary_team_1']] = pd.DataFrame(grouped['primary_team'].tolist(), index=grouped.index)
+    grouped[['PTS_0', 'PTS_1']] = pd.DataFrame(grouped['PTS'].tolist(), index=grouped.index)
+    grouped['home_score'] = np.where(grouped['primary_team_0'] == grouped['home_team'], grouped['PTS_0'], grouped['PTS_1'])
+    grouped['away_score'] = np.where(grouped['primary_team_0'] == grouped['home_team'], grouped['PTS_1'], grouped['PTS_0'])
+    grouped['GAME_DATE'] = pd.to_datetime(grouped['GAME_DATE'].str.title())
+    grouped['PLAYOFF_GAME_ROUND'] = grouped['Game_ID'].astype(str).apply(lambda x: int(x[-3]) if x[2] == '4' else 0)
+    grouped['PLAYOFF_GAME_NUM'] = grouped['Game_ID'].astype(str).apply(lambda x: int(x[-1]) if x[2] == '4' else 0)
+    return grouped.drop(columns = ['PTS', 'primary_team', 'primary_team_0', 'primary_team_1', 'PTS_0', 'PTS_1'])
+
+def legacy_format_games_update(df):
+    grouped = df.groupby(['GAME_ID', 'GAME_DATE_EST'], as_index = False).agg({'TEAM_ID': lambda x: list(x), 'PTS': lambda x: list(x)})
+    grouped[['away_team', 'home_team']] = pd.DataFrame(grouped['TEAM_ID'].tolist(), index=grouped.index)
+    grouped[['away_score', 'home_score']] = pd.DataFrame(grouped['PTS'].tolist(), index=grouped.index)
+    grouped['GAME_DATE'] = grouped['GAME_DATE_EST'].apply(lambda x: datetime.datetime.fromisoformat(x).date())
+    grouped = grouped.drop(['TEAM_ID', 'PTS', 'GAME_DATE_EST'], axis = 1)
+    grouped['SEASON_TYPE'] = grouped['GAME_ID'].astype(str).apply(lambda x: 'Regular Season' if x[2] == '2' else 'Playoffs')
+    grouped['SEASON_ID'] = grouped['GAME_DATE'].apply(lambda x: x.year + 20000 if x.month >= 10 else (x.year + 19999))
+    grouped['PLAYOFF_GAME_ROUND'] = grouped['GAME_ID'].astype(str).apply(lambda x: int(x[-3]) if x[2] == '4' else 0)
+    grouped['PLAYOFF_GAME_NUM'] = grouped['GAME_ID'].astype(str).apply(lambda x: int(x[-1]) if x[2] == '4' else 0)
+    return grouped
+
+def legacy_parse_minutes(minutes):
+    return minutes.apply(lambda x: int(float(x.split(':')[0])) if x and ':' in x
+                         else int(x.split('.')[0]) if x and '.' in x
+                         else int(x) if x else 0)
+
+def make_games(rng):
+###   (game log rows, scoreboard line-score rows, box-score MIN values)
+    log, lines = [], []
+    for season in range(SEASONS):
+        start = datetime.date(2020 + season, 10, 20)
+        for n in range(1, 1231):
+            game_id = f'002{20 + season}{n:05d}'
+            log.append((game_id, start + datetime.timedelta(days=n % 170), *rng.sample(TEAMS, 2), 22020 + season, 'Regular Season'))
+        for n in range(80):
+            game_id = f'004{20 + season}00{n // 28 + 1}{n % 4}{n % 7 + 1}'
+            log.append((game_id, datetime.date(2021 + season, 4, 20) + datetime.timedelta(days=n // 2), *rng.sample(TEAMS, 2), 22020 + season, 'Playoffs'))
+    team_log = []
+    for game_id, day, home, away, season_id, season_type in log:
+        home_pts, away_pts = rng.randint(85, 140), rng.randint(85, 140)
+        date = day.strftime('%b %d, %Y').upper()
+        team_log.append((game_id, date, f'{home} vs. {away}', home_pts, season_id, season_type))
+        team_log.append((game_id, date, f'{away} @ {home}', away_pts, season_id, season_type))
+        est = f'{day.isoformat()}T00:00:00'
+        lines.append((game_id, est, 1610612737 + TEAMS.index(away), away_pts))
+        lines.append((game_id, est, 1610612737 + TEAMS.index(home), home_pts))
+    rng.shuffle(team_log)
+    games = pd.DataFrame(team_log, columns=['Game_ID', 'GAME_DATE', 'MATCHUP', 'PTS', 'SEASON_ID', 'SEASON_TYPE'])
+    scoreboard = pd.DataFrame(lines, columns=['GAME_ID', 'GAME_DATE_EST', 'TEAM_ID', 'PTS'])
+    formats = [lambda: f'{rng.randint(0, 48)}:{rng.randint(0, 59):02d}', lambda: f'{rng.randint(0, 48)}.000000:{rng.randint(0, 59):02d}',
+               lambda: f'{rng.randint(0, 48)}.{rng.randint(0, 9)}', lambda: str(rng.randint(0, 48)), lambda: None, lambda: '']
+    minutes = pd.Series([rng.choice(formats)() for _ in range(len(log) * 26)], dtype=object)
+    return games, scoreboard, minutes
+
+def timed(fn, *args):
+    best = float('inf')
+    for _ in range(REPEAT):
+        copies = [arg.copy() for arg in args]
+        start = time.perf_counter()
+        result = fn(*copies)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+def run():
+    games, scoreboard, minutes = make_games(random.Random(11))
+    print(f"{len(games)} game log rows, {len(scoreboard)} line-score rows, {len(minutes)} MIN values (best of {REPEAT})")
+    print(f"{'function':>20} {'legacy ms':>10} {'vectorized ms':>14} {'speedup':>8}")
+    for name, legacy, current, data in (("format_games_table", legacy_format_games_table, game_formatting.format_games_table, games),
+                                        ("format_games_update", legacy_format_games_update, game_formatting.format_games_update, scoreboard),
+                                        ("parse_minutes", legacy_parse_minutes, game_formatting.parse_minutes, minutes)):
+        legacy_s, expected = timed(legacy, data)
+        current_s, result = timed(current, data)
+        if isinstance(expected, pd.Series):
+            assert_series_equal(result, expected, check_names=False)
+        else:
+            assert_frame_equal(result, expected)
+        print(f"{name:>20} {legacy_s * 1000:>10.1f} {current_s * 1000:>14.1f} {legacy_s / current_s:>7.1f}x")
+
+if __name__ == "__main__":
+    run()
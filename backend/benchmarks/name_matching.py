@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+###   Per-request name resolution time as the player table grows: one
+###   process.extractOne scan over every name per ***name*** (the old
+###   FuzzyCache.fuzzy_match) vs the indexed, batched FuzzyCache.correct_names.
+###   Player tables are synthetic; no database is needed.
+###   Run from backend/: python -m benchmarks.name_matching
+import random
+import time
+from rapidfuzz import process, fuzz
+from fuzzy_cache import FuzzyCache, NAME_PATTERN
+
+FIRST = ["LeBron", "Stephen", "Kevin", "Giannis", "Nikola", "Luka", "Jayson", "Joel", "Anthony", "Damian",
+         "Devin", "Jimmy", "Kawhi", "Paul", "James", "Russell", "Kyrie", "Donovan", "Trae", "Ja", "Zion",
+         "Shai", "Tyrese", "Jalen", "De'Aaron", "Bam", "Karl-Anthony", "Domantas", "Pascal", "Bradley"]
+LAST = ["James", "Curry", "Durant", "Antetokounmpo", "Jokić", "Dončić", "Tatum", "Embiid", "Davis", "Lillard",
+        "Booker", "Butler", "Leonard", "George", "Harden", "Westbrook", "Irving", "Mitchell", "Young", "Morant",
+        "Williamson", "Gilgeous-Alexander", "Haliburton", "Brunson", "Fox", "Adebayo", "Towns", "Sabonis",
+        "Siakam", "Beal", "Johnson", "Smith", "Jones", "Brown", "Miller", "Wilson", "Moore", "Taylor",
+        "Anderson", "Thomas", "Jackson", "White", "Harris", "Martin", "Thompson", "Robinson", "Clark", "Lewis"]
+
+SIZES = [500, 2000, 5000, 10000, 20000]
+REQUESTS = 200
+
+SYLLABLES = ["an", "ber", "cal", "da", "el", "fo", "gan", "har", "is", "jo", "ka", "lin", "mar", "no", "or",
+             "pe", "quin", "ro", "son", "ta", "ul", "vin", "wel", "ya", "zo", "ton", "ley", "rick", "ell", "ard"]
+
+def make_surname(rng):
+    return "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))).capitalize()
+
+def make_names(n, rng):
+    # real stars plus generated surnames, with first names drawn from a small pool
+    # so shared first-name buckets get large the way they do in the real table
+    first = FIRST + [make_surname(rng) for _ in range(max(n // 20, 50))]
+    names = set(f"{f} {l}" for f, l in zip(FIRST, LAST))
+    while len(names) < n:
+        names.add(f"{rng.choice(first)} {rng.choice(LAST) if rng.random() < 0.1 else make_surname(rng)}")
+    return sorted(names)
+
+def misspell(name, rng):
+    chars = list(name)
+    i = rng.randrange(1, len(chars))
+    op = rng.random()
+    if op < 0.4:
+        del chars[i]
+    elif op < 0.7:
+        chars.insert(i, rng.choice("aeiou"))
+    else:
+        chars[i - 1], chars[i] = chars[i], chars[i - 1]
+    return "".join(chars)
+
+def make_breakdowns(names, rng):
+    breakdowns = []
+    for _ in range(REQUESTS):
+        players = [misspell(p, rng) for p in rng.sample(names, rng.randint(1, 4))]
+        breakdowns.append("- Query type: $$Multi-Game Player Performance$$\n- Key entities: "
+                          + ", ".join(f"***{p}***" for p in players))
+    return breakdowns
+
+def legacy_correct(names, name_set, text):
+    def _repl(match):
+        raw = match.group(1)
+        if raw in name_set:
+            return match.group(0)
+        best = process.extractOne(raw, names, scorer=fuzz.ratio)
+        return f"***{best[0] if best and best[1] >= 80 else raw}***"
+    return NAME_PATTERN.sub(_repl, text)
+
+def run():
+    rng = random.Random(7)
+    # the first cdist call pulls in numpy; keep that out of the timings
+    process.cdist(["warm"], ["up"], scorer=fuzz.ratio)
+    print(f"{'players':>8} {'legacy ms/req':>14} {'indexed ms/req':>15} {'memo ms/req':>12} {'agree':>6}")
+    for size in SIZES:
+        names = make_names(size, rng)
+        name_set = set(names)
+        breakdowns = make_breakdowns(names, rng)
+        cache = FuzzyCache(cache_size=4096, auto_refresh=False)
+        cache.load(names)
+
+        start = time.perf_counter()
+        legacy = [legacy_correct(names, name_set, b) for b in breakdowns]
+        legacy_ms = 1000 * (time.perf_counter() - start) / REQUESTS
+
+        start = time.perf_counter()
+        indexed = [cache.correct_names(b) for b in breakdowns]
+        indexed_ms = 1000 * (time.perf_counter() - start) / REQUESTS
+
+        # the same misspellings again come straight from the memo
+        start = time.perf_counter()
+        for b in breakdowns:
+            cache.correct_names(b)
+        memo_ms = 1000 * (time.perf_counter() - start) / REQUESTS
+
+        agree = sum(a == b for a, b in zip(legacy, indexed)) / REQUESTS
+        print(f"{size:>8} {legacy_ms:>14.3f} {indexed_ms:>15.3f} {memo_ms:>12.3f} {agree:>6.0%}")
+
+if __name__ == "__main__":
+    run()
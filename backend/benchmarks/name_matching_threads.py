@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+###   Name-resolution throughput vs request threads, with a refresher thread
+###   publishing a new name list every second. "locked" holds one lock across
+###   the whole match and the reload, as FuzzyCache.cache_lock used to;
+###   "snapshot" is the current lock-free FuzzyCache.
+###   Scaling needs more than one CPU: the scans run in rapidfuzz's C++ code.
+###   Run from backend/: python -m benchmarks.name_matching_threads
+import os
+import random
+import threading
+import time
+from rapidfuzz import process, fuzz
+from fuzzy_cache import FuzzyCache
+from benchmarks.name_matching import make_names, misspell
+
+PLAYERS = 5000
+THREADS = [1, 2, 4, 8]
+REQUESTS = 2000
+
+class LockedFuzzyCache(FuzzyCache):
+    def __init__(self, *args, **kwargs):
+        self.cache_lock = threading.Lock()
+        super().__init__(*args, **kwargs)
+
+    def load(self, names):
+        # like the old refresh: build outside the lock, swap under it
+        snapshot = self.build_snapshot(names)
+        with self.cache_lock:
+            self.snapshot = snapshot
+
+    def match_names(self, names, threshold=80):
+        with self.cache_lock:
+            return super().match_names(names, threshold)
+
+def make_requests(names, rng):
+    # every breakdown is distinct so the memo can't answer for the scan
+    return ["- Key entities: " + ", ".join(f"***{misspell(p, rng)}***" for p in rng.sample(names, 3))
+            for _ in range(REQUESTS)]
+
+def measure(cache, names, requests, threads):
+    stop = threading.Event()
+
+    def refresher():
+        while not stop.wait(1.0):
+            cache.load(names)
+
+    def worker(chunk):
+        for text in chunk:
+            cache.correct_names(text)
+
+    chunks = [requests[i::threads] for i in range(threads)]
+    workers = [threading.Thread(target=worker, args=(chunk,)) for chunk in chunks]
+    refresh_thread = threading.Thread(target=refresher)
+    refresh_thread.start()
+    start = time.perf_counter()
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    elapsed = time.perf_counter() - start
+    stop.set()
+    refresh_thread.join()
+    return len(requests) / elapsed
+
+def run():
+    rng = random.Random(11)
+    names = make_names(PLAYERS, rng)
+    process.cdist(["warm"], ["up"], scorer=fuzz.ratio)
+    print(f"{PLAYERS} players, {REQUESTS} requests, {os.cpu_count()} CPUs")
+    print(f"{'threads':>8} {'locked req/s':>13} {'snapshot req/s':>15}")
+    for threads in THREADS:
+        results = []
+        for cls in (LockedFuzzyCache, FuzzyCache):
+            cache = cls(cache_size=1 << 20, auto_refresh=False)
+            cache.load(names)
+            results.append(measure(cache, names, make_requests(names, rng), threads))
+        print(f"{threads:>8} {results[0]:>13.0f} {results[1]:>15.0f}")
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+###   Token-count report for the SQL generation prompt per query type: the old
+###   layout (full schema, whole example block, breakdown inside the system
+###   message) vs the pruned schema prefix plus retrieved examples. Counts with tiktoken when installed, else ~4 chars/token.
+###   Run from backend/: python -m benchmarks.prompt_tokens
+import openai_response as o
+
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding("o200k_base")
+    def count_tokens(text):
+        return len(_encoding.encode(text))
+except Exception:
+    # tiktoken missing, or its encoding file can't be downloaded
+    def count_tokens(text):
+        return len(text) // 4
+
+SAMPLE_BREAKDOWN = """- Query type: $${querytype}$$
+- Key entities: ***Jayson Tatum***, Boston Celtics, 2024-25 season
+- Filters/conditions: season_id = 22024, season_type = 'Regular Season'
+- Output variables: game_date, home_team, away_team, pts, reb, ast"""
+SAMPLE_QUERY = "How did Jayson Tatum play against the Knicks this season?"
+
+LEGACY_EXAMPLES = {
+    "single game player performance": o.PLAYER_PERFORMANCE_EXAMPLES,
+    "single game team performance": o.TEAM_PERFORMANCE_EXAMPLES,
+    "multi-game player performance": o.PLAYER_AVERAGE_EXAMPLES,
+    "multi-game team performance": o.TEAM_AVERAGES_EXAMPLES,
+    "player information": o.PLAYER_INFORMATION_EXAMPLES,
+    None: o.PLAYER_AVERAGE_EXAMPLES,
+}
+
+def legacy_prompt(querybreakdown):
+    examples = LEGACY_EXAMPLES[o.get_query_type(querybreakdown)]
+    # the original layout: every table and the whole category block, with the
+    # breakdown interpolated before the query
+    rules = o.SQL_PROMPT_TEMPLATE.split("Schema:")[0]
+    return ("You are a SQL query generator for NBA statistics. " + rules
+            + f"Examples: {examples}\n\nSchema: {o.schema}\n\nQuery Breakdown: {querybreakdown}\n\nUser Query:\n" + SAMPLE_QUERY)
+
+def main():
+    print(f"{'query type':34} {'legacy':>8} {'prefix':>8} {'suffix':>8} {'total':>8} {'saved':>7}")
+    for querytype in o.QUERY_TYPE_TABLES:
+        breakdown = SAMPLE_BREAKDOWN.format(querytype = (querytype or "unknown").title())
+        system, user = [m["content"] for m in o.build_sql_messages(SAMPLE_QUERY, breakdown)]
+        legacy = count_tokens(legacy_prompt(breakdown))
+        prefix, suffix = count_tokens(system), count_tokens(user)
+        print(f"{str(querytype):34} {legacy:8d} {prefix:8d} {suffix:8d} {prefix + suffix:8d} {1 - (prefix + suffix) / legacy:7.1%}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+###   Rerunning a box-score backfill through the on-disk response cache:
+###   the first pass fetches every game (simulated LATENCY per request),
+###   the second reads the gzipped payloads back. Also reports the cache's
+###   size on disk against the raw JSON it replaces.
+###   Run from backend/: python -m benchmarks.response_cache
+import json
+import os
+import random
+import tempfile
+import time
+from response_cache import ResponseCache, payload_frames
+
+GAMES = 300
+LATENCY = 0.02
+
+PLAYER_HEADERS = ['GAME_ID', 'TEAM_ID', 'TEAM_ABBREVIATION', 'TEAM_CITY', 'PLAYER_ID', 'PLAYER_NAME', 'NICKNAME',
+                  'START_POSITION', 'COMMENT', 'MIN', 'FGM', 'FGA', 'FG_PCT', 'FG3M', 'FG3A', 'FG3_PCT', 'FTM',
+                  'FTA', 'FT_PCT', 'OREB', 'DREB', 'REB', 'AST', 'STL', 'BLK', 'TO', 'PF', 'PTS', 'PLUS_MINUS']
+
+def box_score(game_id, rng):
+    rows = []
+    for team_id in (1610612738, 1610612747):
+        for p in range(13):
+            fga = rng.randint(0, 25)
+            rows.append([game_id, team_id, 'BOS', 'Boston', 200000 + p, f'Player {p}', f'P{p}', 'F', '',
+                         f'{rng.randint(0, 44)}.000000:{rng.randint(0, 59):02d}', fga // 2, fga, 0.5,
+                         rng.randint(0, 5), rng.randint(0, 10), 0.35, rng.randint(0, 8), rng.randint(0, 10), 0.8,
+                         rng.randint(0, 4), rng.randint(0, 10), rng.randint(0, 14), rng.randint(0, 12),
+                         rng.randint(0, 4), rng.randint(0, 3), rng.randint(0, 5), rng.randint(0, 6),
+                         rng.randint(0, 40), float(rng.randint(-20, 20))])
+    return {'resource': 'boxscore', 'parameters': {'GameID': game_id},
+            'resultSets': [{'name': 'PlayerStats', 'headers': PLAYER_HEADERS, 'rowSet': rows}]}
+
+def backfill(cache, payloads):
+    for game_id, payload in payloads.items():
+        def fetch():
+            time.sleep(LATENCY)
+            return payload
+        payload_frames(cache.fetch('BoxScoreTraditionalV2', {'game_id': game_id}, fetch))
+
+def disk_bytes(directory):
+    return sum(os.path.getsize(os.path.join(root, f)) for root, _, files in os.walk(directory) for f in files)
+
+def run():
+    rng = random.Random(3)
+    payloads = {f'00224{i:05d}': box_score(f'00224{i:05d}', rng) for i in range(GAMES)}
+    raw = sum(len(json.dumps(p)) for p in payloads.values())
+    with tempfile.TemporaryDirectory() as directory:
+        cache = ResponseCache(directory)
+        print(f"{GAMES} box scores, {LATENCY * 1000:.0f} ms simulated fetch")
+        for name in ("first run", "rerun"):
+            start = time.perf_counter()
+            backfill(cache, payloads)
+            print(f"{name:>10}: {time.perf_counter() - start:6.2f}s  {cache.stats()['hits']} hits so far")
+        print(f"raw JSON {raw / 1024:.0f} KiB, on disk {disk_bytes(directory) / 1024:.0f} KiB")
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+###   Memory held by one UserSession over a 1,000-turn synthetic conversation,
+###   sampled every 100 turns: the old append-forever session vs the capped one.
+###   Measured with tracemalloc (bytes allocated and still live) and pickle
+###   size (what the sqlite/redis session stores write per request).
+###   tests/test_user_session.py asserts the capped session stays flat using profile().
+###   Run from backend/: python -m benchmarks.session_memory
+import pickle
+import random
+import time as tm
+import tracemalloc
+from user_session import UserSession
+
+TURNS = 1000
+SAMPLE_EVERY = 100
+
+class LegacyUserSession:
+    def __init__(self):
+        self.chat_history = []
+        self.messages = []
+
+    def add_interaction(self, query, sql_query = None, data_table = None, response = None, error = None):
+        self.chat_history.append({'timestamp': tm.time(), 'query': query, 'sql_query': sql_query,
+                                  'data_table': data_table, 'response': response, 'error': error})
+        self.messages.append(f'User: {query}')
+        if response:
+            self.messages.append(f'Assistant: {response}')
+        elif error:
+            self.messages.append(f'Assistant: {error}')
+
+def make_turn(i, rng):
+    rows = rng.randint(5, 40)
+    table = "| Player Name | Game Date | PTS | REB | AST |\n|---|---|---|---|---|\n" + "\n".join(
+        f"| Player {rng.randint(1, 500)} | 2025-01-{rng.randint(1, 28):02d} | {rng.randint(0, 50)} | "
+        f"{rng.randint(0, 20)} | {rng.randint(0, 15)} |" for _ in range(rows))
+    return dict(query=f"Question {i}: how did player {rng.randint(1, 500)} do against the Celtics this season?",
+                sql_query="SELECT p.player_name, g.game_date, gsp.pts FROM game_stats_player gsp JOIN games g "
+                          "ON gsp.game_id = g.game_id JOIN players p ON gsp.player_id = p.player_id LIMIT 50;",
+                data_table=table,
+                response=" ".join(["He scored efficiently and led the team in assists."] * rng.randint(2, 8)))
+
+def profile(cls):
+    rng = random.Random(5)
+    turns = [make_turn(i, rng) for i in range(TURNS)]
+    tracemalloc.start()
+    base = tracemalloc.get_traced_memory()[0]
+    user_session = cls()
+    samples = []
+    for i, turn in enumerate(turns, 1):
+        user_session.add_interaction(**turn)
+        if i % SAMPLE_EVERY == 0:
+            samples.append((tracemalloc.get_traced_memory()[0] - base, len(pickle.dumps(user_session))))
+    tracemalloc.stop()
+    return samples
+
+def run():
+    legacy = profile(LegacyUserSession)
+    capped = profile(UserSession)
+    print(f"{'turns':>6} {'legacy KiB':>11} {'legacy pickle':>14} {'capped KiB':>11} {'capped pickle':>14}")
+    for n, ((legacy_mem, legacy_pickle), (capped_mem, capped_pickle)) in enumerate(zip(legacy, capped), 1):
+        print(f"{n * SAMPLE_EVERY:>6} {legacy_mem / 1024:>11.1f} {legacy_pickle / 1024:>14.1f} "
+              f"{capped_mem / 1024:>11.1f} {capped_pickle / 1024:>14.1f}")
+
+if __name__ == "__main__":
+    run()
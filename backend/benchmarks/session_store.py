@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+###   get/put cost per session store backend at 100k sessions, each holding a
+###   couple of interactions. The plain dict is the old routes.active_sessions.
+###   redis is measured only when REDIS_URL answers.
+###   Run from backend/: python -m benchmarks.session_store
+import os
+import random
+import tempfile
+import time
+from user_session import UserSession
+from session_store import MemorySessionStore, SqliteSessionStore, RedisSessionStore
+
+SESSIONS = 100_000
+GETS = 100_000
+
+class DictStore:
+    def __init__(self):
+        self.sessions = {}
+
+    def get(self, session_id):
+        return self.sessions.get(session_id)
+
+    def put(self, session_id, user_session):
+        self.sessions[session_id] = user_session
+
+def make_session(i):
+    user_session = UserSession()
+    user_session.add_interaction(query=f"How many points did player {i} average this season?",
+                                 sql_query="SELECT 1;", data_table="| PPG |\n|-----|\n| 27.1 |",
+                                 response="He averaged 27.1 points per game.")
+    user_session.add_interaction(query="And last season?", sql_query="SELECT 2;",
+                                 data_table="| PPG |\n|-----|\n| 25.3 |", response="25.3 points per game.")
+    return user_session
+
+def measure(name, store, sessions):
+    ids = list(sessions)
+    start = time.perf_counter()
+    for session_id in ids:
+        store.put(session_id, sessions[session_id])
+    put_us = 1e6 * (time.perf_counter() - start) / len(ids)
+
+    lookups = [random.choice(ids) for _ in range(GETS)]
+    start = time.perf_counter()
+    for session_id in lookups:
+        store.get(session_id)
+    get_us = 1e6 * (time.perf_counter() - start) / GETS
+    print(f"{name:>8} {put_us:>10.2f} {get_us:>10.2f}")
+
+def run():
+    random.seed(3)
+    sessions = {f"session-{i:06d}": make_session(i) for i in range(SESSIONS)}
+    print(f"{SESSIONS} sessions, {GETS} random gets")
+    print(f"{'backend':>8} {'put us/op':>10} {'get us/op':>10}")
+    measure("dict", DictStore(), sessions)
+    measure("memory", MemorySessionStore(max_sessions=SESSIONS), sessions)
+    with tempfile.TemporaryDirectory() as tmp:
+        measure("sqlite", SqliteSessionStore(os.path.join(tmp, "sessions.db"), max_sessions=SESSIONS), sessions)
+    try:
+        store = RedisSessionStore(os.getenv('REDIS_URL', 'redis://localhost:6379/0'))
+        store.client.ping()
+    except Exception as e:
+        print(f"{'redis':>8} skipped ({e.__class__.__name__})")
+        return
+    measure("redis", store, sessions)
+
+if __name__ == "__main__":
+    run()
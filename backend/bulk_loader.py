@@ -0,0 +1,71 @@
+import io
+import os
+from psycopg2 import sql
+
+# Bulk upserts for the ETL over a psycopg2 connection. Each DataFrame is
+# streamed with COPY ... FROM STDIN (CSV) into a temp table shaped like its
+# target, then merged with one INSERT ... ON CONFLICT on the target's primary
+# key, the same key Supabase's REST upsert resolves. All tables passed to
+# copy_upsert land in a single transaction.
+
+COPY_BATCH_ROWS = int(os.getenv('COPY_BATCH_ROWS', 50000))
+# CSV COPY would read an unquoted empty field as NULL and turn '' into NULL
+NULL_MARKER = r'\N'
+
+def primary_key(cursor, table):
+    cursor.execute("""SELECT a.attname FROM pg_index i
+                      JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = ANY(i.indkey)
+                      WHERE i.indrelid = %s::regclass AND i.indisprimary""", (table,))
+    return [row[0] for row in cursor.fetchall()]
+
+def csv_batches(df, batch_rows = COPY_BATCH_ROWS):
+###   CSV text for df in row slices, so a large frame is never serialized all at once.
+###   Missing values are written as \N (the COPY NULL marker) so empty strings stay ''.
+    for start in range(0, len(df), batch_rows):
+        buffer = io.StringIO()
+        df.iloc[start:start + batch_rows].to_csv(buffer, index = False, header = False, na_rep = NULL_MARKER)
+        buffer.seek(0)
+        yield buffer
+
+def copy_into_stage(cursor, table, df):
+    stage = f"stage_{table}"
+    cursor.execute(sql.SQL("CREATE TEMP TABLE {} (LIKE {} INCLUDING DEFAULTS) ON COMMIT DROP")
+                   .format(sql.Identifier(stage), sql.Identifier(table)))
+    copy = sql.SQL("COPY {} ({}) FROM STDIN WITH (FORMAT csv, NULL {})").format(
+        sql.Identifier(stage), sql.SQL(", ").join(map(sql.Identifier, df.columns)), sql.Literal(NULL_MARKER)).as_string(cursor)
+    for buffer in csv_batches(df):
+        cursor.copy_expert(copy, buffer)
+    return stage
+
+def merge_stage(cursor, table, stage, columns, keys):
+    updates = [column for column in columns if column not in keys]
+    action = sql.SQL("DO UPDATE SET {}").format(sql.SQL(", ").join(
+        sql.SQL("{0} = EXCLUDED.{0}").format(sql.Identifier(column)) for column in updates)) if updates else sql.SQL("DO NOTHING")
+    column_list = sql.SQL(", ").join(map(sql.Identifier, columns))
+    # one row per key: ON CONFLICT DO UPDATE rejects a key that appears twice in one statement
+    cursor.execute(sql.SQL("INSERT INTO {table} ({columns}) SELECT DISTINCT ON ({keys}) {columns} FROM {stage} "
+                           "ORDER BY {keys} ON CONFLICT ({keys}) {action}").format(
+        table = sql.Identifier(table), columns = column_list, stage = sql.Identifier(stage),
+        keys = sql.SQL(", ").join(map(sql.Identifier, keys)), action = action))
+    return cursor.rowcount
+
+def copy_upsert(conn, tables):
+###   Upsert [(table, df)] in order, in one transaction; returns rows merged per table.
+###   df columns must be named like the table's columns.
+    merged = {}
+    try:
+        with conn.cursor() as cursor:
+            for table, df in tables:
+                if df.empty:
+                    merged[table] = 0
+                    continue
+                keys = primary_key(cursor, table)
+                if not keys:
+                    raise ValueError(f"{table} has no primary key to merge on")
+                stage = copy_into_stage(cursor, table, df)
+                merged[table] = merge_stage(cursor, table, stage, list(df.columns), keys)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return merged
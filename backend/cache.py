@@ -0,0 +1,187 @@
+import os
+import pickle
+import threading
+import time as tm
+from collections import OrderedDict
+
+# Every cache built through create_cache is registered here so the ETL can
+# drop all of them at once after an upsert
+_caches = []
+_registry_lock = threading.Lock()
+
+GENERATION_KEY = "nba_gpt:generation"
+
+# Memory caches live in one process each, but the ETL runs in another. A shared
+# generation (sql/cache_generation.sql, wired up by db_connection) is bumped by
+# invalidate_all and re-read in the background every GENERATION_CHECK_INTERVAL seconds;
+# a memory cache that sees it move drops everything it holds.
+GENERATION_CHECK_INTERVAL = float(os.getenv('CACHE_GENERATION_CHECK', 30))
+_generation_source = None
+_generation = {"value": None, "watcher_pid": None}
+_generation_lock = threading.Lock()
+
+def set_generation_source(read, bump):
+###   read() returns the shared generation, bump() increments it; None turns the check off
+    global _generation_source
+    _generation_source = (read, bump) if read else None
+
+def _watch_generation():
+    while _generation_source is not None:
+        try:
+            _generation["value"] = _generation_source[0]()
+        except Exception as e:
+            print(f"Error reading shared cache generation: {e}")
+        tm.sleep(GENERATION_CHECK_INTERVAL)
+
+def shared_generation():
+###   Last shared generation seen. A background thread re-reads it, so cache reads never
+###   wait on the database (or block the ASGI event loop); it is started per process
+###   because threads don't survive a pre-forking server's fork.
+    if _generation_source is None:
+        return None
+    if _generation["watcher_pid"] != os.getpid():
+        with _generation_lock:
+            if _generation["watcher_pid"] != os.getpid():
+                _generation["watcher_pid"] = os.getpid()
+                threading.Thread(target=_watch_generation, daemon=True).start()
+    return _generation["value"]
+
+class MemoryCache:
+###   In-process LRU cache with optional TTL and entry/byte caps
+    def __init__(self, name, max_entries=1024, ttl=None, max_bytes=None):
+        self.name = name
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.generation = None
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        generation = shared_generation()
+        if generation != self.generation:
+            # the ETL loaded new data since these entries were computed
+            self.invalidate()
+            self.generation = generation
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            value, expires_at, size = entry
+            if expires_at is not None and expires_at < tm.time():
+                self._remove(key)
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, ttl=None):
+        ttl = ttl if ttl is not None else self.ttl
+        expires_at = tm.time() + ttl if ttl else None
+        size = len(pickle.dumps(value)) if self.max_bytes else 0
+        # a single value larger than the whole budget is never worth keeping
+        if self.max_bytes and size > self.max_bytes:
+            return
+        with self.lock:
+            if key in self.entries:
+                self._remove(key)
+            self.entries[key] = (value, expires_at, size)
+            self.total_bytes += size
+            while len(self.entries) > self.max_entries or (self.max_bytes and self.total_bytes > self.max_bytes):
+                self._remove(next(iter(self.entries)))
+
+    def _remove(self, key):
+        _, _, size = self.entries.pop(key)
+        self.total_bytes -= size
+
+    def invalidate(self):
+        with self.lock:
+            self.entries.clear()
+            self.total_bytes = 0
+
+    def stats(self):
+        with self.lock:
+            return {"name": self.name,
+                    "backend": "memory",
+                    "entries": len(self.entries),
+                    "bytes": self.total_bytes,
+                    "hits": self.hits,
+                    "misses": self.misses}
+
+class RedisCache:
+###   Cache backed by a Redis-compatible server, shared by every worker
+    def __init__(self, name, url, ttl=None):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("CACHE_BACKEND=redis requires the redis package")
+        self.name = name
+        self.ttl = ttl
+        self.client = redis.Redis.from_url(url)
+        self.hits = 0
+        self.misses = 0
+
+    def _key(self, key):
+        # keys embed the global generation so one INCR invalidates every namespace
+        generation = int(self.client.get(GENERATION_KEY) or 0)
+        return f"nba_gpt:{self.name}:{generation}:{key}"
+
+    def get(self, key):
+        raw = self.client.get(self._key(key))
+        if raw is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return pickle.loads(raw)
+
+    def set(self, key, value, ttl=None):
+        ttl = ttl if ttl is not None else self.ttl
+        self.client.set(self._key(key), pickle.dumps(value), ex=ttl)
+
+    def invalidate(self):
+        self.client.incr(GENERATION_KEY)
+
+    def stats(self):
+        return {"name": self.name,
+                "backend": "redis",
+                "hits": self.hits,
+                "misses": self.misses}
+
+def create_cache(name, max_entries=1024, ttl=None, max_bytes=None):
+###   Build a cache using the backend selected by CACHE_BACKEND (memory or redis)
+    backend = os.getenv('CACHE_BACKEND', 'memory').lower()
+    if backend == 'redis':
+        cache = RedisCache(name, os.getenv('REDIS_URL', 'redis://localhost:6379/0'), ttl=ttl)
+    else:
+        cache = MemoryCache(name, max_entries=max_entries, ttl=ttl, max_bytes=max_bytes)
+    with _registry_lock:
+        _caches.append(cache)
+    return cache
+
+def invalidate_all():
+###   Drop every cached entry; called by the ETL once new box scores are upserted
+    with _registry_lock:
+        caches = list(_caches)
+    for cache in caches:
+        cache.invalidate()
+    # the ETL usually runs in its own process, so bump the shared generation the
+    # web workers check: the redis key, or the database row for memory caches
+    backend = os.getenv('CACHE_BACKEND', 'memory').lower()
+    try:
+        if backend == 'redis':
+            if not caches:
+                import redis
+                redis.Redis.from_url(os.getenv('REDIS_URL', 'redis://localhost:6379/0')).incr(GENERATION_KEY)
+        elif _generation_source is not None:
+            _generation_source[1]()
+    except Exception as e:
+        print(f"Error invalidating shared cache: {e}")
+
+def cache_stats():
+    with _registry_lock:
+        return [cache.stats() for cache in _caches]
@@ -0,0 +1,200 @@
+import os
+import threading
+import time as tm
+from collections import deque
+import psycopg2
+from psycopg2 import extensions
+
+# Connections inherited across a fork still share their sockets with the parent.
+# Closing them (or letting them be garbage collected) in the child would send a
+# Terminate on the parent's session, so the child parks them here untouched.
+_inherited = []
+
+class ConnectionPool:
+###   Thread-safe psycopg2 pool that validates, recycles and resizes itself.
+###   Connections idle longer than ping_after are pinged before reuse, connections
+###   older than max_age are replaced, and the size limit moves between min_size
+###   and max_size: up when callers wait longer than grow_wait, down when
+###   connections sit unused for idle_timeout.
+    def __init__(self, connect_params, min_size=2, max_size=10, max_age=1800, ping_after=30,
+                 idle_timeout=300, grow_wait=0.05):
+        self.connect_params = connect_params
+        self.min_size = min_size
+        self.max_size = max_size
+        self.max_age = max_age
+        self.ping_after = ping_after
+        self.idle_timeout = idle_timeout
+        self.grow_wait = grow_wait
+        self.size = min_size
+        self.last_wait = tm.monotonic()
+        self.cond = threading.Condition()
+        # idle entries are (conn, created_at, last_used); the right end is the most recently used
+        self.idle = deque()
+        self.created_at = {}
+        self.in_use = 0
+        self.waiting = 0
+        self.opened = 0
+        self.recycled = 0
+        self.failed_pings = 0
+        self.pid = os.getpid()
+        self.closed = False
+
+    def connect(self):
+        conn = psycopg2.connect(**self.connect_params)
+        with self.cond:
+            self.opened += 1
+        return conn
+
+    def warm(self):
+###   Open connections up to min_size so the first requests skip the TLS handshake
+        with self.cond:
+            missing = self.min_size - len(self.idle) - self.in_use
+        for _ in range(missing):
+            conn = self.connect()
+            with self.cond:
+                self.idle.appendleft((conn, tm.time(), tm.time()))
+                self.cond.notify()
+
+    def usable(self, conn, created_at, last_used):
+###   Cheap validation: closed/age checks always, a SELECT 1 only after ping_after idle seconds
+        if conn.closed:
+            return False
+        now = tm.time()
+        if now - created_at > self.max_age:
+            with self.cond:
+                self.recycled += 1
+            return False
+        if now - last_used > self.ping_after:
+            try:
+                with conn.cursor() as cursor:
+                    cursor.execute("SELECT 1")
+                conn.rollback()
+            except Exception:
+                with self.cond:
+                    self.failed_pings += 1
+                return False
+        return True
+
+    def acquire(self, timeout=None):
+###   Check a connection out, waiting up to timeout seconds when the pool is at its limit.
+###   Returns (conn, waited).
+        deadline = tm.monotonic() + timeout if timeout is not None else None
+        start = tm.monotonic()
+        waited = False
+        with self.cond:
+            while True:
+                if self.closed:
+                    raise RuntimeError("Connection pool is closed")
+                if self.idle:
+                    conn, created_at, last_used = self.idle.pop()
+                    break
+                if self.in_use < self.size:
+                    conn = None
+                    break
+                remaining = deadline - tm.monotonic() if deadline is not None else None
+                if remaining is not None and remaining <= 0:
+                    raise TimeoutError(f"No database connection available after {timeout}s")
+                waited = True
+                self.waiting += 1
+                try:
+                    self.cond.wait(remaining)
+                finally:
+                    self.waiting -= 1
+            self.in_use += 1
+            if waited:
+                self.last_wait = tm.monotonic()
+                if self.last_wait - start > self.grow_wait and self.size < self.max_size:
+                    self.size += 1
+                    print(f"Connection pool grown to {self.size}")
+                    # the new slot is free right now; let another waiter open it
+                    self.cond.notify()
+
+        try:
+            if conn is not None and not self.usable(conn, created_at, last_used):
+                self.discard(conn)
+                conn = None
+            if conn is None:
+                conn = self.connect()
+                created_at = tm.time()
+        except Exception:
+            with self.cond:
+                self.in_use -= 1
+                self.cond.notify()
+            raise
+        with self.cond:
+            self.created_at[conn] = created_at
+        return conn, waited
+
+    def release(self, conn, close=False):
+        if os.getpid() != self.pid:
+            _inherited.append(conn)
+            return
+        # roll back whatever the caller left open, as ThreadedConnectionPool did
+        if not conn.closed and conn.info.transaction_status != extensions.TRANSACTION_STATUS_IDLE:
+            try:
+                conn.rollback()
+            except Exception:
+                close = True
+        now = tm.time()
+        to_close = []
+        with self.cond:
+            created_at = self.created_at.pop(conn, now)
+            self.in_use -= 1
+            if close or conn.closed or self.closed or now - created_at > self.max_age \
+                    or self.in_use + len(self.idle) >= self.size:
+                to_close.append(conn)
+            else:
+                self.idle.append((conn, created_at, now))
+            to_close.extend(self.shrink(now))
+            self.cond.notify()
+        for stale in to_close:
+            self.discard(stale)
+
+    def shrink(self, now):
+###   Step the size limit down once per idle_timeout without waiters and drop
+###   connections unused for idle_timeout (call with cond held)
+        if self.size > self.min_size and tm.monotonic() - self.last_wait > self.idle_timeout:
+            self.size -= 1
+            self.last_wait = tm.monotonic()
+            print(f"Connection pool shrunk to {self.size}")
+        stale = []
+        while self.idle and (now - self.idle[0][2] > self.idle_timeout or len(self.idle) + self.in_use > self.size) \
+                and len(self.idle) + self.in_use > self.min_size:
+            stale.append(self.idle.popleft()[0])
+        return stale
+
+    def discard(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def abandon(self):
+###   Forget every connection without touching its socket; used in a forked child
+        with self.cond:
+            _inherited.extend(conn for conn, _, _ in self.idle)
+            _inherited.extend(self.created_at)
+            self.idle.clear()
+            self.created_at.clear()
+            self.closed = True
+
+    def close(self):
+        with self.cond:
+            self.closed = True
+            idle = [conn for conn, _, _ in self.idle]
+            self.idle.clear()
+            self.cond.notify_all()
+        for conn in idle:
+            self.discard(conn)
+
+    def stats(self):
+        with self.cond:
+            return {"in_use": self.in_use,
+                    "idle": len(self.idle),
+                    "waiting": self.waiting,
+                    "size": self.size,
+                    "min_size": self.min_size,
+                    "max_size": self.max_size,
+                    "opened": self.opened,
+                    "recycled": self.recycled,
+                    "failed_pings": self.failed_pings}
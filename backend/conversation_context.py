@@ -0,0 +1,50 @@
+import os
+import re
+from example_library import approx_tokens
+
+# Compact memory of earlier turns for the breakdown prompt. Each turn is
+# summarized once, when it is recorded, into the facts a follow-up question
+# can refer back to (query type, entities, filters and a short answer), and
+# the newest summaries that fit CONTEXT_TOKEN_BUDGET become the chat history.
+
+CONTEXT_TOKEN_BUDGET = int(os.getenv('CONTEXT_TOKEN_BUDGET', 300))
+FIELD_MAX_CHARS = 160
+ANSWER_MAX_CHARS = 120
+
+def breakdown_field(breakdown, label):
+    match = re.search(rf"^\s*-\s*{label}[^:\n]*:\s*(.+)$", breakdown, flags=re.IGNORECASE | re.MULTILINE)
+    return match.group(1).strip() if match else None
+
+def shorten(text, limit):
+    text = re.sub(r"\s+", " ", text).strip()
+    return text if len(text) <= limit else text[:limit].rsplit(" ", 1)[0] + " …"
+
+def summarize_turn(query, breakdown = None, response = None, error = None):
+###   One-line structured summary of a turn
+    parts = [f"User: {shorten(query, FIELD_MAX_CHARS)}"]
+    if breakdown:
+        querytype = re.search(r"\$\$(.*?)\$\$", breakdown)
+        if querytype:
+            parts.append(f"Type: {querytype.group(1).strip()}")
+        for label, name in (("Key entities", "Entities"), ("Filters", "Filters")):
+            value = breakdown_field(breakdown, label)
+            if value:
+                parts.append(f"{name}: {shorten(value.replace('***', '').replace('$$', ''), FIELD_MAX_CHARS)}")
+    answer = response or error
+    if answer:
+        # the first sentence is enough for "what about him?" follow-ups
+        first = re.split(r"(?<=[.!?])\s", answer.strip(), maxsplit=1)[0]
+        parts.append(f"Answer: {shorten(first, ANSWER_MAX_CHARS)}")
+    return " | ".join(parts)
+
+def build_context(summaries, budget = CONTEXT_TOKEN_BUDGET):
+###   Newest summaries that fit the token budget, oldest first
+    chosen = []
+    used = 0
+    for summary in reversed(summaries):
+        cost = approx_tokens(summary) + 1
+        if chosen and used + cost > budget:
+            break
+        chosen.append(summary)
+        used += cost
+    return "\n".join(reversed(chosen))
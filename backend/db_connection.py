@@ -1,66 +1,252 @@
-import psycopg2
-from psycopg2 import pool
 # from config import Config
+from connection_pool import ConnectionPool
+import psycopg2
+from cache import create_cache, set_generation_source
+from sql_tools import canonicalize_sql, guard_query
+from contextlib import contextmanager
 import os
+import sys
 import threading
+import time as tm
 
 # Global connection pool
 connection_pool = None
 pool_lock = threading.Lock()
+POOL_MIN_CONN = int(os.getenv('DB_POOL_MIN', 2))
+POOL_MAX_CONN = int(os.getenv('DB_POOL_MAX', 10))
+POOL_MAX_AGE = float(os.getenv('DB_POOL_MAX_AGE', 1800))
+POOL_PING_AFTER = float(os.getenv('DB_POOL_PING_AFTER', 30))
+POOL_IDLE_TIMEOUT = float(os.getenv('DB_POOL_IDLE_TIMEOUT', 300))
+POOL_GROW_WAIT = float(os.getenv('DB_POOL_GROW_WAIT_MS', 50)) / 1000
+LEASE_TIMEOUT = float(os.getenv('DB_LEASE_TIMEOUT', 10))
+
+class LeaseMetrics:
+###   Lease duration, wait time and exhaustion counters for the pool
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.leases = 0
+        self.exhausted = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.lease_total = 0.0
+        self.lease_max = 0.0
+
+    def record_wait(self, waited, had_to_wait):
+        with self.lock:
+            self.wait_total += waited
+            self.wait_max = max(self.wait_max, waited)
+            if had_to_wait:
+                self.exhausted += 1
+
+    def record_lease(self, held):
+        with self.lock:
+            self.leases += 1
+            self.lease_total += held
+            self.lease_max = max(self.lease_max, held)
+
+    def snapshot(self):
+        with self.lock:
+            return {"leases": self.leases,
+                    "exhausted": self.exhausted,
+                    "timeouts": self.timeouts,
+                    "avg_wait_ms": 1000 * self.wait_total / self.leases if self.leases else 0.0,
+                    "max_wait_ms": 1000 * self.wait_max,
+                    "avg_lease_ms": 1000 * self.lease_total / self.leases if self.leases else 0.0,
+                    "max_lease_ms": 1000 * self.lease_max}
+
+lease_metrics = LeaseMetrics()
+
+# hard caps for a single query result; the LLM's LIMIT is not trusted
+FETCH_MAX_ROWS = int(os.getenv('FETCH_MAX_ROWS', 1000))
+FETCH_MAX_BYTES = int(os.getenv('FETCH_MAX_BYTES', 4 * 1024 * 1024))
+FETCH_BATCH_SIZE = int(os.getenv('FETCH_BATCH_SIZE', 200))
+STATEMENT_TIMEOUT_MS = int(os.getenv('STATEMENT_TIMEOUT_MS', 10000))
+
+# EXPLAIN-based guard in front of LLM SQL
+GUARD_MAX_COST = float(os.getenv('SQL_GUARD_MAX_COST', 500000))
+# largest row estimate allowed at any plan node; five seasons of box scores are ~170k rows
+GUARD_MAX_ROWS = int(os.getenv('SQL_GUARD_MAX_ROWS', 1000000))
+
+# result sets keyed by canonicalized SQL, dropped by the ETL after each upsert
+result_cache = create_cache('results',
+                            max_entries=int(os.getenv('RESULT_CACHE_SIZE', 1024)),
+                            ttl=int(os.getenv('RESULT_CACHE_TTL', 6 * 3600)),
+                            max_bytes=int(os.getenv('RESULT_CACHE_BYTES', 64 * 1024 * 1024)))
 
-def initialize_connection_pool(min_conn=2, max_conn=10):
-###   Initialize connection pool if it doesn't exist
+def connection_params():
+    return dict(host=os.getenv('DATABASE_HOST'),
+                port=6543,
+                user='postgres.ekmdbikjwlbqyoqjhkks',
+                password=os.getenv('DATABASE_PASSWORD'),
+                dbname='postgres',
+                sslmode='require')
+
+def initialize_connection_pool(min_conn=POOL_MIN_CONN, max_conn=POOL_MAX_CONN, warm=False):
+###   Initialize connection pool if it doesn't exist; warm opens min_conn connections up front
     global connection_pool
     
     with pool_lock:
         if connection_pool is None:
-            connection_pool = pool.ThreadedConnectionPool(
-                minconn=min_conn,
-                maxconn=max_conn,
-                host=os.getenv('DATABASE_HOST'),
-                port=6543,
-                user='postgres.ekmdbikjwlbqyoqjhkks',
-                password=os.getenv('DATABASE_PASSWORD'),
-                database='postgres',
-                sslmode='require'
-            )
+            connection_pool = ConnectionPool(connection_params(),
+                                             min_size=min_conn,
+                                             max_size=max_conn,
+                                             max_age=POOL_MAX_AGE,
+                                             ping_after=POOL_PING_AFTER,
+                                             idle_timeout=POOL_IDLE_TIMEOUT,
+                                             grow_wait=POOL_GROW_WAIT)
+    if warm:
+        connection_pool.warm()
     return connection_pool
 
+def reset_after_fork():
+###   A pre-forking server copies the parent's pool into every worker; start the child with a fresh one
+    global connection_pool, pool_lock
+    pool_lock = threading.Lock()
+    if connection_pool is not None:
+        connection_pool.abandon()
+        connection_pool = None
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=reset_after_fork)
+
 def get_connection():
-    global connection_pool
-    if connection_pool is None:
-        initialize_connection_pool()
-    
-    return connection_pool.getconn()
+    conn, _ = initialize_connection_pool().acquire(LEASE_TIMEOUT)
+    return conn
 
 def release_connection(conn):
     global connection_pool
     if connection_pool is not None and conn is not None:
-        connection_pool.putconn(conn)
+        connection_pool.release(conn)
 
-def get_data_text(query, conn=None):
-###   Execute query and return the results, with automatic connection management
-    connection_provided = conn is not None
-    
+def pool_stats():
+###   Pool gauges (in_use, idle, waiting, size) together with the lease timings
+    gauges = connection_pool.stats() if connection_pool is not None else {"in_use": 0, "idle": 0, "waiting": 0, "size": 0}
+    return {**gauges, **lease_metrics.snapshot()}
+
+def row_size(row):
+    return sys.getsizeof(row) + sum(sys.getsizeof(val) for val in row)
+
+def fetch_bounded(cursor, max_rows, max_bytes, batch_size):
+###   Pull rows in fetchmany batches until the result ends or a cap is hit.
+###   Returns (rows, truncated).
+    rows = []
+    total_bytes = 0
+    while True:
+        batch = cursor.fetchmany(batch_size)
+        if not batch:
+            return rows, False
+        for row in batch:
+            total_bytes += row_size(row)
+            if len(rows) >= max_rows or total_bytes > max_bytes:
+                return rows, True
+            rows.append(row)
+
+@contextmanager
+def lease_connection(timeout=LEASE_TIMEOUT):
+###   Check a connection out for the duration of a with-block only. Waits up to
+###   timeout seconds for a free connection when the pool is at its limit.
+    pool = initialize_connection_pool()
+    start = tm.perf_counter()
+    try:
+        conn, had_to_wait = pool.acquire(timeout)
+    except TimeoutError:
+        with lease_metrics.lock:
+            lease_metrics.timeouts += 1
+        raise
+    lease_metrics.record_wait(tm.perf_counter() - start, had_to_wait)
+    leased_at = tm.perf_counter()
     try:
-        if not connection_provided:
-            conn = get_connection()
-        
-        cursor = conn.cursor()
-        cursor.execute(query)
+        yield conn
+    finally:
+        lease_metrics.record_lease(tm.perf_counter() - leased_at)
+        pool.release(conn)
+
+def run_bounded_query(query, conn, max_rows, max_bytes, timeout_ms, guard):
+###   Guard and execute query on conn; returns (columns, rows, truncated, error)
+    try:
+        with conn.cursor() as setup:
+            # SET LOCAL only lasts until the rollback below, so pooled connections stay clean
+            setup.execute("SET LOCAL statement_timeout = %s", (int(timeout_ms),))
+            if guard:
+                # LIMIT one row past the fetch cap, so fetch_bounded can tell the result was cut off
+                query, rejection = guard_query(query, setup, GUARD_MAX_COST, GUARD_MAX_ROWS, max_rows + 1)
+                if rejection:
+                    return [], [], False, rejection
+        cursor = conn.cursor(name="bounded_fetch")
+        cursor.execute(query.strip().rstrip(";"))
+        rows, truncated = fetch_bounded(cursor, max_rows, max_bytes, FETCH_BATCH_SIZE)
         columns = [desc[0] for desc in cursor.description]
-        rows = cursor.fetchall()
-        return columns, rows, None
+        cursor.close()
+        if truncated:
+            print(f"Result truncated at {len(rows)} rows")
+        return columns, rows, truncated, None
     except Exception as e:
-        return [], [], str(e)
+        return [], [], False, str(e)
     finally:
-        if conn is not None and not connection_provided:
-            release_connection(conn)
+        # queries are read-only; end the transaction so the server-side cursor,
+        # the timeout and any aborted state don't leak into the next lease
+        try:
+            conn.rollback()
+        except Exception:
+            pass
+
+def get_data_text(query, conn=None, use_cache=True, max_rows=FETCH_MAX_ROWS, max_bytes=FETCH_MAX_BYTES,
+                  timeout_ms=STATEMENT_TIMEOUT_MS, guard=True):
+###   Execute query and return (columns, rows, truncated, error), with automatic connection management.
+###   Rows stream from a server-side cursor and stop at max_rows/max_bytes; the
+###   statement is cancelled by Postgres after timeout_ms. With guard, the SQL is
+###   LIMIT-bounded and EXPLAINed first, and expensive plans never run.
+    if use_cache:
+        cache_key = canonicalize_sql(query)
+        cached = result_cache.get(cache_key)
+        if cached is not None:
+            columns, rows, truncated = cached
+            return columns, rows, truncated, None
+
+    if conn is not None:
+        result = run_bounded_query(query, conn, max_rows, max_bytes, timeout_ms, guard)
+    else:
+        # lease a connection only for as long as the SQL runs
+        try:
+            with lease_connection() as conn:
+                result = run_bounded_query(query, conn, max_rows, max_bytes, timeout_ms, guard)
+        except Exception as e:
+            result = [], [], False, str(e)
+
+    columns, rows, truncated, error = result
+    if use_cache and error is None:
+        result_cache.set(cache_key, (columns, rows, truncated))
+    return result
+
+def read_cache_generation():
+    with lease_connection(timeout=1) as conn:
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT generation FROM cache_generation WHERE id = 1")
+                row = cursor.fetchone()
+        except psycopg2.errors.UndefinedTable:
+            print("cache_generation is missing; apply sql/cache_generation.sql so the ETL can invalidate memory caches")
+            set_generation_source(None, None)
+            row = None
+        finally:
+            conn.rollback()
+    return row[0] if row else None
+
+def bump_cache_generation():
+    with lease_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute("UPDATE cache_generation SET generation = generation + 1 WHERE id = 1")
+        conn.commit()
+
+# memory caches in the web workers watch this; the ETL bumps it through invalidate_all
+if os.getenv('CACHE_BACKEND', 'memory').lower() == 'memory':
+    set_generation_source(read_cache_generation, bump_cache_generation)
 
 def close_all_connections():
     global connection_pool
     if connection_pool is not None:
-        connection_pool.closeall()
+        connection_pool.close()
         connection_pool = None
 
 
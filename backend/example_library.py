@@ -0,0 +1,82 @@
+import math
+import re
+from collections import Counter
+
+# Local BM25 index over the few-shot example questions. Examples are picked per
+# request by similarity to the query and breakdown instead of pasting a whole
+# category block, so the library can grow without growing every prompt.
+
+STOPWORDS = {"a", "an", "and", "are", "as", "at", "by", "did", "do", "does", "for", "from", "has", "have",
+             "how", "in", "is", "it", "its", "of", "on", "or", "the", "their", "them", "this", "to", "was",
+             "were", "what", "which", "who", "with", "query", "type", "key", "entities", "filters",
+             "conditions", "output", "variables", "calculation", "components", "e", "g"}
+
+def tokenize(text):
+    return [t for t in re.findall(r"[a-z0-9%]+", text.lower()) if t not in STOPWORDS]
+
+def approx_tokens(text):
+    return len(text) // 4
+
+def parse_examples(block):
+###   Split an examples block into (question, sql) pairs
+    pairs = []
+    for chunk in block.split("Example User Query:")[1:]:
+        question, _, sql = chunk.partition("Example Output:")
+        pairs.append((question.strip(), sql.strip()))
+    return pairs
+
+def example_tables(sql):
+###   Tables an example reads, not counting its own CTEs
+    tables = set(re.findall(r"\b(?:FROM|JOIN)\s+([a-z_0-9]+)(?![\w.])", sql, flags=re.IGNORECASE))
+    ctes = set(re.findall(r"(?:\bWITH|,)\s*([a-z_0-9]+)\s+AS\s*\(", sql, flags=re.IGNORECASE))
+    return tables - ctes
+
+class ExampleLibrary:
+    def __init__(self, blocks, k1=1.5, b=0.75, category_boost=2.0):
+        self.k1 = k1
+        self.b = b
+        self.category_boost = category_boost
+        self.examples = []
+        for category, block in blocks.items():
+            for question, sql in parse_examples(block):
+                self.examples.append({"category": category,
+                                      "question": question,
+                                      "sql": sql,
+                                      "text": f"Example User Query: {question}\nExample Output: {sql}\n",
+                                      "terms": Counter(tokenize(question)),
+                                      "tables": example_tables(sql)})
+        self.avg_length = sum(sum(e["terms"].values()) for e in self.examples) / max(len(self.examples), 1)
+        doc_freq = Counter(term for e in self.examples for term in e["terms"])
+        n = len(self.examples)
+        self.idf = {term: math.log(1 + (n - df + 0.5) / (df + 0.5)) for term, df in doc_freq.items()}
+
+    def score(self, terms, example):
+        length = sum(example["terms"].values())
+        total = 0.0
+        for term in terms:
+            tf = example["terms"].get(term)
+            if tf:
+                total += self.idf[term] * tf * (self.k1 + 1) / (tf + self.k1 * (1 - self.b + self.b * length / self.avg_length))
+        return total
+
+    def select(self, query, querybreakdown, querytype=None, allowed_tables=None, k=4, token_budget=1800):
+###   Top-k examples most similar to the query and breakdown, within the token budget.
+###   Examples reading tables outside allowed_tables (the pruned schema) are skipped.
+        terms = set(tokenize(f"{query} {querybreakdown}"))
+        candidates = [e for e in self.examples
+                      if allowed_tables is None or e["tables"] <= set(allowed_tables)]
+        ranked = sorted(candidates,
+                        key=lambda e: self.score(terms, e) + (self.category_boost if e["category"] == querytype else 0.0),
+                        reverse=True)
+        chosen = []
+        used = 0
+        for example in ranked:
+            cost = approx_tokens(example["text"])
+            # always keep the best match, even if it alone exceeds the budget
+            if chosen and used + cost > token_budget:
+                continue
+            chosen.append(example)
+            used += cost
+            if len(chosen) == k:
+                break
+        return "\n" + "\n".join(e["text"] for e in chosen)
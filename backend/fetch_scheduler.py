@@ -0,0 +1,119 @@
+import json
+import random
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import requests
+    REQUEST_ERRORS = (requests.exceptions.Timeout, requests.exceptions.ConnectionError)
+except ImportError:
+    REQUEST_ERRORS = ()
+
+# Shared scheduler for calls to stats.nba.com. Every HTTP request takes a token
+# from one bucket, so the worker threads together never exceed the rate. The
+# rate halves when the API pushes back (429s, timeouts, empty bodies) and
+# climbs back toward max_rate as requests succeed.
+
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+def is_retryable(exc):
+    if isinstance(exc, REQUEST_ERRORS + (TimeoutError, socket.timeout, ConnectionError, json.JSONDecodeError)):
+        return True
+    # requests.HTTPError carries .response, urllib's HTTPError carries .code
+    response = getattr(exc, "response", None)
+    status = getattr(response, "status_code", None) or getattr(exc, "code", None)
+    return status in RETRY_STATUS
+
+class TokenBucket:
+###   Token bucket whose refill rate moves between min_rate and max_rate (AIMD)
+    def __init__(self, max_rate, burst=1, min_rate=0.1, increase=0.05, decrease=0.5):
+        # increase is a fraction of max_rate, so a halved rate is back in ~10 successes
+        self.max_rate = max_rate
+        self.min_rate = min_rate
+        self.rate = max_rate
+        self.burst = burst
+        self.increase = increase
+        self.decrease = decrease
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def throttle(self):
+        with self.lock:
+            self._refill(time.monotonic())
+            self.rate = max(self.min_rate, self.rate * self.decrease)
+            # drop the saved-up burst too, or the next few calls hit the limit again
+            self.tokens = min(self.tokens, 0)
+
+    def recover(self):
+        with self.lock:
+            self._refill(time.monotonic())
+            self.rate = min(self.max_rate, self.rate + self.increase * self.max_rate)
+
+class FetchScheduler:
+    def __init__(self, rate=2.0, burst=2, workers=4, retries=5, base_backoff=1.0, max_backoff=60.0):
+        self.bucket = TokenBucket(rate, burst=burst)
+        self.workers = workers
+        self.retries = retries
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.stats_lock = threading.Lock()
+        self.requests = 0
+        self.throttled = 0
+
+    def call(self, fn, *args, **kwargs):
+###   Run one HTTP request under the rate limit, retrying pushback with jittered exponential backoff
+        for attempt in range(self.retries + 1):
+            self.bucket.acquire()
+            with self.stats_lock:
+                self.requests += 1
+            try:
+                result = fn(*args, **kwargs)
+            except Exception as e:
+                if attempt == self.retries or not is_retryable(e):
+                    raise
+                self.bucket.throttle()
+                with self.stats_lock:
+                    self.throttled += 1
+                # full jitter keeps the workers from retrying in lockstep
+                delay = random.uniform(0, min(self.max_backoff, self.base_backoff * 2 ** attempt))
+                print(f"Upstream pushback ({e.__class__.__name__}), retrying in {delay:.1f}s at {self.bucket.rate:.2f} req/s")
+                time.sleep(delay)
+                continue
+            self.bucket.recover()
+            return result
+
+    def map(self, fn, items, progress_every=None):
+###   fn over items on the worker pool, results in input order
+        items = list(items)
+        results = [None] * len(items)
+        done = 0
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            futures = {pool.submit(fn, item): i for i, item in enumerate(items)}
+            for future in futures:
+                results[futures[future]] = future.result()
+                done += 1
+                if progress_every and done % progress_every == 0:
+                    print(f"Fetched {done}/{len(items)}")
+        return results
+
+    def stats(self):
+        with self.stats_lock:
+            return {"requests": self.requests, "throttled": self.throttled, "rate": self.bucket.rate}
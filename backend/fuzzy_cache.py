@@ -1,63 +1,264 @@
 import threading
-from db_connection import get_connection, release_connection
+from db_connection import lease_connection, connection_params
+import psycopg2
+import datetime
+from collections import namedtuple
+import select
 import time
-from rapidfuzz import process, fuzz
+import os
+from rapidfuzz import process, fuzz, utils
+import unicodedata
 import re
 
+NAME_PATTERN = re.compile(r"\*\*\*(.*?)\*\*\*")
+
+# LISTEN needs a session, which the transaction-mode pooler on 6543 can't hold
+LISTEN_PORT = int(os.getenv('DATABASE_LISTEN_PORT', 5432))
+NOTIFY_CHANNEL = 'players_changed'
+# set on hosts where the ETL runs next to the web workers; helpers.update_data touches it
+SIGNAL_FILE = os.getenv('PLAYER_SIGNAL_FILE')
+# re-read rows a little older than the watermark: updated_at is the writer's
+# transaction start, which can commit after a later-stamped row was already read
+WATERMARK_OVERLAP = datetime.timedelta(seconds=60)
+
+def name_tokens(name):
+###   Lowercase, accent-free name tokens ("Nikola Jokić" -> ["nikola", "jokic"])
+    ascii_name = unicodedata.normalize("NFKD", name).encode("ascii", "ignore").decode()
+    return re.findall(r"[a-z0-9]+", ascii_name.lower())
+
+SOUNDEX_CODES = {**dict.fromkeys("bfpv", "1"), **dict.fromkeys("cgjkqsxz", "2"), **dict.fromkeys("dt", "3"),
+                 "l": "4", **dict.fromkeys("mn", "5"), "r": "6"}
+
+def phonetic_key(token):
+###   Soundex code, so "jokich" and "jokic" or "antetokounmpo" and "antetokoumpo" share a bucket
+    if not token or not token[0].isalpha():
+        return None
+    code = token[0]
+    last = SOUNDEX_CODES.get(token[0], "")
+    for ch in token[1:]:
+        digit = SOUNDEX_CODES.get(ch, "")
+        if digit and digit != last:
+            code += digit
+        # h and w don't separate repeated codes, vowels do
+        if ch not in "hw":
+            last = digit
+    return (code + "000")[:4]
+
+# Everything a reader needs, published as one object. Apart from its memo a
+# snapshot is never modified after it is built, so readers grab self.snapshot
+# once and never lock.
+#   names: tuple of player names; keys: the same names after rapidfuzz's default_process
+#   name_set: frozenset of names; index: token or "#soundex" -> tuple of positions in names
+#   memo: raw misspelling -> resolved name, valid only for this name list
+NameSnapshot = namedtuple("NameSnapshot", ["names", "keys", "name_set", "index", "memo"])
+
+def index_keys(tokens):
+    keys = set(tokens)
+    keys.update("#" + key for key in map(phonetic_key, tokens) if key)
+    return keys
+
 class FuzzyCache:
-    def __init__(self, cache_size: int = 1000, max_cache_age: int = 3600):
-        self.player_names = []
-        self.player_name_set = set()
-        self.cache_lock = threading.Lock()
+    def __init__(self, cache_size: int = 1000, max_cache_age: int = 3600, auto_refresh: bool = True):
+        self.snapshot = self.build_snapshot([])
+        self.cache_size = cache_size
+        # player_id -> name and the largest updated_at seen, for incremental refresh
+        self.players = {}
+        self.watermark = None
+        # serializes writers only; readers never take it
+        self.refresh_lock = threading.Lock()
         self.max_cache_age = max_cache_age
-        self.start_background_refresh()
+        # set to make the refresh loop run now instead of at the next max_cache_age poll
+        self.wake = threading.Event()
+        if auto_refresh:
+            self.start_background_refresh()
 
-    def fetch_player_names(self):
-        conn = None
-        try:
-            conn = get_connection()
+    def fetch_players(self, since=None):
+###   (player_id, player_name, updated_at) rows, only those updated after since when given
+        with lease_connection() as conn:
             cursor = conn.cursor()
-            cursor.execute("SELECT player_name FROM players")
-            names = [row[0] for row in cursor.fetchall()]
-            return names
-        finally:
-            if conn:
-                release_connection(conn)
+            try:
+                if since is None:
+                    cursor.execute("SELECT player_id, player_name, updated_at FROM players")
+                else:
+                    cursor.execute("SELECT player_id, player_name, updated_at FROM players WHERE updated_at > %s",
+                                   (since - WATERMARK_OVERLAP,))
+            except psycopg2.errors.UndefinedColumn:
+                # sql/player_changes.sql not applied yet: no watermark, so every refresh is a full read
+                conn.rollback()
+                print("players.updated_at is missing; apply sql/player_changes.sql for incremental refresh")
+                cursor.execute("SELECT player_id, player_name, NULL FROM players")
+            rows = cursor.fetchall()
+            cursor.close()
+            return rows
+
+    @property
+    def player_names(self):
+        return self.snapshot.names
+
+    @property
+    def player_name_set(self):
+        return self.snapshot.name_set
+
+    def build_snapshot(self, names):
+        index = {}
+        for i, name in enumerate(names):
+            for key in index_keys(name_tokens(name)):
+                index.setdefault(key, []).append(i)
+        return NameSnapshot(names=tuple(names),
+                            keys=[utils.default_process(name) for name in names],
+                            name_set=frozenset(names),
+                            index={key: tuple(ids) for key, ids in index.items()},
+                            memo={})
+
+    def load(self, names):
+###   Build a snapshot for a new name list and publish it with a single assignment
+        snapshot = self.build_snapshot(names)
+        self.snapshot = snapshot
+        self.last_refresh = time.time()
 
     def refresh(self):
-        names = self.fetch_player_names()
-        with self.cache_lock:
-            self.player_names = names
-            self.player_name_set = set(names)
-            self.last_refresh = time.time()
+###   Apply players changed since the watermark; the first call reads the whole table.
+###   The index is rebuilt from memory, and only when a name was added or renamed.
+        with self.refresh_lock:
+            self._refresh()
+
+    def _refresh(self):
+        rows = self.fetch_players(self.watermark)
+        changed = False
+        for player_id, name, updated_at in rows:
+            if self.players.get(player_id) != name:
+                self.players[player_id] = name
+                changed = True
+            if updated_at is not None and (self.watermark is None or updated_at > self.watermark):
+                self.watermark = updated_at
+        if changed or not self.player_names:
+            self.load(list(dict.fromkeys(self.players.values())))
+            print(f"FuzzyCache refreshed: {len(rows)} rows read, {len(self.players)} players")
 
     def start_background_refresh(self):
+###   One thread loads the names and re-polls every max_cache_age through the pool; a second
+###   only listens for changes and wakes it early, so a listener that can't connect never
+###   leaves the cache empty or stale for longer than max_cache_age
         def refresh_loop():
+            loaded = False
             while True:
-                self.refresh()
-                time.sleep(self.max_cache_age)
+                # until the first load succeeds, retry every 5s instead of waiting out max_cache_age
+                self.wake.wait(self.max_cache_age if loaded else 5)
+                self.wake.clear()
+                try:
+                    self.refresh()
+                    loaded = True
+                except Exception as e:
+                    print(f"FuzzyCache refresh error: {e}")
+
+        def change_loop():
+            delay = 5
+            while True:
+                try:
+                    if SIGNAL_FILE:
+                        self.watch_signal_file()
+                    else:
+                        self.listen_for_changes()
+                    delay = 5
+                except Exception as e:
+                    print(f"FuzzyCache change listener error (polling continues every {self.max_cache_age}s): {e}")
+                time.sleep(delay)
+                delay = min(delay * 2, 300)
+
+        self.wake.set()
         threading.Thread(target=refresh_loop, daemon=True).start()
+        threading.Thread(target=change_loop, daemon=True).start()
+
+    def listen_for_changes(self):
+###   Wake the refresh loop on every players_changed NOTIFY
+        conn = psycopg2.connect(**{**connection_params(), "port": LISTEN_PORT})
+        try:
+            conn.autocommit = True
+            with conn.cursor() as cursor:
+                cursor.execute(f"LISTEN {NOTIFY_CHANNEL}")
+            # catch up on anything written while no listener was connected
+            self.wake.set()
+            while True:
+                if select.select([conn], [], [], 60) != ([], [], []):
+                    conn.poll()
+                    # one refresh covers a whole burst of notifications
+                    conn.notifies.clear()
+                    self.wake.set()
+        finally:
+            conn.close()
+
+    def watch_signal_file(self, interval=1.0):
+###   Wake the refresh loop whenever SIGNAL_FILE's mtime moves
+        seen = os.path.getmtime(SIGNAL_FILE) if os.path.exists(SIGNAL_FILE) else None
+        while True:
+            time.sleep(interval)
+            mtime = os.path.getmtime(SIGNAL_FILE) if os.path.exists(SIGNAL_FILE) else None
+            if mtime != seen:
+                seen = mtime
+                self.wake.set()
+
+    def candidates(self, name, index):
+###   Indexes of names sharing a token or a phonetic key with name
+        found = set()
+        for key in index_keys(name_tokens(name)):
+            found.update(index.get(key, ()))
+        return found
+
+    def match_names(self, names, threshold=80):
+###   Resolve a batch of raw names with one rapidfuzz cdist call. Exact names and
+###   memoized misspellings skip scoring; the rest are scored against the union of
+###   their index candidates, and only names with no good candidate get a full scan.
+        snapshot = self.snapshot
+
+        resolved = {}
+        pending = []
+        for name in dict.fromkeys(names):
+            if name in snapshot.name_set:
+                resolved[name] = name
+                continue
+            # one lookup: another thread may clear the memo between a check and a read
+            hit = snapshot.memo.get(name)
+            if hit is not None:
+                resolved[name] = hit
+            else:
+                pending.append(name)
+        if not pending or not snapshot.names:
+            return {name: resolved.get(name, name) for name in names}
+
+        queries = [utils.default_process(name) for name in pending]
+        candidate_sets = [self.candidates(name, snapshot.index) for name in pending]
+        choice_ids = sorted(set().union(*candidate_sets))
+        unmatched = list(range(len(pending)))
+        if choice_ids:
+            unmatched = []
+            scores = process.cdist(queries, [snapshot.keys[i] for i in choice_ids], scorer=fuzz.ratio)
+            for q, row in enumerate(scores):
+                best = int(row.argmax())
+                if row[best] >= threshold:
+                    resolved[pending[q]] = snapshot.names[choice_ids[best]]
+                else:
+                    unmatched.append(q)
+        # typos that split or merge tokens ("Lebron Jame s") miss the index; scan everything for those
+        if unmatched:
+            scores = process.cdist([queries[q] for q in unmatched], snapshot.keys, scorer=fuzz.ratio)
+            for q, row in zip(unmatched, scores):
+                best = int(row.argmax())
+                resolved[pending[q]] = snapshot.names[best] if row[best] >= threshold else pending[q]
+
+        # plain dict writes are atomic; a full memo just starts over
+        if len(snapshot.memo) >= self.cache_size:
+            snapshot.memo.clear()
+        for name in pending:
+            snapshot.memo[name] = resolved[name]
+        return {name: resolved[name] for name in names}
 
- 
     def fuzzy_match(self, name, threshold=80):
-        if name in self.player_name_set:
-            return name
-
-        best_match = process.extractOne(name, self.player_names, scorer=fuzz.ratio)
-        if best_match and best_match[1] >= threshold:
-            return best_match[0]
-        return name
-        
+        return self.match_names([name], threshold)[name]
+
     def correct_names(self, text):
-        pattern = re.compile(r"\*\*\*(.*?)\*\*\*")
+        corrected = self.match_names(NAME_PATTERN.findall(text))
 
         def _repl(match: re.Match) -> str:
-            raw_name = match.group(1)
-            with self.cache_lock:
-                corrected = self.fuzzy_match(raw_name)
-            return f"***{corrected}***"
-
-        return pattern.sub(_repl, text)
+            return f"***{corrected[match.group(1)]}***"
 
-    
-            
\ No newline at end of file
+        return NAME_PATTERN.sub(_repl, text)
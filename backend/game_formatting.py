@@ -0,0 +1,57 @@
+import numpy as np
+import pandas as pd
+
+# DataFrame shaping for the ETL, kept apart from helpers.py so it can run (and
+# be benchmarked) without nba_api or Supabase. Everything here is column-wise:
+# no per-row Python lambdas.
+
+def playoff_game_parts(game_ids):
+###   (round, game number) from a game id like 0042400213: third digit 4 marks the playoffs
+    ids = game_ids.astype(str)
+    playoff = ids.str[2] == '4'
+    playoff_round = np.where(playoff, pd.to_numeric(ids.str[-3], errors='coerce'), 0).astype('int64')
+    game_num = np.where(playoff, pd.to_numeric(ids.str[-1], errors='coerce'), 0).astype('int64')
+    return playoff_round, game_num
+
+def format_games_table(df):
+###   One row per game from TeamGameLog rows (one per team per game)
+    matchup_split = df['MATCHUP'].str.split()
+    is_home = (matchup_split.str[1] == 'vs.').to_numpy()
+    df['home_team'] = np.where(is_home, matchup_split.str[0], matchup_split.str[2])
+    df['away_team'] = np.where(is_home, matchup_split.str[2], matchup_split.str[0])
+    keys = ['Game_ID', 'GAME_DATE', 'home_team', 'away_team', 'SEASON_ID', 'SEASON_TYPE']
+    # each game's home row carries the home score, its away row the away score
+    home = df.loc[is_home, keys + ['PTS']].rename(columns={'PTS': 'home_score'})
+    away = df.loc[~is_home, keys + ['PTS']].rename(columns={'PTS': 'away_score'})
+    grouped = home.merge(away, on=keys, how='outer').sort_values(keys, ignore_index=True)
+    grouped['GAME_DATE'] = pd.to_datetime(grouped['GAME_DATE'].str.title(), format='%b %d, %Y')
+    grouped['PLAYOFF_GAME_ROUND'], grouped['PLAYOFF_GAME_NUM'] = playoff_game_parts(grouped['Game_ID'])
+    return grouped
+
+def format_games_update(df):
+###   One row per game from ScoreboardV2 line scores (away team first, then home)
+    keys = ['GAME_ID', 'GAME_DATE_EST']
+    side = df.groupby(keys, sort=False).cumcount()
+    wide = df.assign(side=side).set_index(keys + ['side'])[['TEAM_ID', 'PTS']].unstack('side').sort_index()
+    # every game has a first row, so only the second side can come back NaN from unstack
+    grouped = pd.DataFrame({'GAME_ID': wide.index.get_level_values(0),
+                            'away_team': wide[('TEAM_ID', 0)].astype(df['TEAM_ID'].dtype).to_numpy(),
+                            'home_team': wide[('TEAM_ID', 1)].to_numpy(),
+                            'away_score': wide[('PTS', 0)].astype(df['PTS'].dtype).to_numpy(),
+                            'home_score': wide[('PTS', 1)].to_numpy()})
+    game_dates = pd.to_datetime(pd.Series(wide.index.get_level_values(1)))
+    grouped['GAME_DATE'] = game_dates.dt.date
+    ids = grouped['GAME_ID'].astype(str)
+    grouped['SEASON_TYPE'] = np.where(ids.str[2] == '2', 'Regular Season', 'Playoffs')
+    # seasons start in October: a 2025-01 game belongs to season 22024
+    grouped['SEASON_ID'] = np.where(game_dates.dt.month >= 10, game_dates.dt.year + 20000, game_dates.dt.year + 19999).astype('int64')
+    grouped['PLAYOFF_GAME_ROUND'], grouped['PLAYOFF_GAME_NUM'] = playoff_game_parts(grouped['GAME_ID'])
+    return grouped
+
+def parse_minutes(minutes):
+###   Whole minutes played from box-score MIN values like '34:12', '34.000000:12', '12.5', '12' or None
+    # a box score has a few thousand distinct values at most: parse each once, then gather by code
+    codes, uniques = pd.factorize(minutes)
+    whole = pd.Series(uniques, dtype=object).astype(str).str.extract(r'^(\d+)', expand=False).fillna('0').astype('int64')
+    # code -1 (missing) picks the trailing 0
+    return pd.Series(np.append(whole.to_numpy(), 0)[codes], index=minutes.index, name=minutes.name)
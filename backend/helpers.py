@@ -1,100 +1,99 @@
 import pandas as pd
-import numpy as np
 from nba_api.stats.endpoints import teamgamelog, boxscoreadvancedv2, boxscoretraditionalv2
 from nba_api.stats.endpoints import commonteamroster, scoreboardv2, commonplayerinfo
 import nba_api.stats.library.http as http
-import time
 import datetime
 import os
+import tempfile
 from supabase import create_client, Client
+from cache import invalidate_all
+from fetch_scheduler import FetchScheduler
+from response_cache import ResponseCache, ttl_for_date, ttl_for_season, payload_frames
+from backfill_checkpoint import BackfillCheckpoint, CHUNK_SIZE
+from bulk_loader import copy_upsert
+from game_formatting import format_games_table, format_games_update, parse_minutes
+from db_connection import lease_connection
 import warnings
 warnings.filterwarnings('ignore')
 
 SUPABASE_URL = os.getenv('SUPABASE_URL')
 SUPABASE_KEY = os.getenv('SUPABASE_KEY')
 
+# every stats.nba.com request goes through this one scheduler, so backfills
+# run as fast as NBA_API_RATE allows and slow down on their own when throttled
+nba_fetcher = FetchScheduler(rate = float(os.getenv('NBA_API_RATE', 2.0)),
+                             burst = int(os.getenv('NBA_API_BURST', 2)),
+                             workers = int(os.getenv('NBA_API_WORKERS', 4)),
+                             retries = int(os.getenv('NBA_API_RETRIES', 5)))
+# the temp dir is writable everywhere the ETL runs, including Lambda where the code directory is read-only
+nba_responses = ResponseCache(os.getenv('NBA_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'nba_cache')),
+                              offline = os.getenv('NBA_CACHE_OFFLINE', '0') == '1')
+PLAYER_INFO_TTL = 7 * 24 * 3600
+# 'rest' upserts through the Supabase API; 'copy' opts in to COPY + merge over a
+# direct Postgres connection (bulk_loader.py), which needs DATABASE_HOST/DATABASE_PASSWORD
+ETL_LOADER = os.getenv('ETL_LOADER', 'rest')
+BACKFILL_DIR = os.getenv('NBA_BACKFILL_DIR')
+
+def cached_frames(endpoint, ttl = None, **params):
+###   endpoint(**params).get_data_frames(), served from the on-disk response cache when possible
+    payload = nba_responses.fetch(endpoint.__name__, {k: str(v) for k, v in params.items()},
+                                  lambda: nba_fetcher.call(lambda: endpoint(**params).get_dict()), ttl)
+    return payload_frames(payload)
+
 TEAMIDS = [1610612737, 1610612738, 1610612739, 1610612740, 1610612741, 1610612742,
  1610612743, 1610612744, 1610612745, 1610612746, 1610612747, 1610612748,
  1610612749, 1610612750, 1610612751, 1610612752, 1610612753, 1610612754,
  1610612755, 1610612756, 1610612757, 1610612758, 1610612759, 1610612760,
  1610612761, 1610612762, 1610612763, 1610612764, 1610612765, 1610612766]
 
+def fetch_team_roster(team_season):
+    teamid, season = team_season
+    print(teamid, season)
+    try:
+        df = cached_frames(commonteamroster.CommonTeamRoster, ttl_for_season(season), team_id = teamid, season = season)[0]
+        return df[['PLAYER_ID', 'PLAYER', 'POSITION', 'HEIGHT', 'WEIGHT', 'SCHOOL']]
+    except Exception as e:
+        print(f"Error retrieving data for team {teamid} season {season}: {e}")
+        return None
+
 def build_players_table(teamids = TEAMIDS):
-    dfs = []
-    for teamid in teamids:
-        for i in range(5):
-            season = f'20{20 + i}-{21+i}'
-            print(teamid, season)
-            try:
-                df = commonteamroster.CommonTeamRoster(team_id = teamid, season = season).get_data_frames()[0]
-                dfs.append(df[['PLAYER_ID', 'PLAYER', 'POSITION', 'HEIGHT', 'WEIGHT', 'SCHOOL']])
-            except Exception as e:
-                print(f"Error retrieving data for team {teamid} season {season}: {e}")
-            time.sleep(1)
+    team_seasons = [(teamid, f'20{20 + i}-{21+i}') for teamid in teamids for i in range(5)]
+    dfs = nba_fetcher.map(fetch_team_roster, team_seasons)
     return pd.concat(dfs, ignore_index=True).drop_duplicates(subset = 'PLAYER_ID')
 
-def format_games_table(df):
-    matchup_split = df['MATCHUP'].str.split()
-    df['primary_team'] = matchup_split.str[0]
-    df['home_team'] = np.where(matchup_split.str[1] == 'vs.', matchup_split.str[0], matchup_split.str[2])
-    df['away_team'] = np.where(matchup_split.str[1] == 'vs.', matchup_split.str[2], matchup_split.str[0])
-    grouped = df.groupby(['Game_ID', 'GAME_DATE', 'home_team', 'away_team', 'SEASON_ID', 'SEASON_TYPE'], as_index = False).agg({'primary_team': lambda x: list(x),
-                                                                                                    'PTS': lambda x: list(x)})
-    grouped[['primary_team_0', 'primary_team_1']] = pd.DataFrame(grouped['primary_team'].tolist(), index=grouped.index)
-    grouped[['PTS_0', 'PTS_1']] = pd.DataFrame(grouped['PTS'].tolist(), index=grouped.index)
-    grouped['home_score'] = np.where(grouped['primary_team_0'] == grouped['home_team'], grouped['PTS_0'], grouped['PTS_1'])
-    grouped['away_score'] = np.where(grouped['primary_team_0'] == grouped['home_team'], grouped['PTS_1'], grouped['PTS_0'])
-    grouped['GAME_DATE'] = pd.to_datetime(grouped['GAME_DATE'].str.title())
-    grouped['PLAYOFF_GAME_ROUND'] = grouped['Game_ID'].astype(str).apply(lambda x: int(x[-3]) if x[2] == '4' else 0)
-    grouped['PLAYOFF_GAME_NUM'] = grouped['Game_ID'].astype(str).apply(lambda x: int(x[-1]) if x[2] == '4' else 0)
-    return grouped.drop(columns = ['PTS', 'primary_team', 'primary_team_0', 'primary_team_1', 'PTS_0', 'PTS_1'])
-
-def format_games_update(df):
-    grouped = df.groupby(['GAME_ID', 'GAME_DATE_EST'], as_index = False).agg({'TEAM_ID': lambda x: list(x), 'PTS': lambda x: list(x)})
-    grouped[['away_team', 'home_team']] = pd.DataFrame(grouped['TEAM_ID'].tolist(), index=grouped.index)
-    grouped[['away_score', 'home_score']] = pd.DataFrame(grouped['PTS'].tolist(), index=grouped.index)
-    grouped['GAME_DATE'] = grouped['GAME_DATE_EST'].apply(lambda x: datetime.datetime.fromisoformat(x).date())
-    grouped = grouped.drop(['TEAM_ID', 'PTS', 'GAME_DATE_EST'], axis = 1)
-    grouped['SEASON_TYPE'] = grouped['GAME_ID'].astype(str).apply(lambda x: 'Regular Season' if x[2] == '2' else 'Playoffs')
-    grouped['SEASON_ID'] = grouped['GAME_DATE'].apply(lambda x: x.year + 20000 if x.month >= 10 else (x.year + 19999))
-    grouped['PLAYOFF_GAME_ROUND'] = grouped['GAME_ID'].astype(str).apply(lambda x: int(x[-3]) if x[2] == '4' else 0)
-    grouped['PLAYOFF_GAME_NUM'] = grouped['GAME_ID'].astype(str).apply(lambda x: int(x[-1]) if x[2] == '4' else 0)
-    return grouped
+def fetch_scoreboard(game_date):
+    try:
+        df = cached_frames(scoreboardv2.ScoreboardV2, ttl_for_date(game_date), game_date = game_date)[1]
+        return format_games_update(df)
+    except Exception as e:
+        print(f"Error on {game_date}: {e}")
+        return None
 
 def update_games_table(start_date):
     today = datetime.date.today()
     current_date = datetime.datetime.strptime(start_date, "%Y-%m-%d").date()
-    dfs = []
-    while current_date <= today:
-        try:
-            df = scoreboardv2.ScoreboardV2(game_date=current_date).get_data_frames()[1]
-            df = format_games_update(df)
-            dfs.append(df)
-        except Exception as e:
-            print(f"Error on {current_date}: {e}")
-        current_date += datetime.timedelta(days=1)
-        time.sleep(2)
+    dates = [current_date + datetime.timedelta(days=i) for i in range((today - current_date).days + 1)]
+    dfs = nba_fetcher.map(fetch_scoreboard, dates)
     return pd.concat(dfs, ignore_index=True).rename(columns={'GAME_ID': 'Game_ID'})
 
-def fetch_game_stats_tables(game_id):
+def fetch_game_stats_tables(game_id, game_date = None):
+    ttl = ttl_for_date(game_date)
     try: 
-        bs_traditional = boxscoretraditionalv2.BoxScoreTraditionalV2(game_id=game_id).get_data_frames()
+        bs_traditional = cached_frames(boxscoretraditionalv2.BoxScoreTraditionalV2, ttl, game_id = game_id)
         df_traditional_player = bs_traditional[0][['GAME_ID', 'TEAM_ID', 'PLAYER_ID', 'PLAYER_NAME', 'MIN', 'FGM', 'FGA', 'FG3M', 'FG3A',
                 'FTM', 'FTA', 'OREB', 'REB', 'AST', 'STL', 'BLK', 'TO', 'PTS', 'PLUS_MINUS']]
-        df_traditional_player['MIN'] = df_traditional_player['MIN'].apply(lambda x: int(float(x.split(':')[0])) if x and ':' in x
-                                                                          else int(x.split('.')[0]) if x and '.' in x
-                                                                          else int(x) if x else 0)
+        df_traditional_player['MIN'] = parse_minutes(df_traditional_player['MIN'])
         df_traditional_team = bs_traditional[1][['GAME_ID', 'TEAM_ID', 'FGM', 'FGA', 'FG3M', 'FG3A',
                 'FTM', 'FTA', 'OREB', 'REB', 'AST', 'STL', 'BLK', 'TO', 'PTS', 'PLUS_MINUS']]
         
-        bs_advanced = boxscoreadvancedv2.BoxScoreAdvancedV2(game_id=game_id).get_data_frames()
+        bs_advanced = cached_frames(boxscoreadvancedv2.BoxScoreAdvancedV2, ttl, game_id = game_id)
         df_advanced_player = bs_advanced[0][['GAME_ID', 'TEAM_ID', 'PLAYER_ID', 'PLAYER_NAME', 'OFF_RATING', 'DEF_RATING', 
                  'OREB_PCT', 'REB_PCT', 'EFG_PCT',  'USG_PCT', 'PIE']]
         df_advanced_team = bs_advanced[1][['GAME_ID', 'TEAM_ID', 'OFF_RATING', 'DEF_RATING',  'OREB_PCT',
                         'REB_PCT', 'EFG_PCT', 'PACE']]
         df_player = pd.merge(df_traditional_player, df_advanced_player, on=['GAME_ID', 'TEAM_ID', 'PLAYER_ID', 'PLAYER_NAME'])
         keep_float_cols = ['OFF_RATING', 'DEF_RATING', 'OREB_PCT', 'REB_PCT', 'EFG_PCT', 'USG_PCT', 'PIE', 'PACE']
-        df_player['ENTERED_GAME'] = df_player['FGM'].apply(lambda x: 0 if pd.isna(x) else 1)
+        df_player['ENTERED_GAME'] = df_player['FGM'].notna().astype('int64')
         cols_to_convert = [col for col in df_player.select_dtypes(include='float64').columns if col not in keep_float_cols]
         df_player[cols_to_convert] = df_player[cols_to_convert].astype('Int64')
         df_player.fillna(0, inplace=True)
@@ -107,48 +106,73 @@ def fetch_game_stats_tables(game_id):
         print(f"Error retrieving data for game id {game_id}: {e}")
         return pd.DataFrame(), pd.DataFrame()
     
+def open_checkpoint(date, resume):
+###   Checkpoint for a date's backfill, or None: only kept for --resume or an explicit
+###   NBA_BACKFILL_DIR, and skipped when the directory can't be written
+    if not resume and not BACKFILL_DIR:
+        return None
+    directory = os.path.join(BACKFILL_DIR or os.path.join(tempfile.gettempdir(), 'nba_backfill'), date)
+    try:
+        return BackfillCheckpoint(directory, resume = resume)
+    except OSError as e:
+        print(f"Backfill checkpointing disabled, {directory} is not writable: {e}")
+        return None
+
+def stream_game_stats_tables(games_table, checkpoint = None, chunk_size = CHUNK_SIZE):
+###   (player stats, team stats) one chunk of games at a time. With a checkpoint each chunk
+###   is staged before it is yielded and only marked loaded once the caller asks for the next
+    if checkpoint is not None:
+        for chunk_id, game_ids in checkpoint.staged():
+            print(f"Reloading staged chunk {chunk_id} ({len(game_ids)} games)")
+            yield checkpoint.read(chunk_id)
+            checkpoint.mark_loaded(chunk_id)
+    games = list(zip(games_table['Game_ID'].tolist(), games_table['GAME_DATE'].tolist()))
+    if checkpoint is not None:
+        pending = set(checkpoint.pending([game_id for game_id, _ in games]))
+        games = [game for game in games if game[0] in pending]
+    for start in range(0, len(games), chunk_size):
+        chunk = games[start:start + chunk_size]
+        results = nba_fetcher.map(lambda game: fetch_game_stats_tables(*game), chunk)
+        df_player = pd.concat([df for df, _ in results], ignore_index=True)
+        df_team = pd.concat([df for _, df in results], ignore_index=True)
+        print(f"Fetched game stats for {start + len(chunk)}/{len(games)} games")
+        if checkpoint is None:
+            yield df_player, df_team
+            continue
+        # games that failed to fetch stay pending for the next --resume
+        fetched = [game_id for (game_id, _), (df, _) in zip(chunk, results) if not df.empty]
+        chunk_id = checkpoint.stage(fetched, df_player, df_team)
+        yield df_player, df_team
+        checkpoint.mark_loaded(chunk_id)
+
 def build_game_stats_tables(games_table):
-    game_ids = games_table['Game_ID'].tolist()
-    dfs_player = []
-    dfs_team = []
-    count = 0
-    for game_id in game_ids:
-        count += 1
-        if count % 10 == 0:
-            print(f"Fetching game stats for game {count}")
-        if count % 100 == 0:
-            print(f"Sleeping for 60 seconds...")
-            time.sleep(60)
-        df_player, df_team = fetch_game_stats_tables(game_id)
-        dfs_player.append(df_player)
-        dfs_team.append(df_team)
-        time.sleep(2)
-    player_game_stats = pd.concat(dfs_player, ignore_index=True)
-    team_game_stats = pd.concat(dfs_team, ignore_index=True)
+    chunks = list(stream_game_stats_tables(games_table))
+    player_game_stats = pd.concat([df for df, _ in chunks], ignore_index=True)
+    team_game_stats = pd.concat([df for _, df in chunks], ignore_index=True)
     return player_game_stats, team_game_stats
 
+def fetch_team_game_log(request):
+    teamid, i, season_type = request
+    season = f'20{20 + i}-{21+i}'
+    print(teamid, season, season_type)
+    try:
+        df = cached_frames(teamgamelog.TeamGameLog, ttl_for_season(season), team_id = teamid, season = season, season_type_all_star = season_type)[0]
+        df['SEASON_ID'] = 22020 + i
+        df['SEASON_TYPE'] = season_type
+        return df[['Game_ID', 'GAME_DATE', 'MATCHUP', 'PTS', 'SEASON_ID', 'SEASON_TYPE']]
+    except Exception as e:
+        print(f"Error retrieving data for team {teamid} season {season}: {e}")
+        return None
+
 def build_games_table(teamids = TEAMIDS):
-    dfs = []
-    for teamid in teamids:
-        for i in range(0, 5):
-            season = f'20{20 + i}-{21+i}'
-            print(teamid, season)
-            for season_type in ['Regular Season', 'Playoffs']:
-                try:
-                    df = teamgamelog.TeamGameLog(team_id = teamid, season = season, season_type_all_star=season_type).get_data_frames()[0]
-                    df['SEASON_ID'] = 22020 + i
-                    df['SEASON_TYPE'] = season_type
-                    dfs.append(df[['Game_ID', 'GAME_DATE', 'MATCHUP', 'PTS', 'SEASON_ID', 'SEASON_TYPE']])
-                except Exception as e:
-                    print(f"Error retrieving data for team {teamid} season {season}: {e}")
-                time.sleep(2)
-    df = pd.concat(dfs)
+    log_requests = [(teamid, i, season_type) for teamid in teamids for i in range(0, 5)
+                for season_type in ['Regular Season', 'Playoffs']]
+    df = pd.concat(nba_fetcher.map(fetch_team_game_log, log_requests))
     return format_games_table(df)
 
 def get_player_info(player_id):
     try:
-        player_info = commonplayerinfo.CommonPlayerInfo(player_id=player_id)
-        df = player_info.get_data_frames()[0]
+        df = cached_frames(commonplayerinfo.CommonPlayerInfo, PLAYER_INFO_TTL, player_id = player_id)[0]
         # print(df.columns)
         print(df['DISPLAY_FIRST_LAST'])
         details = df[['PERSON_ID', 'FIRST_NAME', 'LAST_NAME', 'DISPLAY_FIRST_LAST',
@@ -160,18 +184,32 @@ def get_player_info(player_id):
         return None
     
 def build_players_table(player_ids):
-    dfs = []
-    for player_id in player_ids:
-        df = get_player_info(player_id)
-        dfs.append(df)
-        time.sleep(2)
-    player_info = pd.concat(dfs, ignore_index=True)
+    player_info = pd.concat(nba_fetcher.map(get_player_info, player_ids), ignore_index=True)
     player_info = player_info[player_info['HEIGHT'] != '']
     player_info['HEIGHT'] = player_info['HEIGHT'].apply(lambda x: int(x.split('-')[0])*12 + int(x.split('-')[1])*1 if isinstance(x, str) else x)
     player_info['BIRTHDATE'] = pd.to_datetime(player_info['BIRTHDATE']).dt.strftime('%Y-%m-%d')
     return player_info.rename(columns = {'PERSON_ID': 'PLAYER_ID', 'DISPLAY_FIRST_LAST':'PLAYER_NAME'})
 
-def update_data(date):
+def upsert_tables(supabase, tables):
+###   Upsert [(table, df)] in order; returns rows written per table
+    if ETL_LOADER != 'copy':
+        for table, df in tables:
+            if not df.empty:
+                supabase.table(table).upsert(df.to_dict(orient='records')).execute()
+        return {table: len(df) for table, df in tables}
+    # the whole batch commits together, so a failed chunk leaves nothing half-written
+    with lease_connection(timeout = 60) as conn:
+        return copy_upsert(conn, tables)
+
+def signal_player_change():
+###   Wake FuzzyCache in web workers on this host. Remote workers hear the
+###   players_changed NOTIFY sent by the trigger in sql/player_changes.sql instead.
+    path = os.getenv('PLAYER_SIGNAL_FILE')
+    if path:
+        with open(path, 'a'):
+            os.utime(path, None)
+
+def update_data(date, resume = False):
     warnings.filterwarnings("ignore")
     CUSTOM_HEADERS = {
     "Host":              "stats.nba.com",
@@ -197,24 +235,45 @@ def update_data(date):
     new_games['GAME_DATE'] = new_games['GAME_DATE'].apply(lambda d: d.isoformat() if pd.notnull(d) else None)
     float_cols = new_games.select_dtypes(include='float64').columns
     new_games[float_cols] = new_games[float_cols].astype(int)
-    dfp, dft = build_game_stats_tables(new_games)
+    game_rows = upsert_tables(supabase, [("games", new_games.rename(columns=str.lower))])["games"]
     playas = supabase.table('players').select('*').execute().data
-    playerids = [x['player_id'] for x in playas]
-    new_players = set(dfp.PLAYER_ID) - set(playerids)
-    if len(new_players) > 0:
-        new_players_df = build_players_table(new_players)
-        new_players_df['WEIGHT'] = new_players_df['WEIGHT'].fillna(200).astype(int)
-        dfp = dfp[dfp.PLAYER_ID.isin(list(set(new_players_df.PLAYER_ID) | set(playerids)))]
-        new_players_df.rename(columns=str.lower, inplace=True)
-        response2 = supabase.table("players").upsert(new_players_df.to_dict(orient='records')).execute()
-    else:
-        response2 = None
-    new_games.rename(columns=str.lower, inplace=True)
-    dfp.rename(columns=str.lower, inplace=True)
-    dft.rename(columns=str.lower, inplace=True)
-    response1 = supabase.table("games").upsert(new_games.to_dict(orient='records')).execute()
-    response3 = supabase.table("game_stats_player").upsert(dfp.to_dict(orient='records')).execute()
-    response4 = supabase.table("game_stats_team").upsert(dft.dropna().to_dict(orient='records')).execute()
-    return response1, response2, response3, response4
+    playerids = {x['player_id'] for x in playas}
+    # box scores are fetched, staged and upserted a chunk at a time (see backfill_checkpoint.py),
+    # so memory stays flat and a rerun with resume picks up after the last loaded chunk
+    checkpoint = open_checkpoint(date, resume)
+    new_player_count = player_rows = team_rows = 0
+    for dfp, dft in stream_game_stats_tables(new_games, checkpoint):
+        if dfp.empty:
+            continue
+        new_players = set(dfp.PLAYER_ID) - playerids
+        new_players_df = pd.DataFrame()
+        if len(new_players) > 0:
+            new_players_df = build_players_table(new_players)
+            new_players_df['WEIGHT'] = new_players_df['WEIGHT'].fillna(200).astype(int)
+            new_players_df.rename(columns=str.lower, inplace=True)
+        dfp = dfp[dfp.PLAYER_ID.isin(list(playerids | set(new_players_df.get('player_id', []))))]
+        dfp.rename(columns=str.lower, inplace=True)
+        dft.rename(columns=str.lower, inplace=True)
+        # new players go first: the stats rows reference them
+        written = upsert_tables(supabase, [("players", new_players_df), ("game_stats_player", dfp),
+                                           ("game_stats_team", dft.dropna())])
+        if not new_players_df.empty:
+            playerids |= set(new_players_df.player_id)
+            new_player_count += written["players"]
+            signal_player_change()
+        player_rows += written["game_stats_player"]
+        team_rows += written["game_stats_team"]
+    # recompute the season and rolling-window rows these games touch (sql/aggregates.sql),
+    # so reloaded games and stat corrections replace the old totals
+    try:
+        changed_games = [int(game_id) for game_id in new_games['GAME_ID']]
+        aggregated = supabase.rpc("apply_game_aggregates", {"changed_games": changed_games}).execute()
+        print(f"Aggregated {aggregated.data} games")
+    except Exception as e:
+        print(f"Error updating aggregate tables: {e}")
+    # cached answers were computed against the old box scores
+    invalidate_all()
+    print(f"nba_api response cache: {nba_responses.stats()}, scheduler: {nba_fetcher.stats()}")
+    return game_rows, new_player_count, player_rows, team_rows
 
 
@@ -4,9 +4,12 @@ import psycopg2
 from typing import Dict, List, Tuple, Any, Optional
 from decimal import Decimal
 from user_session import UserSession
+from example_library import ExampleLibrary
 import re
+import json
 import time as tm
 import os
+import threading
 
 schema = """
 teams (contains info on every NBA team):
@@ -97,9 +100,71 @@ game_stats_team (contains info on all team statistics from a given game):
 - reb_pct (FLOAT) - rebound percentage, advanced statistic
 - efg_pct (FLOAT) - effective field goal percentage, advanced statistic
 - pace (FLOAT) - pace
+
+player_season_stats (precomputed per-player totals and averages for each season and season type; prefer it over aggregating game_stats_player for full-season averages, totals and leaderboards):
+- player_id (INT, FK -> players.player_id)
+- season_id (INT) - same encoding as games.season_id
+- season_type (VARCHAR ENUM: Regular Season or Playoffs)
+- player_name (VARCHAR -> players.player_name)
+- games_played (INT) - games the player entered
+- min_total, pts_total, reb_total, oreb_total, ast_total, stl_total, blk_total, tov_total, fgm_total, fga_total, fg3m_total, fg3a_total, ftm_total, fta_total, plus_minus_total (INT) - season totals
+- mpg, ppg, rpg, apg, spg, bpg, tovpg (FLOAT) - per-game averages
+- fg_pct, fg3_pct, ft_pct (FLOAT) - shooting percentages, already multiplied by 100
+
+team_season_stats (precomputed per-team totals and averages for each season and season type):
+- team_id (INT, FK -> teams.team_id)
+- season_id (INT)
+- season_type (VARCHAR ENUM: Regular Season or Playoffs)
+- games_played, wins, losses (INT)
+- pts_total, opp_pts_total, reb_total, ast_total, stl_total, blk_total, tov_total, fgm_total, fga_total, fg3m_total, fg3a_total, ftm_total, fta_total (INT) - season totals
+- win_pct (FLOAT) - already multiplied by 100
+- ppg, opp_ppg, rpg, apg, spg, bpg, tovpg (FLOAT) - per-game averages
+- fg_pct, fg3_pct, ft_pct (FLOAT) - shooting percentages, already multiplied by 100
+
+player_rolling_stats (each player's averages over their own last 5, 10 and 20 games played, across seasons):
+- player_id (INT, FK -> players.player_id)
+- window_size (INT) - 5, 10 or 20
+- player_name (VARCHAR)
+- team_id (INT, FK -> teams.team_id) - team of the player's most recent game
+- games_played (INT) - games in the window (fewer than window_size for players with fewer games)
+- last_game_date (date)
+- mpg, ppg, rpg, apg, spg, bpg, tovpg (FLOAT)
+- fg_pct, fg3_pct, ft_pct (FLOAT) - already multiplied by 100
+
+team_rolling_stats (each team's results and averages over its last 5, 10 and 20 games):
+- team_id (INT, FK -> teams.team_id)
+- window_size (INT) - 5, 10 or 20
+- games_played, wins, losses (INT)
+- last_game_date (date)
+- ppg, opp_ppg, rpg, apg (FLOAT)
+- fg_pct, fg3_pct, ft_pct (FLOAT) - already multiplied by 100
 """
 
 PLAYER_AVERAGE_EXAMPLES = """
+Example User Query: Who were the top scorers in the 2024-25 regular season? Minimum 50 games.
+Example Output: SELECT pss.player_name AS "Player Name",
+       pss.games_played AS "Games Played",
+       pss.ppg AS "PPG",
+       pss.rpg AS "RPG",
+       pss.apg AS "APG",
+       pss.fg_pct AS "FG%"
+FROM player_season_stats pss
+WHERE pss.season_id = 22024 AND pss.season_type = 'Regular Season' AND pss.games_played >= 50
+ORDER BY pss.ppg DESC
+LIMIT 10;
+
+Example User Query: What has Anthony Edwards averaged over his last 10 games?
+Example Output: SELECT prs.player_name AS "Player Name",
+       prs.games_played AS "Games Played",
+       prs.last_game_date AS "Last Game",
+       prs.ppg AS "PPG",
+       prs.rpg AS "RPG",
+       prs.apg AS "APG",
+       prs.fg_pct AS "FG%",
+       prs.fg3_pct AS "3P%"
+FROM player_rolling_stats prs
+WHERE prs.player_name = 'Anthony Edwards' AND prs.window_size = 10;
+
 Example User Query: What did each Celtics player average over the last 20 games?
 Example Output: SELECT p.player_name AS "Player Name", 
        COUNT(*) AS "Games Played",
@@ -492,6 +557,33 @@ LIMIT 10;
 """
 
 TEAM_AVERAGES_EXAMPLES = """
+Example User Query: Which teams had the best records and point differentials in the 2024-25 regular season?
+Example Output: SELECT t.full_name AS "Team Name",
+       tss.games_played AS "Games Played",
+       tss.wins AS "W",
+       tss.losses AS "L",
+       tss.win_pct AS "WIN%",
+       tss.ppg AS "PPG",
+       tss.opp_ppg AS "OPP PPG",
+       (tss.ppg - tss.opp_ppg) AS "DIFF"
+FROM team_season_stats tss
+JOIN teams t ON tss.team_id = t.team_id
+WHERE tss.season_id = 22024 AND tss.season_type = 'Regular Season'
+ORDER BY tss.win_pct DESC
+LIMIT 10;
+
+Example User Query: How have the Knicks played over their last 5 games?
+Example Output: SELECT t.full_name AS "Team Name",
+       trs.games_played AS "Games Played",
+       trs.wins AS "W",
+       trs.losses AS "L",
+       trs.ppg AS "PPG",
+       trs.opp_ppg AS "OPP PPG",
+       trs.fg3_pct AS "3P%"
+FROM team_rolling_stats trs
+JOIN teams t ON trs.team_id = t.team_id
+WHERE t.full_name = 'New York Knicks' AND trs.window_size = 5;
+
 Example User Query: What is the average number of points scored and opponent points scored per game for each team in the 2024-25 playoffs?
 Example Output: SELECT
   t.full_name AS "Team Name",
@@ -596,7 +688,7 @@ Required fields:
 - Include any extra fields used for filtering or calculations.
 
 Global rules:
-1. Use full team names.
+1. Use full team names. When Team IDs are given, filter on those literal team_id values (e.g. gst.team_id = 1610612738) instead of (SELECT team_id FROM teams WHERE full_name = ...) subqueries; still join teams for displayed names.
 2. Cast divisions/percentages/averages to FLOAT; multiply percentages by 100.
 3. Season = season_id - 20000 (e.g. 22024 → 2024-25); assume calendar year if only year given.
 4. AGE calculated at game_date.
@@ -615,15 +707,99 @@ Opponent-specific filtering:
 
 Only output the SQL. No extra text.
 
-Examples: {examples}
-
 Schema: {schema}
+"""
+
+# per-request content (retrieved examples, breakdown, query) goes after the
+# static prefix so the provider's prompt cache can match everything before it
+SQL_REQUEST_TEMPLATE = """Examples: {examples}
+
+Team IDs: {teams}
 
 Query Breakdown: {bdq}
 
-User Query:
+User Query: {query}"""
+
+FUSED_PROMPT_TEMPLATE = """
+You turn NBA questions into PostgreSQL in a single step. First break the query down, then write the SQL for it.
+
+Breakdown rules:
+- Query type is one of: Single Game Player Performance, Single Game Team Performance, Multi-Game Player Performance, Multi-Game Team Performance, Player Information.
+    - Averages or aggregate statistics over a period of time are always multi-game queries.
+    - Questions that return performances from specific games are always single game queries.
+- In the breakdown text, put double dollar signs around the query type and triple asterisks around every player's full name (e.g. ***LeBron James***).
+- Return full team names (e.g. "Boston Celtics").
+- List key entities, filters/conditions, output variables and any calculation components as bullets.
+- The previous chat history is provided for context; if it is not relevant, do not alter the given query.
+
+SQL rules:
+{sql_rules}
+
+Return JSON with:
+- "query_type": the query type
+- "players": the full names of every player referenced, exactly as written in the breakdown and the SQL
+- "breakdown": the bullet breakdown
+- "sql": the SQL statement, or "I cannot answer" if the question can't be answered from the schema
+
+Examples by query type:
+{examples}
+
+Schema: {schema}
 """
 
+# generate the breakdown and SQL in a single completion (both pipelines)
+FUSED_SQL_MODE = os.getenv('FUSED_SQL_MODE', '0') == '1'
+
+FUSED_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "breakdown_and_sql",
+        "strict": True,
+        "schema": {
+            "type": "object",
+            "properties": {
+                "query_type": {"type": "string"},
+                "players": {"type": "array", "items": {"type": "string"}},
+                "breakdown": {"type": "string"},
+                "sql": {"type": "string"}
+            },
+            "required": ["query_type", "players", "breakdown", "sql"],
+            "additionalProperties": False
+        }
+    }
+}
+
+# table name -> its block of the schema text
+SCHEMA_TABLES = {block.split(" ", 1)[0]: block for block in schema.strip().split("\n\n")}
+
+# tables each query type needs; None is used when the breakdown has no type tag
+QUERY_TYPE_TABLES = {
+    "single game player performance": ["teams", "players", "games", "game_stats_player"],
+    "single game team performance": ["teams", "games", "game_stats_team"],
+    "multi-game player performance": ["teams", "players", "games", "game_stats_player", "player_season_stats", "player_rolling_stats"],
+    "multi-game team performance": ["teams", "games", "game_stats_team", "team_season_stats", "team_rolling_stats"],
+    "player information": ["teams", "players", "games", "game_stats_player", "player_season_stats"],
+    None: list(SCHEMA_TABLES),
+}
+
+# static system message for each query type, built once
+SQL_PROMPT_PREFIXES = {
+    querytype: "You are a SQL query generator for NBA statistics. " + SQL_PROMPT_TEMPLATE.format(
+        schema = "\n" + "\n\n".join(SCHEMA_TABLES[t] for t in tables) + "\n")
+    for querytype, tables in QUERY_TYPE_TABLES.items()
+}
+
+# few-shot examples are retrieved per request from this index
+example_library = ExampleLibrary({
+    "single game player performance": PLAYER_PERFORMANCE_EXAMPLES,
+    "single game team performance": TEAM_PERFORMANCE_EXAMPLES,
+    "multi-game player performance": PLAYER_AVERAGE_EXAMPLES,
+    "multi-game team performance": TEAM_AVERAGES_EXAMPLES,
+    "player information": PLAYER_INFORMATION_EXAMPLES,
+})
+EXAMPLE_COUNT = int(os.getenv('SQL_EXAMPLE_COUNT', 4))
+EXAMPLE_TOKEN_BUDGET = int(os.getenv('SQL_EXAMPLE_TOKEN_BUDGET', 1800))
+
 RESPONSE_TEMPLATE = """
     Analyze the following data table and provide a brief answer to the user's query.
     
@@ -650,6 +826,29 @@ ERROR_TEMPLATE = """
 
 _openai_client = None
 
+# prompt/completion/cached token counters per pipeline stage (and query type for SQL)
+usage_lock = threading.Lock()
+token_usage = {}
+
+def record_usage(label, usage):
+    if usage is None:
+        return
+    details = getattr(usage, "prompt_tokens_details", None)
+    cached_tokens = (getattr(details, "cached_tokens", 0) or 0) if details else 0
+    with usage_lock:
+        entry = token_usage.setdefault(label, {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "cached_tokens": 0})
+        entry["calls"] += 1
+        entry["prompt_tokens"] += usage.prompt_tokens
+        entry["completion_tokens"] += usage.completion_tokens
+        entry["cached_tokens"] += cached_tokens
+
+def get_token_usage():
+    with usage_lock:
+        return {label: {**entry,
+                        "avg_prompt_tokens": entry["prompt_tokens"] / entry["calls"],
+                        "cached_ratio": entry["cached_tokens"] / entry["prompt_tokens"] if entry["prompt_tokens"] else 0.0}
+                for label, entry in token_usage.items()}
+
 def get_openai_client():
     """Get or create an OpenAI client instance"""
     global _openai_client
@@ -657,7 +856,7 @@ def get_openai_client():
         _openai_client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
     return _openai_client
 
-def call_openai_with_retry(model, messages, max_tokens = 1000, temperature = 0.1, top_p = 0.95, retries=3, backoff=2):
+def call_openai_with_retry(model, messages, max_tokens = 1000, temperature = 0.1, top_p = 0.95, retries=3, backoff=2, **kwargs):
     client = get_openai_client()
     last_error = None
     
@@ -668,7 +867,8 @@ def call_openai_with_retry(model, messages, max_tokens = 1000, temperature = 0.1
                 messages=messages,
                 max_tokens=max_tokens,
                 temperature=temperature,
-                top_p=top_p
+                top_p=top_p,
+                **kwargs
             )
         except Exception as e:
             last_error = e
@@ -680,58 +880,83 @@ def call_openai_with_retry(model, messages, max_tokens = 1000, temperature = 0.1
     # Re-raise the last error
     raise last_error
 
-def break_down_query(query, user_session: UserSession):
-    chat_history = ""
-    if user_session.messages:
-        chat_history = "\n".join(user_session.messages[-4:])
+def call_openai_stream_with_retry(model, messages, max_tokens = 1000, temperature = 0.1, top_p = 0.95, retries=3, backoff=2, label=None):
+###   Same as call_openai_with_retry but yields content deltas as they arrive.
+###   Only opening the stream is retried; once tokens flow they go straight out.
+    client = get_openai_client()
+    last_error = None
+    stream = None
+
+    for attempt in range(retries):
+        try:
+            stream = client.chat.completions.create(
+                model=model,
+                messages=messages,
+                max_tokens=max_tokens,
+                temperature=temperature,
+                top_p=top_p,
+                stream=True,
+                stream_options={"include_usage": True}
+            )
+            break
+        except Exception as e:
+            last_error = e
+            if attempt < retries - 1:
+                tm.sleep(backoff ** attempt)
+
+    if stream is None:
+        raise last_error
+
+    for chunk in stream:
+        if chunk.choices and chunk.choices[0].delta.content:
+            yield chunk.choices[0].delta.content
+        # the final chunk carries usage and no choices
+        if label and getattr(chunk, "usage", None):
+            record_usage(label, chunk.usage)
+
+def build_breakdown_messages(query, user_session: UserSession):
+    # structured summaries of earlier turns, capped at CONTEXT_TOKEN_BUDGET
+    chat_history = user_session.context()
     prompt = QUERY_BREAKDOWN_TEMPLATE.format(chat_history = chat_history, query = query)
     print("Query Breakdown Prompt:", prompt)
-    messages = [
+    return [
         {"role": "system", "content": "You are an assistant that extracts essential components from NBA queries for SQL generation."},
         {"role": "user", "content": prompt},
     ]
 
+def break_down_query(query, user_session: UserSession):
     response = call_openai_with_retry(
         model="gpt-4o-mini",
-        messages=messages,
+        messages=build_breakdown_messages(query, user_session),
         max_tokens=400,
         temperature=0.2,
         top_p=0.95
     )
+    record_usage("breakdown", response.usage)
     querybreakdown = response.choices[0].message.content.strip()
     print("Query Breakdown:", querybreakdown)
     return querybreakdown
 
-def get_sql_query(query, querybreakdown):
+def get_query_type(querybreakdown):
     match = re.search(r"\$\$(.*?)\$\$", querybreakdown)
-    querytype = match.group(1).lower() if match else None
-
-    if querytype == "single game player performance":
-        examples = PLAYER_PERFORMANCE_EXAMPLES
-    elif querytype == "single game team performance":
-        examples = TEAM_PERFORMANCE_EXAMPLES
-    elif querytype == "multi-game player performance":
-        examples = PLAYER_AVERAGE_EXAMPLES
-    elif querytype == "multi-game team performance":
-        examples = TEAM_AVERAGES_EXAMPLES
-    elif querytype == "player information":
-        examples = PLAYER_INFORMATION_EXAMPLES
-    else:
-        examples = PLAYER_AVERAGE_EXAMPLES
-
-    messages = [
-        {"role": "system", "content": f"You are a SQL query generator for NBA statistics. {SQL_PROMPT_TEMPLATE.format(bdq = querybreakdown, schema = schema, examples = examples)}"},
-        {"role": "user", "content": query},
-    ]
+    querytype = match.group(1).strip().lower() if match else None
+    return querytype if querytype in SQL_PROMPT_PREFIXES else None
 
-    response = call_openai_with_retry(
-        model="gpt-4.1-mini",
-        messages = messages,
-        max_tokens=1000,
-        temperature=0.0,
-        top_p=0.7
-    )
+def format_team_ids(teams):
+    return ", ".join(f"{full_name} = {team_id}" for team_id, full_name in teams) or "none"
 
+def build_sql_messages(query, querybreakdown, teams=()):
+    querytype = get_query_type(querybreakdown)
+    examples = example_library.select(query, querybreakdown, querytype = querytype,
+                                      allowed_tables = QUERY_TYPE_TABLES[querytype],
+                                      k = EXAMPLE_COUNT, token_budget = EXAMPLE_TOKEN_BUDGET)
+    return [
+        {"role": "system", "content": SQL_PROMPT_PREFIXES[querytype]},
+        {"role": "user", "content": SQL_REQUEST_TEMPLATE.format(examples = examples, teams = format_team_ids(teams),
+                                                                 bdq = querybreakdown, query = query)},
+    ]
+
+def parse_sql_response(response):
     sqlquery = response.choices[0].message.content.strip()
     if sqlquery.lstrip().startswith("```sql"):
         # Remove the ```sql marker if present
@@ -744,6 +969,76 @@ def get_sql_query(query, querybreakdown):
         return None
     return sqlquery
 
+def get_sql_query(query, querybreakdown, teams=()):
+    response = call_openai_with_retry(
+        model="gpt-4.1-mini",
+        messages = build_sql_messages(query, querybreakdown, teams),
+        max_tokens=1000,
+        temperature=0.0,
+        top_p=0.7
+    )
+    record_usage(f"sql:{get_query_type(querybreakdown) or 'untyped'}", response.usage)
+    return parse_sql_response(response)
+
+def build_fused_messages(query, user_session: UserSession):
+    # structured summaries of earlier turns, capped at CONTEXT_TOKEN_BUDGET
+    chat_history = user_session.context()
+    # everything static sits in the system message so the provider can reuse its
+    # cached prefix; only the chat history and the query vary between calls
+    sql_rules = SQL_PROMPT_TEMPLATE.split("Schema:")[0]
+    examples = "\n".join([PLAYER_PERFORMANCE_EXAMPLES, TEAM_PERFORMANCE_EXAMPLES, PLAYER_AVERAGE_EXAMPLES,
+                          TEAM_AVERAGES_EXAMPLES, PLAYER_INFORMATION_EXAMPLES])
+    return [
+        {"role": "system", "content": FUSED_PROMPT_TEMPLATE.format(sql_rules = sql_rules, examples = examples, schema = schema)},
+        {"role": "user", "content": f"Chat history: {chat_history}\n\nQuery: {query}"},
+    ]
+
+def parse_fused_response(response):
+###   (breakdown, sql_query) from a fused completion, sql_query None if unanswerable
+    result = json.loads(response.choices[0].message.content)
+    querybreakdown = f"- Query type: $${result['query_type']}$$\n{result['breakdown'].strip()}"
+    # make sure every player is tagged so FuzzyCache sees them even if the model
+    # forgot the asterisks in the prose
+    for player in result['players']:
+        if f"***{player}***" not in querybreakdown:
+            querybreakdown += f"\n- Player: ***{player}***"
+    print("Query Breakdown:", querybreakdown)
+    sqlquery = result['sql'].strip()
+    print("SQL Query:", sqlquery)
+    if "I cannot answer" in sqlquery or "cannot be answered" in sqlquery:
+        return querybreakdown, None
+    return querybreakdown, sqlquery
+
+def get_breakdown_and_sql(query, user_session: UserSession):
+###   Fused mode: one structured-output completion returns both the breakdown
+###   and the SQL. Returns (breakdown, sql_query), sql_query None if unanswerable.
+    response = call_openai_with_retry(
+        model="gpt-4.1-mini",
+        messages=build_fused_messages(query, user_session),
+        max_tokens=1400,
+        temperature=0.0,
+        top_p=0.7,
+        response_format=FUSED_RESPONSE_FORMAT
+    )
+    record_usage("fused", response.usage)
+    return parse_fused_response(response)
+
+def apply_name_corrections(sqlquery, raw_breakdown, corrected_breakdown):
+###   Re-render only the SQL string literals whose player name FuzzyCache corrected
+    pattern = re.compile(r"\*\*\*(.*?)\*\*\*")
+    corrections = {raw: fixed for raw, fixed in zip(pattern.findall(raw_breakdown), pattern.findall(corrected_breakdown))
+                   if raw != fixed}
+    if not corrections or sqlquery is None:
+        return sqlquery
+
+    def _repl(match: re.Match) -> str:
+        value = match.group(1).replace("''", "'")
+        if value in corrections:
+            return "'" + corrections[value].replace("'", "''") + "'"
+        return match.group(0)
+
+    return re.sub(r"'((?:[^']|'')*)'", _repl, sqlquery)
+
 def format_table_data(columns: List[str], rows: List[Tuple]) -> str:
     """Format data as a nicely formatted table with proper column headers"""
     # Clean and format column names
@@ -782,36 +1077,53 @@ def format_table_data(columns: List[str], rows: List[Tuple]) -> str:
     
     return f"{header}\n{separator}\n" + "\n".join(formatted_rows)
 
-def get_response(query, columns, rows):
-    formatted_table = format_table_data(columns, rows)
-    print(formatted_table)
+def build_response_messages(query, columns, rows):
     raw_table = "| " + " | ".join(columns) + " |\n"
     raw_table += "| " + " | ".join(["---"] * len(columns)) + " |\n"
     for row in rows:
         raw_table += "| " + " | ".join(str(item) for item in row) + " |\n"
     
     prompt = RESPONSE_TEMPLATE.format(query = query, raw_table = raw_table)
+    return [
+        {"role": "system", "content": "You are a helpful assistant that explains data in a human-friendly way."},
+        {"role": "user", "content": prompt}
+    ]
+
+def get_response(query, columns, rows):
+    formatted_table = format_table_data(columns, rows)
+    print(formatted_table)
     response = call_openai_with_retry(
             model="gpt-4o",
-            messages=[
-                {"role": "system", "content": "You are a helpful assistant that explains data in a human-friendly way."},
-                {"role": "user", "content": prompt}
-            ],
+            messages=build_response_messages(query, columns, rows),
             max_tokens=1200
         )
+    record_usage("response", response.usage)
     llm_response = response.choices[0].message.content.strip()
     print(llm_response)
     return formatted_table, llm_response
 
-def get_error_response(query, error):
+def get_response_stream(query, columns, rows):
+###   Streaming counterpart of get_response; yields the summary as it is generated
+    return call_openai_stream_with_retry(
+        model="gpt-4o",
+        messages=build_response_messages(query, columns, rows),
+        max_tokens=1200,
+        label="response"
+    )
+
+def build_error_messages(query, error):
     prompt = ERROR_TEMPLATE.format(query=query, error=error)
+    return [
+        {"role": "system", "content": "You are a helpful assistant that explains database errors in simple terms."},
+        {"role": "user", "content": prompt}
+    ]
+
+def get_error_response(query, error):
     response = call_openai_with_retry(
         model="gpt-4o",
-        messages=[
-            {"role": "system", "content": "You are a helpful assistant that explains database errors in simple terms."},
-            {"role": "user", "content": prompt}
-        ],
+        messages=build_error_messages(query, error),
         max_tokens=300
     )
+    record_usage("error", response.usage)
     error_response = response.choices[0].message.content.strip()
-    return error_response
\ No newline at end of file
+    return error_response
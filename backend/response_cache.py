@@ -0,0 +1,106 @@
+import datetime
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time as tm
+import pandas as pd
+
+# On-disk cache of raw stats.nba.com responses for the ETL. Entries are keyed
+# by a hash of endpoint + parameters and stored as gzipped JSON, so reruns and
+# resumed backfills skip the network and the formatting code can be replayed
+# offline. Unlike the caches in cache.py this is not dropped by invalidate_all:
+# a finished game's box score never changes.
+
+RECENT_TTL = int(os.getenv('NBA_CACHE_RECENT_TTL', 3600))
+# games this many days old are final (late stat corrections land within a day or two)
+FINAL_AFTER_DAYS = int(os.getenv('NBA_CACHE_FINAL_AFTER_DAYS', 3))
+
+def response_key(endpoint, params):
+    return endpoint + "?" + "&".join(f"{k}={params[k]}" for k in sorted(params))
+
+def ttl_for_date(day):
+###   None (keep forever) once a date's games are final, RECENT_TTL before that
+    if day is None:
+        return RECENT_TTL
+    day = pd.Timestamp(day).date()
+    return None if day <= datetime.date.today() - datetime.timedelta(days=FINAL_AFTER_DAYS) else RECENT_TTL
+
+def ttl_for_season(season):
+###   Seasons like '2023-24' are final once the playoffs are over
+    end_year = int(season[:4]) + 1
+    return ttl_for_date(datetime.date(end_year, 7, 1))
+
+def payload_frames(payload):
+###   DataFrames in the order nba_api's get_data_frames() returns them
+    results = payload['resultSets'] if 'resultSets' in payload else payload['resultSet']
+    if isinstance(results, dict):
+        results = [results]
+    data_sets = {result['name']: result for result in results}
+    return [pd.DataFrame(result['rowSet'], columns=result['headers']) for result in data_sets.values()]
+
+class ResponseCache:
+    def __init__(self, directory, offline=False):
+        self.directory = directory
+        # offline: never hit the network, a miss is an error
+        self.offline = offline
+        self.hits = 0
+        self.misses = 0
+        self.write_errors = 0
+        self.lock = threading.Lock()
+
+    def path(self, key):
+        digest = hashlib.sha256(key.encode()).hexdigest()
+        return os.path.join(self.directory, digest[:2], digest + ".json.gz")
+
+    def get(self, key):
+        try:
+            with gzip.open(self.path(key), "rt") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            entry = None
+        # the key is stored too, so a hash collision reads as a miss
+        if entry is None or entry['key'] != key or (entry['expires'] is not None and entry['expires'] < tm.time()):
+            with self.lock:
+                self.misses += 1
+            return None
+        with self.lock:
+            self.hits += 1
+        return entry['payload']
+
+    def set(self, key, payload, ttl=None):
+###   Best effort: a cache that can't be written (read-only or full disk) must not fail the fetch
+        path = self.path(key)
+        entry = {'key': key, 'expires': tm.time() + ttl if ttl else None, 'payload': payload}
+        # write then rename, so a crash or a second worker never leaves half a file
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with gzip.open(tmp, "wt", compresslevel=6) as f:
+                json.dump(entry, f, separators=(",", ":"))
+            os.replace(tmp, path)
+        except OSError as e:
+            with self.lock:
+                self.write_errors += 1
+            print(f"Response cache write failed for {key}: {e}")
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+
+    def fetch(self, endpoint, params, fetch, ttl=None):
+###   Cached payload for endpoint + params, calling fetch() on a miss
+        key = response_key(endpoint, params)
+        payload = self.get(key)
+        if payload is None:
+            if self.offline:
+                raise LookupError(f"{key} is not cached and NBA_CACHE_OFFLINE is set")
+            payload = fetch()
+            self.set(key, payload, ttl)
+        return payload
+
+    def stats(self):
+        with self.lock:
+            return {"directory": self.directory, "hits": self.hits, "misses": self.misses,
+                    "write_errors": self.write_errors}
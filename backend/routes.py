@@ -1,109 +1,196 @@
-from flask import Blueprint, request, jsonify, session
+from flask import Blueprint, request, jsonify, session, Response, stream_with_context
 from flask_cors import CORS
-from db_connection import get_connection, release_connection, get_data_text
-from openai_response import break_down_query, get_response, get_sql_query, get_error_response
+from db_connection import get_data_text, pool_stats
+from openai_response import break_down_query, get_response, get_response_stream, get_sql_query, get_error_response, format_table_data
+from openai_response import get_breakdown_and_sql, apply_name_corrections, get_token_usage, FUSED_SQL_MODE
 import uuid
 from user_session import UserSession
-from fuzzy_cache import FuzzyCache
-import time as tm
-import threading
+from fuzzy_cache import FuzzyCache, NAME_PATTERN
+from team_resolver import TeamResolver
+from cache import create_cache, cache_stats
+from session_store import create_session_store
+from sql_templates import get_template_sql, get_template_stats
+import re
+import os
+import json
 
 fuzzy_cache = FuzzyCache()
+team_resolver = TeamResolver()
+# full-pipeline answers keyed on the normalized query and corrected breakdown,
+# dropped as a batch by the ETL (see helpers.update_data)
+answer_cache = create_cache('answers',
+                            max_entries=int(os.getenv('ANSWER_CACHE_SIZE', 512)),
+                            ttl=int(os.getenv('ANSWER_CACHE_TTL', 6 * 3600)))
 
 # create a Blueprint for the app
 bp = Blueprint('api', __name__)
 # wrap in CORS to allow cross-origin requests
 CORS(bp, resources={r"/api/*": {"origins": "*"}})
 
-active_sessions = {}
+# UserSession per browser session; memory, sqlite or redis (see session_store.py)
+session_store = create_session_store()
 
-def session_cleanup_thread():
-    while True:
-        tm.sleep(7200)  # Run every 2 hours
-        current_time = tm.time()
-        expired_sessions = []
-        
-        for session_id, user_session in active_sessions.items():
-            # Remove sessions inactive for more than 24 hours
-            if not user_session.chat_history or current_time - user_session.chat_history[-1]['timestamp'] > 86400:
-                expired_sessions.append(session_id)
-        
-        for session_id in expired_sessions:
-            del active_sessions[session_id]
+def answer_cache_key(query, breakdown):
+    normalized = re.sub(r"\s+", " ", query.lower()).strip().rstrip("?.!")
+    return f"{normalized}\n{breakdown.strip()}"
 
-# Start session cleanup thread
-cleanup_thread = threading.Thread(target=session_cleanup_thread, daemon=True)
-cleanup_thread.start()
-
-# register query function to handle posts at /api/query
-@bp.route('/api/query', methods=['POST'])
-def query():
-    # get the query from the request body
-    query = request.json['query']
-
-    # get or create session
+def get_user_session():
+    # get or create session; returns (session_id, user_session), and the caller
+    # puts the session back once the request has added its interaction
     session_id = session.get('session_id')
-    if not session_id or session_id not in active_sessions:
+    user_session = session_store.get(session_id) if session_id else None
+    if user_session is None:
         session_id = str(uuid.uuid4())
         session['session_id'] = session_id
-        active_sessions[session_id] = UserSession()
-    
-    user_session = active_sessions[session_id]
-    # get the breakdown of the query
-    breakdown = break_down_query(query, user_session)
-    breakdown = fuzzy_cache.correct_names(breakdown)
+        user_session = UserSession()
+    return session_id, user_session
+
+def run_query(query, user_session, stream=False):
+###   Run the query pipeline, yielding (event, data) as each stage finishes.
+###   The final event is always "done" with the response payload.
+    sql_query = None
+    fused = False
+    if FUSED_SQL_MODE:
+        # one completion for breakdown and SQL; the two-call path is the fallback
+        try:
+            raw_breakdown, sql_query = get_breakdown_and_sql(query, user_session)
+            fused = True
+        except Exception as e:
+            print(f"Fused breakdown/SQL failed, falling back: {e}")
+    if not fused:
+        # get the breakdown of the query
+        raw_breakdown = break_down_query(query, user_session)
+    breakdown = fuzzy_cache.correct_names(raw_breakdown)
     print("Updated Breakdown:", breakdown)
+    yield "breakdown", breakdown
+
+    cache_key = answer_cache_key(query, breakdown)
+    cached = answer_cache.get(cache_key)
+    if cached is not None:
+        user_session.add_interaction(query = query, breakdown = breakdown, sql_query = cached['sql_query'], data_table = cached['table'], response = cached['response'])
+        yield "done", {
+            "success": True,
+            "response": cached['response'],
+            "table": cached['table']
+        }
+        return
 
     # get the sql query
-    sql_query = get_sql_query(query, breakdown)
+    if fused:
+        # the SQL was written in the same completion as the breakdown, before any
+        # team could be resolved, so it looks teams up by full_name itself
+        sql_query = apply_name_corrections(sql_query, raw_breakdown, breakdown)
+    else:
+        # teams named in full resolve locally to team_ids, so the template and the
+        # SQL prompt can filter on the ids instead of looking teams up by name
+        teams = team_resolver.resolve(f"{query}\n{breakdown}", NAME_PATTERN.findall(breakdown))
+        # common question shapes have deterministic SQL; the LLM handles the rest
+        sql_query = get_template_sql(query, breakdown, fuzzy_cache.player_name_set, teams)
+        if sql_query is None:
+            sql_query = get_sql_query(query, breakdown, teams)
     
     # If the query generator couldn't create a valid SQL query
     if sql_query is None:
         error = "I couldn't understand your question. Could you please rephrase it or provide more specific details about the NBA statistics you're looking for?"
-        user_session.add_interaction(query = query, sql_query = sql_query, error = error)
-        return jsonify({
+        user_session.add_interaction(query = query, breakdown = breakdown, sql_query = sql_query, error = error)
+        yield "done", {
             "success": False,
             "response": error
-        })
+        }
+        return
+    yield "sql", sql_query
     
-    # connect to database
-    conn = get_connection()
+    # get the data text; the connection is leased only while the SQL runs, not
+    # through the summary calls below
+    columns, rows, truncated, error = get_data_text(sql_query)
     
-    try:
-        # get the data text
-        columns, rows, error = get_data_text(sql_query, conn)
-        
-        if error:
-            # Get a user-friendly error message
-            error_response = get_error_response(query, error)
-            user_session.add_interaction(query = query, sql_query = sql_query, error = error_response)
-            return jsonify({
-                "success": False,
-                "response": error_response
-            })
-        
-        # If no results were found but query executed successfully
-        if len(rows) == 0:
-            error_response = "No results found for your query. Try asking about different NBA players, teams, or time periods, or check your spelling of player names or teams."
-            user_session.add_interaction(query = query, sql_query = sql_query, data_table = "", error = error_response)
-            return jsonify({
-                "success": True,
-                "response": error_response,
-                "table": ""
-            })
-        
-        # get the response
-        formatted_table, llm_response = get_response(query, columns, rows)
-        user_session.add_interaction(query = query, sql_query = sql_query, data_table = formatted_table, response = llm_response)
-        return jsonify({
+    if error:
+        # Get a user-friendly error message
+        error_response = get_error_response(query, error)
+        user_session.add_interaction(query = query, breakdown = breakdown, sql_query = sql_query, error = error_response)
+        yield "done", {
+            "success": False,
+            "response": error_response
+        }
+        return
+    
+    # If no results were found but query executed successfully
+    if len(rows) == 0:
+        error_response = "No results found for your query. Try asking about different NBA players, teams, or time periods, or check your spelling of player names or teams."
+        user_session.add_interaction(query = query, breakdown = breakdown, sql_query = sql_query, data_table = "", error = error_response)
+        yield "done", {
             "success": True,
-            "response": llm_response,
-            "table": formatted_table
-        })
-    finally:
-        release_connection(conn)
+            "response": error_response,
+            "table": ""
+        }
+        return
+    
+    # get the response
+    if stream:
+        formatted_table = format_table_data(columns, rows)
+        yield "table", formatted_table
+        tokens = []
+        for token in get_response_stream(query, columns, rows):
+            tokens.append(token)
+            yield "token", token
+        llm_response = "".join(tokens).strip()
+    else:
+        formatted_table, llm_response = get_response(query, columns, rows)
+    user_session.add_interaction(query = query, breakdown = breakdown, sql_query = sql_query, data_table = formatted_table, response = llm_response)
+    answer_cache.set(cache_key, {'sql_query': sql_query, 'table': formatted_table, 'response': llm_response})
+    yield "done", {
+        "success": True,
+        "response": llm_response,
+        "table": formatted_table,
+        "truncated": truncated
+    }
+
+# register query function to handle posts at /api/query
+@bp.route('/api/query', methods=['POST'])
+def query():
+    # get the query from the request body
+    query = request.json['query']
+    session_id, user_session = get_user_session()
+    for event, data in run_query(query, user_session):
+        if event == "done":
+            session_store.put(session_id, user_session)
+            return jsonify(data)
+
+def format_sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+# streaming variant of /api/query: pushes each stage as a Server-Sent Event,
+# then the summary token by token
+@bp.route('/api/query/stream', methods=['POST'])
+def query_stream():
+    query = request.json['query']
+    # the session cookie is written with the response headers, so resolve it
+    # before the stream starts
+    session_id, user_session = get_user_session()
+
+    def generate():
+        try:
+            for event, data in run_query(query, user_session, stream=True):
+                yield format_sse(event, data)
+        except Exception as e:
+            print(f"Error streaming query: {e}")
+            yield format_sse("done", {"success": False, "response": "Something went wrong while answering your question. Please try again."})
+        finally:
+            session_store.put(session_id, user_session)
+
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
 # GET endpoint to verify health of service
 @bp.route('/api/health', methods=['GET'])
 def health():
-    return jsonify({"status": "OK"})
\ No newline at end of file
+    return jsonify({"status": "OK"})
+
+# GET endpoint exposing cache and template hit/miss counters and connection pool gauges
+@bp.route('/api/stats', methods=['GET'])
+def stats():
+    return jsonify({"caches": cache_stats(),
+                    "sql_templates": get_template_stats(),
+                    "token_usage": get_token_usage(),
+                    "pool": pool_stats(),
+                    "sessions": session_store.stats()})
\ No newline at end of file
@@ -0,0 +1,156 @@
+import os
+import pickle
+import sqlite3
+import threading
+import time as tm
+from collections import OrderedDict
+
+# Where UserSession objects live between requests. Every backend has the same
+# get/put/delete/stats interface; create_session_store picks one from
+# SESSION_BACKEND. memory is per process, sqlite is shared by every worker on
+# the host, redis by every host.
+
+SESSION_TTL = int(os.getenv('SESSION_TTL', 24 * 3600))
+SESSION_MAX = int(os.getenv('SESSION_MAX', 10000))
+
+class MemorySessionStore:
+###   In-process LRU. Entries are kept in last-access order, so expired sessions
+###   are always at the front and each call drops them in O(1) amortized time.
+    def __init__(self, max_sessions=SESSION_MAX, ttl=SESSION_TTL):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        # session_id -> (last_access, session)
+        self.sessions = OrderedDict()
+        self.lock = threading.Lock()
+        self.expired = 0
+        self.evicted = 0
+
+    def _expire(self, now):
+        while self.sessions:
+            last_access, _ = next(iter(self.sessions.values()))
+            if now - last_access <= self.ttl:
+                break
+            self.sessions.popitem(last=False)
+            self.expired += 1
+
+    def get(self, session_id):
+        now = tm.time()
+        with self.lock:
+            self._expire(now)
+            entry = self.sessions.get(session_id)
+            if entry is None:
+                return None
+            self.sessions[session_id] = (now, entry[1])
+            self.sessions.move_to_end(session_id)
+            return entry[1]
+
+    def put(self, session_id, user_session):
+        now = tm.time()
+        with self.lock:
+            self._expire(now)
+            self.sessions[session_id] = (now, user_session)
+            self.sessions.move_to_end(session_id)
+            while len(self.sessions) > self.max_sessions:
+                self.sessions.popitem(last=False)
+                self.evicted += 1
+
+    def delete(self, session_id):
+        with self.lock:
+            self.sessions.pop(session_id, None)
+
+    def stats(self):
+        with self.lock:
+            return {"backend": "memory",
+                    "sessions": len(self.sessions),
+                    "expired": self.expired,
+                    "evicted": self.evicted}
+
+class SqliteSessionStore:
+###   Sessions pickled into a SQLite file (WAL mode), shared by every worker on the host.
+###   Expired and over-cap rows are pruned through the updated_at index every prune_every puts.
+    def __init__(self, path, max_sessions=SESSION_MAX, ttl=SESSION_TTL, prune_every=500):
+        self.path = path
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.prune_every = prune_every
+        self.puts = 0
+        self.local = threading.local()
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("CREATE TABLE IF NOT EXISTS sessions (session_id TEXT PRIMARY KEY, data BLOB NOT NULL, updated_at REAL NOT NULL)")
+        conn.execute("CREATE INDEX IF NOT EXISTS sessions_updated_at ON sessions (updated_at)")
+        conn.commit()
+
+    def _conn(self):
+        # sqlite3 connections can't be shared between threads
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self.local.conn = conn
+        return conn
+
+    def get(self, session_id):
+        row = self._conn().execute("SELECT data FROM sessions WHERE session_id = ? AND updated_at > ?",
+                                   (session_id, tm.time() - self.ttl)).fetchone()
+        return pickle.loads(row[0]) if row else None
+
+    def put(self, session_id, user_session):
+        conn = self._conn()
+        conn.execute("INSERT OR REPLACE INTO sessions (session_id, data, updated_at) VALUES (?, ?, ?)",
+                     (session_id, pickle.dumps(user_session), tm.time()))
+        conn.commit()
+        self.puts += 1
+        if self.puts % self.prune_every == 0:
+            self.prune()
+
+    def prune(self):
+        conn = self._conn()
+        conn.execute("DELETE FROM sessions WHERE updated_at <= ?", (tm.time() - self.ttl,))
+        conn.execute("DELETE FROM sessions WHERE updated_at <= (SELECT updated_at FROM sessions "
+                     "ORDER BY updated_at DESC LIMIT 1 OFFSET ?)", (self.max_sessions,))
+        conn.commit()
+
+    def delete(self, session_id):
+        conn = self._conn()
+        conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+        conn.commit()
+
+    def stats(self):
+        count = self._conn().execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+        return {"backend": "sqlite", "sessions": count}
+
+class RedisSessionStore:
+###   Sessions pickled into a Redis-compatible server; Redis expires them itself
+    def __init__(self, url, ttl=SESSION_TTL):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("SESSION_BACKEND=redis requires the redis package")
+        self.ttl = ttl
+        self.client = redis.Redis.from_url(url)
+
+    def _key(self, session_id):
+        return f"nba_gpt:session:{session_id}"
+
+    def get(self, session_id):
+        raw = self.client.get(self._key(session_id))
+        return pickle.loads(raw) if raw is not None else None
+
+    def put(self, session_id, user_session):
+        self.client.set(self._key(session_id), pickle.dumps(user_session), ex=self.ttl)
+
+    def delete(self, session_id):
+        self.client.delete(self._key(session_id))
+
+    def stats(self):
+        return {"backend": "redis"}
+
+def create_session_store():
+###   Build the store selected by SESSION_BACKEND (memory, sqlite or redis)
+    backend = os.getenv('SESSION_BACKEND', 'memory').lower()
+    if backend == 'sqlite':
+        return SqliteSessionStore(os.getenv('SESSION_DB_PATH', 'sessions.db'))
+    if backend == 'redis':
+        return RedisSessionStore(os.getenv('REDIS_URL', 'redis://localhost:6379/0'))
+    return MemorySessionStore()
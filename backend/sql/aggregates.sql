@@ -0,0 +1,253 @@
+-- Precomputed season and rolling-window aggregates over game_stats_player,
+-- game_stats_team and games; per-game averages are generated columns.
+-- apply_game_aggregates() recomputes the season rows of every (player, season)
+-- and (team, season) that appeared in the games it is given, straight from the
+-- box scores, so re-upserted games and stat corrections replace the old totals
+-- instead of adding to them. Rolling tables are rebuilt for the same players
+-- and teams.
+--
+-- Apply with: psql "$DATABASE_URL" -f sql/aggregates.sql (safe to re-run).
+-- helpers.update_data calls apply_game_aggregates(<game ids it loaded>) after
+-- every upsert; finished games not aggregated yet are always included, so the
+-- first call fills the tables from every game already in the database. To
+-- rebuild everything after upgrading from the incremental version:
+--   SELECT apply_game_aggregates(ARRAY(SELECT game_id FROM games));
+-- Until this file is applied the season-averages SQL template stays off (see
+-- sql_templates.season_tables_ready) and those questions go to the LLM.
+
+CREATE TABLE IF NOT EXISTS aggregated_games (
+    game_id INT PRIMARY KEY,
+    aggregated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+CREATE TABLE IF NOT EXISTS player_season_stats (
+    player_id INT NOT NULL,
+    season_id INT NOT NULL,
+    season_type VARCHAR NOT NULL,
+    player_name VARCHAR,
+    games_played INT NOT NULL DEFAULT 0,
+    min_total INT NOT NULL DEFAULT 0,
+    pts_total INT NOT NULL DEFAULT 0,
+    reb_total INT NOT NULL DEFAULT 0,
+    oreb_total INT NOT NULL DEFAULT 0,
+    ast_total INT NOT NULL DEFAULT 0,
+    stl_total INT NOT NULL DEFAULT 0,
+    blk_total INT NOT NULL DEFAULT 0,
+    tov_total INT NOT NULL DEFAULT 0,
+    fgm_total INT NOT NULL DEFAULT 0,
+    fga_total INT NOT NULL DEFAULT 0,
+    fg3m_total INT NOT NULL DEFAULT 0,
+    fg3a_total INT NOT NULL DEFAULT 0,
+    ftm_total INT NOT NULL DEFAULT 0,
+    fta_total INT NOT NULL DEFAULT 0,
+    plus_minus_total INT NOT NULL DEFAULT 0,
+    mpg FLOAT GENERATED ALWAYS AS (min_total::FLOAT / NULLIF(games_played, 0)) STORED,
+    ppg FLOAT GENERATED ALWAYS AS (pts_total::FLOAT / NULLIF(games_played, 0)) STORED,
+    rpg FLOAT GENERATED ALWAYS AS (reb_total::FLOAT / NULLIF(games_played, 0)) STORED,
+    apg FLOAT GENERATED ALWAYS AS (ast_total::FLOAT / NULLIF(games_played, 0)) STORED,
+    spg FLOAT GENERATED ALWAYS AS (stl_total::FLOAT / NULLIF(games_played, 0)) STORED,
+    bpg FLOAT GENERATED ALWAYS AS (blk_total::FLOAT / NULLIF(games_played, 0)) STORED,
+    tovpg FLOAT GENERATED ALWAYS AS (tov_total::FLOAT / NULLIF(games_played, 0)) STORED,
+    fg_pct FLOAT GENERATED ALWAYS AS (fgm_total::FLOAT / NULLIF(fga_total, 0) * 100.0) STORED,
+    fg3_pct FLOAT GENERATED ALWAYS AS (fg3m_total::FLOAT / NULLIF(fg3a_total, 0) * 100.0) STORED,
+    ft_pct FLOAT GENERATED ALWAYS AS (ftm_total::FLOAT / NULLIF(fta_total, 0) * 100.0) STORED,
+    PRIMARY KEY (player_id, season_id, season_type)
+);
+
+CREATE TABLE IF NOT EXISTS team_season_stats (
+    team_id INT NOT NULL,
+    season_id INT NOT NULL,
+    season_type VARCHAR NOT NULL,
+    games_played INT NOT NULL DEFAULT 0,
+    wins INT NOT NULL DEFAULT 0,
+    losses INT NOT NULL DEFAULT 0,
+    pts_total INT NOT NULL DEFAULT 0,
+    opp_pts_total INT NOT NULL DEFAULT 0,
+    reb_total INT NOT NULL DEFAULT 0,
+    ast_total INT NOT NULL DEFAULT 0,
+    stl_total INT NOT NULL DEFAULT 0,
+    blk_total INT NOT NULL DEFAULT 0,
+    tov_total INT NOT NULL DEFAULT 0,
+    fgm_total INT NOT NULL DEFAULT 0,
+    fga_total INT NOT NULL DEFAULT 0,
+    fg3m_total INT NOT NULL DEFAULT 0,
+    fg3a_total INT NOT NULL DEFAULT 0,
+    ftm_total INT NOT NULL DEFAULT 0,
+    fta_total INT NOT NULL DEFAULT 0,
+    win_pct FLOAT GENERATED ALWAYS AS (wins::FLOAT / NULLIF(games_played, 0) * 100.0) STORED,
+    ppg FLOAT GENERATED ALWAYS AS (pts_total::FLOAT / NULLIF(games_played, 0)) STORED,
+    opp_ppg FLOAT GENERATED ALWAYS AS (opp_pts_total::FLOAT / NULLIF(games_played, 0)) STORED,
+    rpg FLOAT GENERATED ALWAYS AS (reb_total::FLOAT / NULLIF(games_played, 0)) STORED,
+    apg FLOAT GENERATED ALWAYS AS (ast_total::FLOAT / NULLIF(games_played, 0)) STORED,
+    spg FLOAT GENERATED ALWAYS AS (stl_total::FLOAT / NULLIF(games_played, 0)) STORED,
+    bpg FLOAT GENERATED ALWAYS AS (blk_total::FLOAT / NULLIF(games_played, 0)) STORED,
+    tovpg FLOAT GENERATED ALWAYS AS (tov_total::FLOAT / NULLIF(games_played, 0)) STORED,
+    fg_pct FLOAT GENERATED ALWAYS AS (fgm_total::FLOAT / NULLIF(fga_total, 0) * 100.0) STORED,
+    fg3_pct FLOAT GENERATED ALWAYS AS (fg3m_total::FLOAT / NULLIF(fg3a_total, 0) * 100.0) STORED,
+    ft_pct FLOAT GENERATED ALWAYS AS (ftm_total::FLOAT / NULLIF(fta_total, 0) * 100.0) STORED,
+    PRIMARY KEY (team_id, season_id, season_type)
+);
+
+CREATE TABLE IF NOT EXISTS player_rolling_stats (
+    player_id INT NOT NULL,
+    window_size INT NOT NULL,
+    player_name VARCHAR,
+    team_id INT,
+    games_played INT NOT NULL,
+    last_game_date DATE,
+    mpg FLOAT,
+    ppg FLOAT,
+    rpg FLOAT,
+    apg FLOAT,
+    spg FLOAT,
+    bpg FLOAT,
+    tovpg FLOAT,
+    fg_pct FLOAT,
+    fg3_pct FLOAT,
+    ft_pct FLOAT,
+    PRIMARY KEY (player_id, window_size)
+);
+
+CREATE TABLE IF NOT EXISTS team_rolling_stats (
+    team_id INT NOT NULL,
+    window_size INT NOT NULL,
+    games_played INT NOT NULL,
+    wins INT NOT NULL,
+    losses INT NOT NULL,
+    last_game_date DATE,
+    ppg FLOAT,
+    opp_ppg FLOAT,
+    rpg FLOAT,
+    apg FLOAT,
+    fg_pct FLOAT,
+    fg3_pct FLOAT,
+    ft_pct FLOAT,
+    PRIMARY KEY (team_id, window_size)
+);
+
+CREATE INDEX IF NOT EXISTS player_season_stats_season_idx ON player_season_stats (season_id, season_type);
+CREATE INDEX IF NOT EXISTS team_season_stats_season_idx ON team_season_stats (season_id, season_type);
+CREATE INDEX IF NOT EXISTS player_rolling_stats_team_idx ON player_rolling_stats (team_id, window_size);
+
+-- the incremental version took no arguments; drop it so the RPC isn't ambiguous
+DROP FUNCTION IF EXISTS apply_game_aggregates();
+
+CREATE OR REPLACE FUNCTION apply_game_aggregates(changed_games INT[] DEFAULT '{}') RETURNS INT AS $$
+DECLARE
+    new_games INT[];
+BEGIN
+    -- finished games with box scores that were just (re)loaded or never aggregated
+    SELECT ARRAY_AGG(g.game_id) INTO new_games
+    FROM games g
+    WHERE g.game_date < CURRENT_DATE
+      AND EXISTS (SELECT 1 FROM game_stats_team gst WHERE gst.game_id = g.game_id)
+      AND (g.game_id = ANY(changed_games)
+           OR NOT EXISTS (SELECT 1 FROM aggregated_games a WHERE a.game_id = g.game_id));
+
+    IF new_games IS NULL THEN
+        RETURN 0;
+    END IF;
+
+    DROP TABLE IF EXISTS affected_player_seasons, affected_team_seasons;
+    CREATE TEMP TABLE affected_player_seasons ON COMMIT DROP AS
+    SELECT DISTINCT gsp.player_id, g.season_id, g.season_type
+    FROM game_stats_player gsp
+    JOIN games g ON gsp.game_id = g.game_id
+    WHERE gsp.game_id = ANY(new_games);
+
+    CREATE TEMP TABLE affected_team_seasons ON COMMIT DROP AS
+    SELECT DISTINCT gst.team_id, g.season_id, g.season_type
+    FROM game_stats_team gst
+    JOIN games g ON gst.game_id = g.game_id
+    WHERE gst.game_id = ANY(new_games);
+
+    -- recompute, never increment: a row is replaced by the sum over all its games
+    DELETE FROM player_season_stats pss
+    USING affected_player_seasons a
+    WHERE pss.player_id = a.player_id AND pss.season_id = a.season_id AND pss.season_type = a.season_type;
+
+    INSERT INTO player_season_stats (player_id, season_id, season_type, player_name, games_played,
+        min_total, pts_total, reb_total, oreb_total, ast_total, stl_total, blk_total, tov_total,
+        fgm_total, fga_total, fg3m_total, fg3a_total, ftm_total, fta_total, plus_minus_total)
+    SELECT gsp.player_id, g.season_id, g.season_type, MAX(gsp.player_name), COUNT(*),
+        SUM(gsp.min), SUM(gsp.pts), SUM(gsp.reb), SUM(gsp.oreb), SUM(gsp.ast), SUM(gsp.stl), SUM(gsp.blk), SUM(gsp.to),
+        SUM(gsp.fgm), SUM(gsp.fga), SUM(gsp.fg3m), SUM(gsp.fg3a), SUM(gsp.ftm), SUM(gsp.fta), SUM(gsp.plus_minus)
+    FROM game_stats_player gsp
+    JOIN games g ON gsp.game_id = g.game_id
+    JOIN affected_player_seasons a
+      ON a.player_id = gsp.player_id AND a.season_id = g.season_id AND a.season_type = g.season_type
+    WHERE gsp.entered_game = 1 AND g.game_date < CURRENT_DATE
+    GROUP BY gsp.player_id, g.season_id, g.season_type;
+
+    DELETE FROM team_season_stats tss
+    USING affected_team_seasons a
+    WHERE tss.team_id = a.team_id AND tss.season_id = a.season_id AND tss.season_type = a.season_type;
+
+    INSERT INTO team_season_stats (team_id, season_id, season_type, games_played, wins, losses,
+        pts_total, opp_pts_total, reb_total, ast_total, stl_total, blk_total, tov_total,
+        fgm_total, fga_total, fg3m_total, fg3a_total, ftm_total, fta_total)
+    SELECT gst.team_id, g.season_id, g.season_type, COUNT(*),
+        SUM(CASE WHEN (g.home_team = gst.team_id AND g.home_score > g.away_score) OR (g.away_team = gst.team_id AND g.away_score > g.home_score) THEN 1 ELSE 0 END),
+        SUM(CASE WHEN (g.home_team = gst.team_id AND g.home_score < g.away_score) OR (g.away_team = gst.team_id AND g.away_score < g.home_score) THEN 1 ELSE 0 END),
+        SUM(gst.pts), SUM(CASE WHEN g.home_team = gst.team_id THEN g.away_score ELSE g.home_score END),
+        SUM(gst.reb), SUM(gst.ast), SUM(gst.stl), SUM(gst.blk), SUM(gst.to),
+        SUM(gst.fgm), SUM(gst.fga), SUM(gst.fg3m), SUM(gst.fg3a), SUM(gst.ftm), SUM(gst.fta)
+    FROM game_stats_team gst
+    JOIN games g ON gst.game_id = g.game_id
+    JOIN affected_team_seasons a
+      ON a.team_id = gst.team_id AND a.season_id = g.season_id AND a.season_type = g.season_type
+    WHERE g.game_date < CURRENT_DATE
+    GROUP BY gst.team_id, g.season_id, g.season_type;
+
+    -- rolling windows: rebuild only the players and teams in those games
+    DELETE FROM player_rolling_stats
+    WHERE player_id IN (SELECT DISTINCT player_id FROM game_stats_player WHERE game_id = ANY(new_games));
+
+    INSERT INTO player_rolling_stats
+    SELECT r.player_id, w.window_size, MAX(r.player_name),
+        (ARRAY_AGG(r.team_id ORDER BY r.game_date DESC))[1], COUNT(*), MAX(r.game_date),
+        AVG(r.min), AVG(r.pts), AVG(r.reb), AVG(r.ast), AVG(r.stl), AVG(r.blk), AVG(r.to),
+        SUM(r.fgm)::FLOAT / NULLIF(SUM(r.fga), 0) * 100.0,
+        SUM(r.fg3m)::FLOAT / NULLIF(SUM(r.fg3a), 0) * 100.0,
+        SUM(r.ftm)::FLOAT / NULLIF(SUM(r.fta), 0) * 100.0
+    FROM (
+        SELECT gsp.*, g.game_date,
+               ROW_NUMBER() OVER (PARTITION BY gsp.player_id ORDER BY g.game_date DESC) AS rn
+        FROM game_stats_player gsp
+        JOIN games g ON gsp.game_id = g.game_id
+        WHERE gsp.entered_game = 1
+          AND gsp.player_id IN (SELECT DISTINCT player_id FROM game_stats_player WHERE game_id = ANY(new_games))
+    ) r
+    CROSS JOIN (VALUES (5), (10), (20)) AS w(window_size)
+    WHERE r.rn <= w.window_size
+    GROUP BY r.player_id, w.window_size;
+
+    DELETE FROM team_rolling_stats
+    WHERE team_id IN (SELECT DISTINCT team_id FROM game_stats_team WHERE game_id = ANY(new_games));
+
+    INSERT INTO team_rolling_stats
+    SELECT r.team_id, w.window_size, COUNT(*),
+        SUM(CASE WHEN r.pts > r.opp_pts THEN 1 ELSE 0 END),
+        SUM(CASE WHEN r.pts < r.opp_pts THEN 1 ELSE 0 END),
+        MAX(r.game_date),
+        AVG(r.pts), AVG(r.opp_pts), AVG(r.reb), AVG(r.ast),
+        SUM(r.fgm)::FLOAT / NULLIF(SUM(r.fga), 0) * 100.0,
+        SUM(r.fg3m)::FLOAT / NULLIF(SUM(r.fg3a), 0) * 100.0,
+        SUM(r.ftm)::FLOAT / NULLIF(SUM(r.fta), 0) * 100.0
+    FROM (
+        SELECT gst.team_id, gst.pts, gst.reb, gst.ast, gst.fgm, gst.fga, gst.fg3m, gst.fg3a, gst.ftm, gst.fta, g.game_date,
+               CASE WHEN g.home_team = gst.team_id THEN g.away_score ELSE g.home_score END AS opp_pts,
+               ROW_NUMBER() OVER (PARTITION BY gst.team_id ORDER BY g.game_date DESC) AS rn
+        FROM game_stats_team gst
+        JOIN games g ON gst.game_id = g.game_id
+        WHERE gst.team_id IN (SELECT DISTINCT team_id FROM game_stats_team WHERE game_id = ANY(new_games))
+    ) r
+    CROSS JOIN (VALUES (5), (10), (20)) AS w(window_size)
+    WHERE r.rn <= w.window_size
+    GROUP BY r.team_id, w.window_size;
+
+    INSERT INTO aggregated_games (game_id) SELECT UNNEST(new_games)
+    ON CONFLICT (game_id) DO UPDATE SET aggregated_at = now();
+    RETURN array_length(new_games, 1);
+END;
+$$ LANGUAGE plpgsql;
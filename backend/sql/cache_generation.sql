@@ -0,0 +1,14 @@
+-- Shared invalidation counter for the web workers' in-memory caches
+-- (CACHE_BACKEND=memory). The ETL runs in its own process, often on another
+-- host, so it can't clear the workers' caches directly: invalidate_all() bumps
+-- this generation instead, and every worker re-reads it at most every
+-- CACHE_GENERATION_CHECK seconds and drops its cached answers and result sets
+-- when it has moved. The redis backend keeps its own generation key.
+--
+-- Apply once with: psql "$DATABASE_URL" -f sql/cache_generation.sql
+
+CREATE TABLE IF NOT EXISTS cache_generation (
+    id INT PRIMARY KEY DEFAULT 1 CHECK (id = 1),
+    generation BIGINT NOT NULL DEFAULT 0
+);
+INSERT INTO cache_generation (id, generation) VALUES (1, 0) ON CONFLICT (id) DO NOTHING;
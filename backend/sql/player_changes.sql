@@ -0,0 +1,35 @@
+-- Change tracking for the players table, used by FuzzyCache to stay current
+-- without re-reading every name. updated_at is the incremental-refresh
+-- watermark; the statement-level trigger sends a NOTIFY on players_changed
+-- whenever the ETL (or anyone else) inserts or updates players, so listening
+-- web workers pick up new rookies within seconds.
+--
+-- Apply once with: psql "$DATABASE_URL" -f sql/player_changes.sql
+
+ALTER TABLE players ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ NOT NULL DEFAULT now();
+CREATE INDEX IF NOT EXISTS players_updated_at_idx ON players (updated_at);
+
+CREATE OR REPLACE FUNCTION touch_player_updated_at() RETURNS TRIGGER AS $$
+BEGIN
+    NEW.updated_at := now();
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS players_touch_updated_at ON players;
+CREATE TRIGGER players_touch_updated_at
+    BEFORE UPDATE ON players
+    FOR EACH ROW EXECUTE FUNCTION touch_player_updated_at();
+
+-- one notification per upsert statement, delivered when its transaction commits
+CREATE OR REPLACE FUNCTION notify_players_changed() RETURNS TRIGGER AS $$
+BEGIN
+    PERFORM pg_notify('players_changed', '');
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS players_notify_changed ON players;
+CREATE TRIGGER players_notify_changed
+    AFTER INSERT OR UPDATE ON players
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_players_changed();
@@ -0,0 +1,255 @@
+import datetime
+import re
+import threading
+import time
+from db_connection import lease_connection
+
+# Deterministic SQL for the most common question shapes, built from the same
+# patterns as the few-shot examples in openai_response. Anything that doesn't
+# clearly fit a template returns None and goes to the LLM. Teams arrive already
+# resolved to (team_id, full_name) by TeamResolver.
+
+# A template only fires when every word of the question is accounted for: the
+# players and teams it names, its seasons, and the filler words below. Any other
+# word ("rookie", "starter", "overtime", "scored 30", "second round") may be a
+# qualifier the template can't express, so the question goes to the LLM.
+WORD_PATTERN = re.compile(r"[a-z]+|\d+")
+SEASON_PHRASES = re.compile(
+    r"\b22(0[2-9]\d)\b|\b20\d\d\s*[-–/]\s*\d\d\b|\b20\d\d\b|\b(this|current) (season|year)\b|\b(last|previous) season\b"
+    r"|\bregular season\b|\bplayoffs?\b|\bpostseason\b")
+FILLER_WORDS = {
+    "a", "an", "the", "of", "in", "for", "during", "and", "s", "is", "are", "was", "were", "do", "does", "did",
+    "has", "have", "had", "what", "whats", "how", "show", "me", "give", "get", "list", "tell", "find", "pull", "up",
+    "about", "please", "can", "you", "i", "want", "to", "see", "he", "his", "him", "she", "her", "they", "their", "them"}
+BIO_WORDS = {
+    "tall", "old", "age", "height", "weight", "weigh", "weighs", "college", "school", "draft", "drafted", "pick",
+    "round", "year", "born", "birth", "birthday", "birthdate", "birthplace", "when", "where", "from", "country",
+    "position", "play", "plays", "go", "went", "bio"}
+AVERAGE_WORDS = {
+    "average", "averages", "averaged", "averaging", "avg", "ppg", "rpg", "apg", "per", "game", "stats", "statistics",
+    "numbers", "season", "seasons", "points", "rebounds", "assists", "steals", "blocks", "minutes", "turnovers"}
+GAME_LOG_WORDS = {
+    "against", "vs", "versus", "game", "games", "log", "logs", "performance", "performances", "stat", "stats",
+    "line", "lines", "box", "score", "scores", "season"}
+RECORD_WORDS = {"record", "against", "vs", "versus", "head", "season"}
+
+PLAYER_PATTERN = re.compile(r"\*\*\*(.*?)\*\*\*")
+QUERY_TYPE_PATTERN = re.compile(r"\$\$(.*?)\$\$")
+
+stats_lock = threading.Lock()
+template_stats = {"hits": 0, "misses": 0}
+# player_season_stats only exists once sql/aggregates.sql has been applied
+SEASON_TABLES_RETRY = 300
+season_tables_state = {"ready": False, "checked_at": 0.0}
+
+def sql_literal(value):
+    return "'" + str(value).replace("'", "''") + "'"
+
+def current_season_id(today=None):
+    today = today or datetime.date.today()
+    return today.year + 20000 if today.month >= 10 else today.year + 19999
+
+def parse_season_type(text):
+    if re.search(r"\bplayoffs?\b|\bpostseason\b", text):
+        return 'Playoffs'
+    if re.search(r"\bregular season\b", text):
+        return 'Regular Season'
+    return None
+
+def parse_seasons(text, season_type):
+###   Return the set of season_ids mentioned, or None if a year is ambiguous
+    seasons = set()
+    for match in re.finditer(r"\b22(0[2-9]\d)\b", text):
+        seasons.add(int(match.group(0)))
+    text = re.sub(r"\b22(0[2-9]\d)\b", " ", text)
+    for match in re.finditer(r"\b(20\d\d)\s*[-–/]\s*(\d\d)\b", text):
+        seasons.add(20000 + int(match.group(1)))
+    text = re.sub(r"\b(20\d\d)\s*[-–/]\s*(\d\d)\b", " ", text)
+    # the breakdown usually spells out relative seasons; only fall back to the date
+    if not seasons and re.search(r"\b(this|current) (season|year)\b", text):
+        seasons.add(current_season_id())
+    if not seasons and re.search(r"\b(last|previous) season\b", text):
+        seasons.add(current_season_id() - 1)
+    for match in re.finditer(r"\b(20\d\d)\b", text):
+        # "2024 playoffs" are the 2023-24 playoffs; a bare regular-season year is ambiguous
+        if season_type != 'Playoffs':
+            return None
+        seasons.add(20000 + int(match.group(1)) - 1)
+    return seasons
+
+def season_filters(seasons, season_type, alias="g"):
+    filters = []
+    if seasons:
+        filters.append(f"{alias}.season_id IN ({', '.join(str(s) for s in sorted(seasons))})")
+    if season_type:
+        filters.append(f"{alias}.season_type = {sql_literal(season_type)}")
+    return "".join(f"\nAND {f}" for f in filters)
+
+def player_averages_sql(players, seasons, season_type):
+    # season averages come straight from the precomputed player_season_stats table
+    return f"""SELECT p.player_name AS "Player Name",
+       (pss.season_id - 20000) AS "Season",
+       pss.season_type AS "Season Type",
+       pss.games_played AS "Games Played",
+       pss.ppg AS "PPG",
+       pss.rpg AS "RPG",
+       pss.apg AS "APG",
+       pss.mpg AS "MPG",
+       pss.spg AS "SPG",
+       pss.bpg AS "BPG",
+       pss.tovpg AS "TOV",
+       pss.fg3m_total::FLOAT / NULLIF(pss.games_played, 0) AS "3PM",
+       pss.fg_pct AS "FG%",
+       pss.fg3_pct AS "3P%",
+       pss.ft_pct AS "FT%"
+FROM player_season_stats pss
+JOIN players p ON pss.player_id = p.player_id
+WHERE p.player_name IN ({', '.join(sql_literal(p) for p in players)}){season_filters(seasons, season_type, alias="pss")}
+ORDER BY p.player_name, pss.season_id, pss.season_type;"""
+
+def player_game_log_sql(player, opponent, seasons, season_type, limit):
+    opponent_id, _ = opponent
+    return f"""SELECT p.player_name AS "Player Name",
+       g.game_date AS "Game Date",
+       home.full_name AS "Home Team",
+       g.home_score AS "Home Score",
+       away.full_name AS "Away Team",
+       g.away_score AS "Away Score",
+       gsp.min AS "MIN",
+       gsp.pts AS "PTS",
+       gsp.reb AS "REB",
+       gsp.ast AS "AST",
+       gsp.stl AS "STL",
+       gsp.blk AS "BLK"
+FROM game_stats_player gsp
+JOIN games g ON gsp.game_id = g.game_id
+JOIN players p ON gsp.player_id = p.player_id
+JOIN teams home ON g.home_team = home.team_id
+JOIN teams away ON g.away_team = away.team_id
+WHERE p.player_name = {sql_literal(player)} AND gsp.entered_game = 1
+AND (g.home_team = {opponent_id} OR g.away_team = {opponent_id})
+AND gsp.team_id != {opponent_id}{season_filters(seasons, season_type)}
+ORDER BY g.game_date DESC
+LIMIT {limit};"""
+
+def team_record_sql(team, opponent, seasons, season_type):
+    (team_id, _), (opponent_id, _) = team, opponent
+    return f"""SELECT t.full_name AS "Team Name",
+       opp.full_name AS "Opponent",
+       (g.season_id - 20000) AS "Season",
+       g.season_type AS "Season Type",
+       COUNT(*) AS "Games Played",
+       SUM(CASE WHEN (g.home_team = t.team_id AND g.home_score > g.away_score) OR (g.away_team = t.team_id AND g.away_score > g.home_score) THEN 1 ELSE 0 END) AS "Wins",
+       SUM(CASE WHEN (g.home_team = t.team_id AND g.home_score < g.away_score) OR (g.away_team = t.team_id AND g.away_score < g.home_score) THEN 1 ELSE 0 END) AS "Losses"
+FROM games g
+JOIN teams t ON t.team_id IN (g.home_team, g.away_team)
+JOIN teams opp ON opp.team_id IN (g.home_team, g.away_team) AND opp.team_id != t.team_id
+WHERE t.team_id = {team_id} AND opp.team_id = {opponent_id}{season_filters(seasons, season_type)}
+GROUP BY t.full_name, opp.full_name, g.season_id, g.season_type
+ORDER BY g.season_id, g.season_type;"""
+
+def player_bio_sql(players):
+    return f"""SELECT p.player_name AS "Player Name",
+       p.position AS "Position",
+       p.height AS "Height",
+       p.weight AS "Weight",
+       p.school AS "School",
+       p.country AS "Country",
+       p.birthdate AS "Birthdate",
+       DATE_PART('year', AGE(CURRENT_DATE, p.birthdate)) AS "AGE",
+       p.draft_year AS "Draft Year",
+       p.draft_round AS "Draft Round",
+       p.draft_number AS "Draft Pick"
+FROM players p
+WHERE p.player_name IN ({', '.join(sql_literal(p) for p in players)})
+ORDER BY p.player_name;"""
+
+def only_filler(question, players, teams, vocabulary):
+###   True when nothing is left of question but names, seasons and filler words
+    names = {word for name in [*players, *(full_name for _, full_name in teams)] for word in WORD_PATTERN.findall(name.lower())}
+    words = WORD_PATTERN.findall(SEASON_PHRASES.sub(" ", question))
+    return all(word in names or word in FILLER_WORDS or word in vocabulary for word in words)
+
+def season_tables_ready():
+###   Whether the precomputed season tables exist; rechecked every SEASON_TABLES_RETRY
+###   seconds until they do, so the averages template never queries a missing table
+    if season_tables_state["ready"] or time.time() - season_tables_state["checked_at"] < SEASON_TABLES_RETRY:
+        return season_tables_state["ready"]
+    season_tables_state["checked_at"] = time.time()
+    try:
+        with lease_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT to_regclass('player_season_stats') IS NOT NULL")
+            ready = cursor.fetchone()[0]
+            cursor.close()
+    except Exception as e:
+        print(f"Error checking for player_season_stats: {e}")
+        return False
+    if not ready:
+        print("player_season_stats is missing; apply sql/aggregates.sql to enable the season averages template")
+    season_tables_state["ready"] = ready
+    return ready
+
+def build_template_sql(query, breakdown, known_players, teams, season_tables=True):
+###   Recognize a common question shape and return its SQL, or None.
+###   teams are the [(team_id, full_name)] mentioned, in order of first mention;
+###   season_tables says whether player_season_stats can be queried.
+    match = QUERY_TYPE_PATTERN.search(breakdown)
+    querytype = match.group(1).lower() if match else None
+    text = f"{query}\n{breakdown}".lower()
+    question = query.lower()
+    players = list(dict.fromkeys(PLAYER_PATTERN.findall(breakdown)))
+    # only names FuzzyCache knows exactly are safe to put into SQL
+    if any(p not in known_players for p in players):
+        return None
+    season_type = parse_season_type(text)
+    seasons = parse_seasons(text, season_type)
+    if seasons is None:
+        return None
+
+    if querytype == "player information":
+        if players and not teams and re.search(r"\b(tall|old|age|height|weigh\w*|college|school|draft\w*|born|birth\w*|country|from|position|bio)\b", question) \
+                and only_filler(question, players, teams, BIO_WORDS):
+            return player_bio_sql(players)
+        return None
+
+    if querytype == "multi-game player performance":
+        if season_tables and players and not teams and re.search(r"\b(average\w*|avg|ppg|rpg|apg|per game|stats|statistics|numbers)\b", question) \
+                and only_filler(question, players, teams, AVERAGE_WORDS):
+            return player_averages_sql(players, seasons, season_type)
+        return None
+
+    if querytype == "single game player performance":
+        # "last N games against X" is still a plain game log
+        last_n = re.search(r"\blast (\d+) games?\b", question)
+        rest = question.replace(last_n.group(0), " ") if last_n else question
+        if len(players) == 1 and len(teams) == 1 and re.search(r"\b(against|vs\.?|versus)\b", question) \
+                and re.search(r"\b(games?|game log|performances?|stat lines?|box scores?)\b", question) \
+                and only_filler(rest, players, teams, GAME_LOG_WORDS):
+            limit = min(int(last_n.group(1)), 50) if last_n else 50
+            return player_game_log_sql(players[0], teams[0], seasons, season_type, limit)
+        return None
+
+    if querytype in ("multi-game team performance", "single game team performance"):
+        if not players and len(teams) == 2 and re.search(r"\brecord\b", question) \
+                and re.search(r"\b(against|vs\.?|versus)\b", question) \
+                and only_filler(question, players, teams, RECORD_WORDS):
+            # the first team named in the question is the subject
+            return team_record_sql(teams[0], teams[1], seasons, season_type)
+        return None
+
+    return None
+
+def get_template_sql(query, breakdown, known_players, teams):
+###   Template lookup with hit-rate accounting
+    sqlquery = build_template_sql(query, breakdown, known_players, teams, season_tables_ready())
+    with stats_lock:
+        template_stats["hits" if sqlquery else "misses"] += 1
+    if sqlquery:
+        print("Template SQL Query:", sqlquery)
+    return sqlquery
+
+def get_template_stats():
+    with stats_lock:
+        total = template_stats["hits"] + template_stats["misses"]
+        return {**template_stats, "hit_rate": template_stats["hits"] / total if total else 0.0}
@@ -0,0 +1,88 @@
+import re
+import json
+import sqlglot
+from sqlglot import exp
+from sqlglot.errors import SqlglotError
+from sqlglot.optimizer.normalize_identifiers import normalize_identifiers
+
+def _sort_conjunction(node):
+    # AND is commutative, so order the top-level predicates of each chain
+    if isinstance(node, exp.And) and not isinstance(node.parent, exp.And):
+        predicates = sorted(node.flatten(), key=lambda p: p.sql(dialect="postgres"))
+        return exp.and_(*predicates, copy=False)
+    return node
+
+def canonicalize_sql(query):
+###   Re-render SQL from its AST so whitespace, unquoted identifier casing and
+###   AND-predicate order don't produce different cache keys
+    try:
+        tree = sqlglot.parse_one(query, read="postgres")
+        tree = normalize_identifiers(tree, dialect="postgres")
+        tree = tree.transform(_sort_conjunction)
+        return tree.sql(dialect="postgres")
+    except SqlglotError:
+        # fall back to a whitespace-only normalization for SQL sqlglot can't parse
+        return re.sub(r"\s+", " ", query).strip().rstrip(";")
+
+def enforce_limit(query, max_limit):
+###   Inject a LIMIT on the outermost query, or tighten one above max_limit.
+###   Returns (query, action) where action describes the rewrite or is None.
+    try:
+        tree = sqlglot.parse_one(query, read="postgres")
+    except SqlglotError:
+        return query, None
+    if not isinstance(tree, (exp.Select, exp.Union)):
+        return query, None
+    limit = tree.args.get("limit")
+    if limit is None:
+        action = f"injected LIMIT {max_limit}"
+    else:
+        value = limit.expression
+        if isinstance(value, exp.Literal) and value.is_int and int(value.this) <= max_limit:
+            return query, None
+        action = f"tightened LIMIT {value.sql()} to {max_limit}"
+    return tree.limit(max_limit).sql(dialect="postgres"), action
+
+def max_plan_rows(node):
+###   Largest "Plan Rows" estimate in a plan tree
+    return max([node["Plan Rows"], *(max_plan_rows(child) for child in node.get("Plans", ()))])
+
+def parse_plan(plan):
+###   (total cost, largest row estimate of any node) of an EXPLAIN (FORMAT JSON) result.
+###   The top node's rows are capped by the LIMIT; a huge scan or join sits below it.
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    top = plan[0]["Plan"]
+    return top["Total Cost"], max_plan_rows(top)
+
+def judge_plan(query, cost, rows, max_cost, max_rows):
+###   Decide on an EXPLAINed query; returns (query, error)
+    if cost > max_cost:
+        print(f"SQL Guard: rejected plan with cost {cost:.0f} > {max_cost:.0f}")
+        return query, f"Query rejected: estimated cost {cost:.0f} exceeds the limit of {max_cost:.0f}"
+    if rows > max_rows:
+        print(f"SQL Guard: rejected plan with a node of {rows:.0f} estimated rows > {max_rows}")
+        return query, f"Query rejected: an intermediate result of {rows:.0f} estimated rows exceeds the limit of {max_rows}"
+    print(f"SQL Guard: accepted plan with cost {cost:.0f}, at most {rows:.0f} rows per node")
+    return query, None
+
+def bound_query(query, max_limit):
+    query, action = enforce_limit(query.strip().rstrip(";"), max_limit)
+    if action:
+        print(f"SQL Guard: {action}")
+    return query
+
+def guard_query(query, cursor, max_cost, max_rows, max_limit):
+###   Pre-execution check for LLM SQL: bound the result with a LIMIT, then
+###   reject plans the planner expects to be too expensive or too large.
+###   Returns (query, error); error is set when the query must not run.
+    query = bound_query(query, max_limit)
+    try:
+        cursor.execute("EXPLAIN (FORMAT JSON) " + query)
+        cost, rows = parse_plan(cursor.fetchone()[0])
+    except Exception as e:
+        # the planner error is the same one execution would raise, and the
+        # transaction is aborted now anyway
+        print(f"SQL Guard: EXPLAIN failed: {e}")
+        return query, str(e)
+    return judge_plan(query, cost, rows, max_cost, max_rows)
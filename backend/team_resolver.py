@@ -0,0 +1,92 @@
+import re
+import threading
+import time
+from db_connection import lease_connection
+
+# Other full names a team goes by (former names, common long forms). Bare
+# nicknames and cities are deliberately absent: "Magic Johnson", "the Heat on",
+# "Memphis alumni" and "Washington players" are not teams. The breakdown spells
+# teams out in full, so the full names are enough to resolve them.
+TEAM_ALIASES = {
+    'Brooklyn Nets': ['New Jersey Nets', 'NJ Nets'],
+    'Charlotte Hornets': ['Charlotte Bobcats'],
+    'Cleveland Cavaliers': ['Cleveland Cavs'],
+    'Dallas Mavericks': ['Dallas Mavs'],
+    'Golden State Warriors': ['GS Warriors'],
+    'LA Clippers': ['Los Angeles Clippers'],
+    'Los Angeles Lakers': ['LA Lakers'],
+    'Minnesota Timberwolves': ['Minnesota Wolves'],
+    'New Orleans Pelicans': ['New Orleans Hornets'],
+    'New York Knicks': ['NY Knicks'],
+    'Oklahoma City Thunder': ['OKC Thunder', 'Seattle SuperSonics'],
+    'Philadelphia 76ers': ['Philadelphia Sixers'],
+    'Sacramento Kings': ['Sac Kings'],
+}
+
+# abbreviations that are also stat columns in breakdowns ("MIN")
+ABBREVIATION_STOPLIST = {'MIN'}
+
+class TeamResolver:
+###   Resolves team mentions (full names, alternate full names and abbreviations)
+###   to (team_id, full_name) with one precompiled pattern per case mode.
+###   Loaded from the teams table on first use and retried after failures.
+    def __init__(self, retry_after: int = 60):
+        self.retry_after = retry_after
+        self.alias_pattern = None
+        self.abbreviation_pattern = None
+        self.aliases = {}
+        self.abbreviations = {}
+        self.last_attempt = 0
+        self.load_lock = threading.Lock()
+
+    def fetch_teams(self):
+        with lease_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT team_id, full_name, abbreviation FROM teams")
+            rows = cursor.fetchall()
+            cursor.close()
+            return rows
+
+    def load(self, rows):
+###   Compile the patterns for (team_id, full_name, abbreviation) rows
+        aliases = {}
+        for team_id, full_name, abbreviation in rows:
+            for alias in [full_name, *TEAM_ALIASES.get(full_name, [])]:
+                aliases[alias.lower()] = (team_id, full_name)
+        abbreviations = {abbreviation: (team_id, full_name) for team_id, full_name, abbreviation in rows
+                         if abbreviation and abbreviation not in ABBREVIATION_STOPLIST}
+
+        # longest first, so a name never loses to a shorter one inside it
+        alias_pattern = re.compile(r"(?<![\w-])(?:" + "|".join(re.escape(a) for a in sorted(aliases, key=len, reverse=True))
+                                   + r")(?![\w-])", re.IGNORECASE)
+        # abbreviations only match in capitals: "was", "den" and "sac" are words
+        abbreviation_pattern = re.compile(r"\b(?:" + "|".join(map(re.escape, abbreviations)) + r")\b")
+        self.aliases, self.abbreviations = aliases, abbreviations
+        self.abbreviation_pattern = abbreviation_pattern
+        # published last: ensure_loaded treats a compiled alias_pattern as ready
+        self.alias_pattern = alias_pattern
+
+    def ensure_loaded(self):
+        if self.alias_pattern is not None or time.time() - self.last_attempt < self.retry_after:
+            return self.alias_pattern is not None
+        with self.load_lock:
+            if self.alias_pattern is None:
+                self.last_attempt = time.time()
+                try:
+                    self.load(self.fetch_teams())
+                    print(f"TeamResolver loaded {len(self.aliases)} aliases")
+                except Exception as e:
+                    print(f"Error loading teams: {e}")
+        return self.alias_pattern is not None
+
+    def resolve(self, text, player_names=()):
+###   Teams mentioned in text as [(team_id, full_name)], in order of first mention.
+###   player_names are blanked out first so "Magic Johnson" isn't the Orlando Magic.
+        if not text or not self.ensure_loaded():
+            return []
+        for name in player_names:
+            text = re.sub(re.escape(name), lambda m: " " * len(m.group(0)), text, flags=re.IGNORECASE)
+        found = [(m.start(), self.aliases[m.group(0).lower()]) for m in self.alias_pattern.finditer(text)]
+        if self.abbreviations:
+            found += [(m.start(), self.abbreviations[m.group(0)]) for m in self.abbreviation_pattern.finditer(text)]
+        return list(dict.fromkeys(team for _, team in sorted(found)))
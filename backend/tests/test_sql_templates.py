@@ -0,0 +1,49 @@
+import pytest
+from sql_templates import build_template_sql
+
+KNOWN_PLAYERS = {"LeBron James", "Jayson Tatum"}
+CELTICS = (1610612738, "Boston Celtics")
+LAKERS = (1610612747, "Los Angeles Lakers")
+
+def breakdown(querytype, *players):
+    return f"- Query type: $${querytype}$$\n- Key entities: " + ", ".join(f"***{p}***" for p in players)
+
+# questions with a qualifier the templates can't express must go to the LLM
+QUALIFIED = [
+    ("What are LeBron James' stats in games he scored 30?", "Multi-Game Player Performance", []),
+    ("What were LeBron James' averages in his rookie season?", "Multi-Game Player Performance", []),
+    ("Jayson Tatum's averages in the second round of the 2024 playoffs", "Multi-Game Player Performance", []),
+    ("Jayson Tatum's stats in games 1-3 of the 2024 playoffs", "Multi-Game Player Performance", []),
+    ("LeBron James' averages in the 2024-25 season as a starter", "Multi-Game Player Performance", []),
+    ("LeBron James' stats in the 2024-25 season in overtime games", "Multi-Game Player Performance", []),
+    ("LeBron James' averages in wins this season", "Multi-Game Player Performance", []),
+    ("LeBron James' averages last year", "Multi-Game Player Performance", []),
+    ("Jayson Tatum's games against the Los Angeles Lakers in the 2024-25 season when he scored 30", "Single Game Player Performance", [LAKERS]),
+    ("Jayson Tatum's home games against the Los Angeles Lakers", "Single Game Player Performance", [LAKERS]),
+    ("Boston Celtics record against the Los Angeles Lakers since 2020", "Multi-Game Team Performance", [CELTICS, LAKERS]),
+    ("Boston Celtics record against the Los Angeles Lakers in one-possession games", "Multi-Game Team Performance", [CELTICS, LAKERS]),
+    ("How tall was LeBron James as a rookie?", "Player Information", []),
+]
+
+@pytest.mark.parametrize("query, querytype, teams", QUALIFIED)
+def test_qualified_questions_skip_templates(query, querytype, teams):
+    players = [p for p in KNOWN_PLAYERS if p in query]
+    assert build_template_sql(query, breakdown(querytype, *players), KNOWN_PLAYERS, teams) is None
+
+PLAIN = [
+    ("What are LeBron James' averages in the 2024-25 season?", "Multi-Game Player Performance", [], "player_season_stats"),
+    ("Show me Jayson Tatum's last 5 games against the Los Angeles Lakers", "Single Game Player Performance", [LAKERS], "LIMIT 5"),
+    ("What is the Boston Celtics record against the Los Angeles Lakers in the 2024 playoffs?", "Multi-Game Team Performance", [CELTICS, LAKERS], "Wins"),
+    ("How tall is LeBron James?", "Player Information", [], '"Height"'),
+]
+
+@pytest.mark.parametrize("query, querytype, teams, expected", PLAIN)
+def test_plain_questions_use_templates(query, querytype, teams, expected):
+    players = [p for p in KNOWN_PLAYERS if p in query]
+    sql = build_template_sql(query, breakdown(querytype, *players), KNOWN_PLAYERS, teams)
+    assert sql is not None and expected in sql
+
+def test_averages_template_waits_for_season_tables():
+    query = "What are LeBron James' averages in the 2024-25 season?"
+    bdq = breakdown("Multi-Game Player Performance", "LeBron James")
+    assert build_template_sql(query, bdq, KNOWN_PLAYERS, [], season_tables=False) is None
@@ -0,0 +1,46 @@
+import json
+from db_connection import fetch_bounded
+from sql_tools import bound_query, parse_plan, judge_plan
+
+def node(node_type, rows, cost, *children):
+    plan = {"Node Type": node_type, "Plan Rows": rows, "Total Cost": cost}
+    if children:
+        plan["Plans"] = list(children)
+    return plan
+
+# a LIMIT over a nested-loop join whose inner scans multiply out to 40M rows
+LIMITED_JOIN = [{"Plan": node("Limit", 200, 4000.0,
+                              node("Nested Loop", 40000000, 90000.0,
+                                   node("Seq Scan", 200000, 3500.0),
+                                   node("Materialize", 200, 5.0, node("Seq Scan", 200, 4.0))))}]
+
+def test_parse_plan_reads_the_largest_node():
+    assert parse_plan(json.dumps(LIMITED_JOIN)) == (4000.0, 40000000)
+
+def test_large_node_under_a_limit_is_rejected():
+    cost, rows = parse_plan(LIMITED_JOIN)
+    query, error = judge_plan("SELECT 1 LIMIT 200", cost, rows, max_cost=500000, max_rows=1000000)
+    assert error and "40000000" in error
+
+def test_small_plan_is_accepted():
+    plan = [{"Plan": node("Limit", 50, 120.0, node("Index Scan", 80, 118.0))}]
+    cost, rows = parse_plan(plan)
+    assert judge_plan("SELECT 1 LIMIT 50", cost, rows, max_cost=500000, max_rows=1000000) == ("SELECT 1 LIMIT 50", None)
+
+def test_expensive_plan_is_rejected():
+    plan = [{"Plan": node("Seq Scan", 10, 900000.0)}]
+    cost, rows = parse_plan(plan)
+    assert judge_plan("SELECT 1", cost, rows, max_cost=500000, max_rows=1000000)[1].startswith("Query rejected: estimated cost")
+
+def test_limit_leaves_room_to_detect_truncation():
+    class Cursor:
+        def __init__(self, rows):
+            self.rows = rows
+        def fetchmany(self, n):
+            batch, self.rows = self.rows[:n], self.rows[n:]
+            return batch
+
+    assert bound_query("SELECT * FROM games", 1001).endswith("LIMIT 1001")
+    # a LIMIT of cap + 1 returns cap + 1 rows only when the result was cut off
+    assert fetch_bounded(Cursor([(i,) for i in range(1001)]), 1000, 10 ** 6, 200) == ([(i,) for i in range(1000)], True)
+    assert fetch_bounded(Cursor([(i,) for i in range(1000)]), 1000, 10 ** 6, 200) == ([(i,) for i in range(1000)], False)
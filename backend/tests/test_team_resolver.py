@@ -0,0 +1,28 @@
+import pytest
+from team_resolver import TeamResolver
+
+TEAMS = [(1610612737, "Atlanta Hawks", "ATL"), (1610612747, "Los Angeles Lakers", "LAL"),
+         (1610612748, "Miami Heat", "MIA"), (1610612750, "Minnesota Timberwolves", "MIN"),
+         (1610612753, "Orlando Magic", "ORL"), (1610612763, "Memphis Grizzlies", "MEM"),
+         (1610612764, "Washington Wizards", "WAS")]
+
+@pytest.fixture
+def resolver():
+    resolver = TeamResolver()
+    resolver.load(TEAMS)
+    return resolver
+
+@pytest.mark.parametrize("text", [
+    "Which Duke players have played for Washington?",
+    "List all Washington players",
+    "How did Memphis alumni do this season?",
+    "Magic Johnson's career averages",
+    "Who turned the heat on in the fourth quarter?",
+    "Most MIN per game this season",
+])
+def test_cities_and_nicknames_do_not_resolve(resolver, text):
+    assert resolver.resolve(text) == []
+
+def test_full_names_and_abbreviations_resolve_in_order(resolver):
+    text = "Miami Heat record against the LA Lakers and ORL"
+    assert resolver.resolve(text) == [(1610612748, "Miami Heat"), (1610612747, "Los Angeles Lakers"), (1610612753, "Orlando Magic")]
@@ -0,0 +1,47 @@
+import pickle
+from collections import deque
+import pytest
+from benchmarks.session_memory import LegacyUserSession, profile, SAMPLE_EVERY, TURNS
+from user_session import UserSession, HISTORY_TURNS
+
+# once the history caps are full, memory and pickle size may not grow past
+# this fraction of the first sample for the rest of the conversation
+STEADY_TOLERANCE = 0.25
+
+def steady_state_growth(samples):
+###   Largest (memory, pickle size) growth over the first sample, as fractions
+    base_mem, base_pickle = samples[0]
+    return max(mem / base_mem for mem, _ in samples) - 1, max(size / base_pickle for _, size in samples) - 1
+
+@pytest.fixture(scope="module")
+def capped_samples():
+    return profile(UserSession)
+
+def test_session_memory_is_flat_over_a_long_conversation(capped_samples):
+    # the first sample (turn 100) is well past HISTORY_TURNS, so every cap is already full
+    assert len(capped_samples) == TURNS // SAMPLE_EVERY
+    mem_growth, pickle_growth = steady_state_growth(capped_samples)
+    assert mem_growth <= STEADY_TOLERANCE, f"session memory grew {mem_growth:.0%} between turn {SAMPLE_EVERY} and {TURNS}"
+    assert pickle_growth <= STEADY_TOLERANCE, f"pickled session grew {pickle_growth:.0%} between turn {SAMPLE_EVERY} and {TURNS}"
+
+def test_steady_state_check_catches_an_unbounded_session():
+    mem_growth, pickle_growth = steady_state_growth(profile(LegacyUserSession))
+    assert mem_growth > STEADY_TOLERANCE and pickle_growth > STEADY_TOLERANCE
+
+def test_history_is_capped():
+    user_session = UserSession()
+    for i in range(HISTORY_TURNS * 3):
+        user_session.add_interaction(f"question {i}", response = f"answer {i}")
+    assert len(user_session.chat_history) == HISTORY_TURNS
+    assert user_session.chat_history[0].query == f"question {HISTORY_TURNS * 2}"
+
+def test_sessions_pickled_with_a_dropped_slot_still_load():
+    user_session = UserSession()
+    user_session.add_interaction("question", response = "answer")
+    # the slot state an older UserSession pickled, 'messages' included
+    state = (None, {'chat_history': user_session.chat_history, 'messages': deque(['User: question']),
+                    'turn_summaries': user_session.turn_summaries, 'context_text': None})
+    restored = UserSession.__new__(UserSession)
+    restored.__setstate__(state)
+    assert restored.context() == user_session.context()
+    assert pickle.loads(pickle.dumps(restored)).context() == user_session.context()
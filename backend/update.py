@@ -18,16 +18,24 @@ def main():
         default=two_days_ago,
         help="Date for update in YYYY‑MM‑DD format (default: two days ago)"
     )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Checkpoint box-score chunks (in NBA_BACKFILL_DIR or the temp dir) and continue an earlier checkpointed run for the same date"
+    )
     args = parser.parse_args()
 
     SUPABASE_URL = os.getenv("SUPABASE_URL")
     SUPABASE_KEY = os.getenv("SUPABASE_KEY")
     if not SUPABASE_URL or not SUPABASE_KEY:
         raise RuntimeError("SUPABASE_URL and SUPABASE_KEY must be set in env")
+    # the opt-in COPY loader (ETL_LOADER=copy) writes over a direct Postgres connection
+    if os.getenv("ETL_LOADER", "rest") == "copy" and not (os.getenv("DATABASE_HOST") and os.getenv("DATABASE_PASSWORD")):
+        raise RuntimeError("DATABASE_HOST and DATABASE_PASSWORD must be set in env when ETL_LOADER=copy")
 
     # Update
     logging.info(f"[{datetime.datetime.now().isoformat()}] Starting update for {args.date}")
-    response = update_data(args.date)
+    response = update_data(args.date, resume=args.resume)
     logging.info(f"[{datetime.datetime.now().isoformat()}] Update complete: {response}")
 
 if __name__ == "__main__":
@@ -1,20 +1,75 @@
+import os
 import time as tm
+import zlib
+from collections import deque
+from conversation_context import summarize_turn, build_context
+
+# Per-session memory is bounded: the newest HISTORY_TURNS interactions are
+# kept, long text is clipped and big tables are zlib-compressed (or dropped
+# past TABLE_MAX_BYTES)
+HISTORY_TURNS = int(os.getenv('SESSION_HISTORY_TURNS', 20))
+TEXT_MAX_CHARS = int(os.getenv('SESSION_TEXT_MAX_CHARS', 4000))
+TABLE_COMPRESS_OVER = 512
+TABLE_MAX_BYTES = int(os.getenv('SESSION_TABLE_MAX_BYTES', 64 * 1024))
+
+def clip(text):
+    if text is None or len(text) <= TEXT_MAX_CHARS:
+        return text
+    return text[:TEXT_MAX_CHARS] + " …"
+
+class Interaction:
+    __slots__ = ('timestamp', 'query', 'sql_query', '_table', 'response', 'error')
+
+    def __init__(self, query, sql_query = None, data_table = None, response = None, error = None):
+        self.timestamp = tm.time()
+        self.query = clip(query)
+        self.sql_query = clip(sql_query)
+        self.response = clip(response)
+        self.error = clip(error)
+        self._table = None
+        if data_table and len(data_table) > TABLE_COMPRESS_OVER:
+            compressed = zlib.compress(data_table.encode(), 6)
+            # a table too big even compressed isn't worth keeping for a chat log
+            if len(compressed) <= TABLE_MAX_BYTES:
+                self._table = compressed
+        else:
+            self._table = data_table
+
+    @property
+    def data_table(self):
+        if isinstance(self._table, bytes):
+            return zlib.decompress(self._table).decode()
+        return self._table
+
+    def __getitem__(self, key):
+        # old dict-style access: interaction['response']
+        return getattr(self, key)
 
 class UserSession:
+    __slots__ = ('chat_history', 'turn_summaries', 'context_text')
+
     def __init__(self):
-        self.chat_history = []
-        self.messages = []
-
-    def add_interaction(self, query, sql_query = None, data_table = None, response = None, error = None):
-        self.chat_history.append({'timestamp': tm.time(),
-                                  'query': query,
-                                  'sql_query': sql_query,
-                                  'data_table': data_table,
-                                  'response': response,
-                                  'error': error})
-        self.messages.append(f'User: {query}')
-        if response:
-            self.messages.append(f'Assistant: {response}')
-        elif error:
-            self.messages.append(f'Assistant: {error}')
-    
\ No newline at end of file
+        self.chat_history = deque(maxlen = HISTORY_TURNS)
+        # one structured line per turn, computed when the turn is recorded
+        self.turn_summaries = deque(maxlen = HISTORY_TURNS)
+        # assembled prompt context, rebuilt only after a new turn
+        self.context_text = None
+
+    def add_interaction(self, query, sql_query = None, data_table = None, response = None, error = None, breakdown = None):
+        self.chat_history.append(Interaction(query, sql_query = sql_query, data_table = data_table,
+                                             response = response, error = error))
+        self.turn_summaries.append(summarize_turn(query, breakdown = breakdown, response = response, error = error))
+        self.context_text = None
+
+    def context(self):
+###   Token-budgeted summary of earlier turns for the breakdown prompt
+        if self.context_text is None:
+            self.context_text = build_context(list(self.turn_summaries))
+        return self.context_text
+
+    def __setstate__(self, state):
+        # sessions pickled before a slot was dropped (e.g. 'messages') still load
+        _, slots = state
+        for name, value in slots.items():
+            if name in self.__slots__:
+                setattr(self, name, value)